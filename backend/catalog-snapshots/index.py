@@ -0,0 +1,354 @@
+"""
+Публикация статических снимков публичных списков (products, news, videos) в бакет для чтения с CDN
+Записи функций products, content, reset-products и video-worker только помечают снимок устаревшим
+(stale_since, stale_version в catalog_snapshots); эта функция рендерит список, кладёт его в бакет
+как catalog/<name>.<хэш>.json и переключает манифест catalog/manifest.json
+Запуск: POST по расписанию (например, раз в минуту) с X-Admin-Secret или постоянный процесс python index.py
+"""
+import json
+import os
+import time
+import gzip
+import hashlib
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+# Снимок выкладывается, когда метка старше SNAPSHOT_DEBOUNCE секунд: серия записей - одна публикация
+SNAPSHOT_DEBOUNCE = float(os.environ.get('SNAPSHOT_DEBOUNCE', '5'))
+SNAPSHOT_POLL_INTERVAL = float(os.environ.get('SNAPSHOT_POLL_INTERVAL', '5'))
+SNAPSHOT_KEY_PREFIX = 'catalog/'
+SNAPSHOT_MANIFEST_KEY = 'catalog/manifest.json'
+SNAPSHOT_MANIFEST_MAX_AGE = int(os.environ.get('SNAPSHOT_MANIFEST_MAX_AGE', '10'))
+# Снимок адресуется хэшем содержимого и никогда не меняется; меняется только манифест-указатель
+SNAPSHOT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает вызовы в тёплом контейнере.
+# psycopg2 импортируется при создании пула: OPTIONS и отказы 403/405 обходятся без него
+psycopg2: Any = None
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    """Ленивое создание пула подключений к базе данных"""
+    global _db_pool, psycopg2
+    if _db_pool is None or _db_pool.closed:
+        import psycopg2.pool
+        import psycopg2.extensions
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ['DATABASE_URL'])
+        _db_last_used.clear()
+    return _db_pool
+
+def _is_connection_alive(conn) -> bool:
+    """Проверка соединения, простаивавшего дольше DB_POOL_PING_AFTER секунд"""
+    if conn.closed:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_db_connection():
+    """Получение живого подключения из пула, устаревшие сокеты переоткрываются"""
+    pool = get_db_pool()
+    for _ in range(DB_POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        if _is_connection_alive(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def release_db_connection(conn) -> None:
+    """Возврат подключения в пул; открытая транзакция откатывается"""
+    pool = get_db_pool()
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+
+# Клиент создаётся при первой публикации и переиспользуется тёплым контейнером
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    """Общий клиент S3 (S3_ENDPOINT_URL позволяет подменить хранилище локальным)"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+                _s3_client = boto3.client('s3',
+                    endpoint_url=S3_ENDPOINT_URL or None,
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+                    config=Config(
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                        connect_timeout=5,
+                        read_timeout=60,
+                        tcp_keepalive=True
+                    )
+                )
+    return _s3_client
+
+def cdn_url_for(key: str) -> str:
+    """Публичный CDN URL объекта в бакете"""
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+def log_event(entry: Dict[str, Any]) -> None:
+    """Структурированная строка лога (одна JSON-строка в stdout)"""
+    print(json.dumps(entry, ensure_ascii=False, default=str), flush=True)
+
+def _json_default(value: Any) -> Any:
+    """Типы psycopg2, которых нет в JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(data: Any) -> str:
+    """Компактный JSON без экранирования кириллицы: единая сериализация снимков и манифеста"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+def rows_to_dicts(description, rows: Iterable[Tuple], fields: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Строки курсора в словари по cursor.description; fields - колонка -> ключ в ответе"""
+    plan = [(index, fields[column.name]) for index, column in enumerate(description) if column.name in fields]
+    return [{key: row[index] for index, key in plan} for row in rows]
+
+# Колонки -> ключи ответа, как в функциях products и content
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price_text': 'price',
+    'price_num': 'priceNum',
+    'category': 'category',
+    'image_url': 'image',
+    'is_available': 'available'
+}
+NEWS_FIELDS = {column: column for column in ('id', 'title', 'content', 'image_url', 'created_at', 'updated_at', 'is_published')}
+VIDEO_FIELDS = {column: column for column in (
+    'id', 'title', 'description', 'video_url', 'thumbnail_url', 'created_at', 'updated_at', 'is_published',
+    'status', 'duration_seconds', 'width', 'height', 'hls_url'
+)}
+
+# Снимки тех же списков, что отдают GET / функции products и GET ?type=news, ?type=videos функции content
+SNAPSHOT_QUERIES = {
+    'products': (
+        f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products ORDER BY created_at DESC, id DESC",
+        PRODUCT_FIELDS
+    ),
+    'news': (
+        f"SELECT {', '.join(NEWS_FIELDS)} FROM news WHERE is_published = true ORDER BY created_at DESC, id DESC",
+        NEWS_FIELDS
+    ),
+    'videos': (
+        f"SELECT {', '.join(VIDEO_FIELDS)} FROM videos WHERE is_published = true ORDER BY created_at DESC, id DESC",
+        VIDEO_FIELDS
+    )
+}
+
+def render_snapshot(conn, name: str) -> Tuple[bytes, int]:
+    """Публичный список name в том виде, в каком его отдаёт GET; короткая транзакция только на чтение"""
+    query, fields = SNAPSHOT_QUERIES[name]
+    with conn.cursor() as cur:
+        cur.execute(query)
+        rows = cur.fetchall()
+        body = dumps(rows_to_dicts(cur.description, rows, fields)).encode('utf-8')
+    conn.commit()
+    return body, len(rows)
+
+def publish_snapshot(conn, snapshot: Dict[str, Any]) -> bool:
+    """
+    Выкладывает один снимок; False - содержимое не изменилось
+    Объект кладётся в бакет вне транзакции, затем короткая транзакция переключает указатель
+    и снимает метку, только если stale_version не изменилась (запись после чтения списка оставит её)
+    """
+    body, item_count = render_snapshot(conn, snapshot['name'])
+    key = f"{SNAPSHOT_KEY_PREFIX}{snapshot['name']}.{hashlib.sha256(body).hexdigest()[:16]}.json"
+    changed = key != snapshot['snapshot_key']
+    
+    s3 = get_s3_client()
+    if changed:
+        s3.put_object(
+            Bucket=S3_BUCKET,
+            Key=key,
+            Body=gzip.compress(body, compresslevel=6),
+            ContentType='application/json; charset=utf-8',
+            ContentEncoding='gzip',
+            CacheControl=SNAPSHOT_CACHE_CONTROL
+        )
+    with conn.cursor() as cur:
+        if changed:
+            cur.execute(
+                """UPDATE catalog_snapshots
+                   SET previous_key = snapshot_key, snapshot_key = %s, item_count = %s, size_bytes = %s,
+                       published_at = CURRENT_TIMESTAMP,
+                       stale_since = CASE WHEN stale_version = %s THEN NULL ELSE stale_since END
+                   WHERE name = %s""",
+                (key, item_count, len(body), snapshot['stale_version'], snapshot['name'])
+            )
+        else:
+            cur.execute(
+                "UPDATE catalog_snapshots SET stale_since = NULL WHERE name = %s AND stale_version = %s",
+                (snapshot['name'], snapshot['stale_version'])
+            )
+    conn.commit()
+    # Предыдущий снимок остаётся для клиентов со старым манифестом, более ранний удаляется
+    if changed and snapshot['previous_key'] and snapshot['previous_key'] != key:
+        s3.delete_object(Bucket=S3_BUCKET, Key=snapshot['previous_key'])
+    return changed
+
+def write_snapshot_manifest(conn) -> None:
+    """Манифест {name: {url, count, published_at}} по всем опубликованным снимкам"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT name, snapshot_key, item_count, published_at FROM catalog_snapshots WHERE snapshot_key IS NOT NULL ORDER BY name"
+        )
+        manifest = {
+            name: {'url': cdn_url_for(key), 'count': item_count, 'published_at': published_at.isoformat()}
+            for name, key, item_count, published_at in cur.fetchall()
+        }
+    conn.commit()
+    get_s3_client().put_object(
+        Bucket=S3_BUCKET,
+        Key=SNAPSHOT_MANIFEST_KEY,
+        Body=dumps(manifest).encode('utf-8'),
+        ContentType='application/json; charset=utf-8',
+        CacheControl=f'public, max-age={SNAPSHOT_MANIFEST_MAX_AGE}'
+    )
+
+def publish_stale_snapshots() -> List[str]:
+    """
+    Выкладывает снимки, помеченные устаревшими не меньше SNAPSHOT_DEBOUNCE секунд назад, и переключает манифест
+    Строки catalog_snapshots блокируются только на время коротких UPDATE: запросы S3 идут вне транзакций,
+    записи в products и content их не ждут. Публикует один процесс за раз (advisory-блокировка сессии)
+    При ошибке метка остаётся, снимок повторится при следующем запуске
+    Возвращает имена выложенных снимков
+    """
+    conn = get_db_connection()
+    changed: List[str] = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext('catalog-snapshots'))")
+            locked = cur.fetchone()[0]
+        conn.commit()
+        if not locked:
+            return []
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """SELECT name, stale_version, snapshot_key, previous_key FROM catalog_snapshots
+                       WHERE stale_since <= CURRENT_TIMESTAMP - %s * INTERVAL '1 second' ORDER BY name""",
+                    (SNAPSHOT_DEBOUNCE,)
+                )
+                columns = [column.name for column in cur.description]
+                snapshots = [dict(zip(columns, row)) for row in cur.fetchall() if row[0] in SNAPSHOT_QUERIES]
+            conn.commit()
+            
+            for snapshot in snapshots:
+                if publish_snapshot(conn, snapshot):
+                    changed.append(snapshot['name'])
+            # Манифест переписывается и без новых снимков: так его догоняет запуск после сбоя
+            if snapshots:
+                write_snapshot_manifest(conn)
+        except Exception as e:
+            conn.rollback()
+            log_event({'event': 'snapshot_failed', 'published': changed, 'error': str(e)})
+            # Указатели уже переключённых снимков зафиксированы: метка вернёт их следующему запуску вместе с манифестом
+            if changed:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "UPDATE catalog_snapshots SET stale_since = COALESCE(stale_since, CURRENT_TIMESTAMP) WHERE name = ANY(%s)",
+                        (changed,)
+                    )
+                conn.commit()
+            return []
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('catalog-snapshots'))")
+            conn.commit()
+    finally:
+        release_db_connection(conn)
+    
+    if changed:
+        log_event({'event': 'snapshot', 'snapshots': changed})
+    return changed
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Заголовок запроса без учёта регистра"""
+    headers = event.get('headers') or {}
+    lower_name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower_name:
+            return value
+    return None
+
+def json_response(status: int, data: Any) -> Dict[str, Any]:
+    """JSON-ответ с CORS"""
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(data, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Публикация устаревших снимков каталога
+    POST / - выложить снимки, помеченные записями устаревшими, и обновить манифест
+    Возвращает: {snapshots: [имена выложенных снимков]}
+    Требует заголовок X-Admin-Secret; вызывается по расписанию, например раз в минуту
+    Постоянный процесс без HTTP: python index.py (опрос раз в SNAPSHOT_POLL_INTERVAL секунд)
+    """
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Secret',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return json_response(405, {'error': 'Method not allowed'})
+    
+    expected_secret = os.environ.get('ADMIN_SECRET_KEY')
+    if not expected_secret or get_request_header(event, 'X-Admin-Secret') != expected_secret:
+        return json_response(403, {'error': 'Forbidden: Invalid admin secret'})
+    
+    return json_response(200, {'snapshots': publish_stale_snapshots()})
+
+if __name__ == '__main__':
+    while True:
+        publish_stale_snapshots()
+        time.sleep(SNAPSHOT_POLL_INTERVAL)
@@ -2,35 +2,1063 @@
 Единый API для управления контентом (новости и видео)
 Поддерживает: получение, создание, обновление, удаление новостей и видео
 """
+import io
 import json
+import re
 import os
-import psycopg2
-from typing import Dict, Any
+import time
+import hashlib
+import math
+import gzip
+import random
+import functools
+import contextvars
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Callable, Dict, Any, Iterable, List, Optional, Tuple
 import base64
-import uuid
-import boto3
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('EXPLAIN_SAMPLE_RATE', '0'))
+REQUEST_LOG_ENABLED = os.environ.get('REQUEST_LOG', 'true').lower() in ('true', '1')
+
+class RequestTimings:
+    """Время одного вызова по фазам: длительность, число операций, строки и байты"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, phase: str, elapsed: float, rows: int = 0, size: int = 0) -> None:
+        with self._lock:
+            stats = self.phases.setdefault(phase, {'ms': 0.0, 'count': 0, 'rows': 0, 'bytes': 0})
+            stats['ms'] += elapsed * 1000
+            stats['count'] += 1
+            stats['rows'] += max(rows, 0)
+            stats['bytes'] += size
+    
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+    
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        entries = [f'{phase};dur={stats["ms"]:.1f};desc="{stats["count"]}x"' for phase, stats in self.phases.items()]
+        entries.append(f'total;dur={self.elapsed_ms():.1f}')
+        return ', '.join(entries)
+
+_request_timings: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+
+@contextmanager
+def measure(phase: str):
+    """Замер фазы текущего вызова; в словарь можно записать rows и bytes. Вне вызова ничего не делает"""
+    sample = {'rows': 0, 'bytes': 0}
+    timings = _request_timings.get()
+    started = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - started, sample['rows'], sample['bytes'])
+
+def log_event(entry: Dict[str, Any]) -> None:
+    """Структурированная строка лога (одна JSON-строка в stdout)"""
+    print(json.dumps(entry, ensure_ascii=False, default=str), flush=True)
+
+def instrumented(function_name: str):
+    """Декоратор обработчика: Server-Timing в ответе и строка лога с фазами вызова"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            timings = RequestTimings()
+            token = _request_timings.set(timings)
+            try:
+                response = func(event, context)
+            finally:
+                _request_timings.reset(token)
+            response['headers'] = {
+                **(response.get('headers') or {}),
+                'Server-Timing': timings.server_timing(),
+                'Timing-Allow-Origin': '*'
+            }
+            if REQUEST_LOG_ENABLED:
+                log_event({
+                    'event': 'request',
+                    'function': function_name,
+                    'method': event.get('httpMethod'),
+                    'params': event.get('queryStringParameters') or {},
+                    'status': response.get('statusCode'),
+                    'duration_ms': round(timings.elapsed_ms(), 1),
+                    'response_bytes': len(response.get('body') or ''),
+                    'phases': {phase: {**stats, 'ms': round(stats['ms'], 1)} for phase, stats in timings.phases.items()}
+                })
+            return response
+        return wrapper
+    return decorator
+
+@functools.lru_cache(maxsize=None)
+def timed_cursor_class() -> type:
+    """Класс TimedCursor; собирается при создании пула, когда psycopg2 уже импортирован"""
+    
+    class TimedCursor(psycopg2.extensions.cursor):
+        """Курсор, который пишет время запросов в фазу db и логирует медленные запросы"""
+        
+        def execute(self, query, vars=None):
+            timings = _request_timings.get()
+            if timings is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            # Только успешный запрос: после ошибки транзакция прервана, и EXPLAIN заменил бы исходную ошибку своей
+            result = super().execute(query, vars)
+            elapsed = time.perf_counter() - started
+            timings.add('db', elapsed, rows=self.rowcount)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, query, vars, elapsed)
+            return result
+        
+        def copy_expert(self, sql, file, size=8192):
+            with measure('db') as sample:
+                result = super().copy_expert(sql, file, size)
+                sample['rows'] = self.rowcount
+            return result
+    
+    return TimedCursor
+
+def explain_analyze(conn, query, vars) -> Any:
+    """План с EXPLAIN (ANALYZE, BUFFERS); запрос повторяется в точке сохранения, ошибка не ломает транзакцию"""
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        try:
+            cur.execute('SAVEPOINT explain_sample')
+        except psycopg2.Error as e:
+            return {'error': str(e).strip()}
+        try:
+            cur.execute(b'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + cur.mogrify(query, vars))
+            plan = cur.fetchone()[0]
+        except psycopg2.Error as e:
+            cur.execute('ROLLBACK TO SAVEPOINT explain_sample')
+            return {'error': str(e).strip()}
+        cur.execute('RELEASE SAVEPOINT explain_sample')
+        return plan
+
+def log_slow_query(cur, query, vars, elapsed: float) -> None:
+    """Лог медленного запроса; SELECT с вероятностью EXPLAIN_SAMPLE_RATE дополняется планом выполнения"""
+    text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+    entry: Dict[str, Any] = {
+        'event': 'slow_query',
+        'duration_ms': round(elapsed * 1000, 1),
+        'rows': cur.rowcount,
+        'query': ' '.join(text.split())[:2000]
+    }
+    if (EXPLAIN_SAMPLE_RATE > 0 and random.random() < EXPLAIN_SAMPLE_RATE
+            and cur.name is None and entry['query'].upper().startswith('SELECT')):
+        entry['plan'] = explain_analyze(cur.connection, query, vars)
+    log_event(entry)
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает вызовы в тёплом контейнере,
+# DB_POOL_MIN_SIZE соединений остаются открытыми между вызовами.
+# psycopg2 импортируется при создании пула: OPTIONS, ответы из кэша и ошибки валидации обходятся без него
+psycopg2: Any = None
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    """Ленивое создание пула подключений к базе данных"""
+    global _db_pool, psycopg2
+    if _db_pool is None or _db_pool.closed:
+        import psycopg2.pool
+        import psycopg2.extensions
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(
+            DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ['DATABASE_URL'], cursor_factory=timed_cursor_class()
+        )
+        _db_last_used.clear()
+    return _db_pool
+
+def _is_connection_alive(conn) -> bool:
+    """Проверка соединения, простаивавшего дольше DB_POOL_PING_AFTER секунд"""
+    if conn.closed:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
-    """Создание подключения к базе данных"""
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    """Получение живого подключения из пула, устаревшие сокеты переоткрываются"""
+    with measure('db_connect'):
+        pool = get_db_pool()
+        for _ in range(DB_POOL_MAX_SIZE + 1):
+            conn = pool.getconn()
+            if _is_connection_alive(conn):
+                return conn
+            _db_last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def release_db_connection(conn) -> None:
+    """Возврат подключения в пул; открытая транзакция откатывается"""
+    pool = get_db_pool()
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '30'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256'))
+
+class ResponseCache:
+    """
+    LRU-кэш сериализованных ответов GET с ограниченным временем жизни
+    Живёт в тёплом контейнере и сбрасывается после записи в этом же контейнере,
+    остальные контейнеры видят изменения не позже чем через RESPONSE_CACHE_TTL секунд
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Tuple, Tuple[float, Dict[str, str], str]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple) -> Optional[Tuple[Dict[str, str], str]]:
+        """Возвращает (headers, body) или None, если записи нет или она устарела"""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+    
+    def set(self, key: Tuple, headers: Dict[str, str], body: str) -> None:
+        """Сохраняет ответ, вытесняя самые давно использованные записи"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(headers), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """Сбрасывает записи пространства имён (или весь кэш)"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики для подбора TTL и размера кэша"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+
+# По умолчанию no-cache: браузер и CDN хранят ответ, но перед каждым показом сверяют ETag (304 без тела),
+# поэтому запись сразу видна; max-age > 0 включается явно там, где допустима задержка
+CACHE_CONTROL_MAX_AGE = int(os.environ.get('CACHE_CONTROL_MAX_AGE', '0'))
+CACHE_CONTROL_STALE_WHILE_REVALIDATE = int(os.environ.get('CACHE_CONTROL_STALE_WHILE_REVALIDATE', '300'))
+
+def cache_control_header() -> str:
+    """Значение Cache-Control для публичных GET-ответов"""
+    if CACHE_CONTROL_MAX_AGE <= 0:
+        return 'no-cache'
+    return f'public, max-age={CACHE_CONTROL_MAX_AGE}, stale-while-revalidate={CACHE_CONTROL_STALE_WHILE_REVALIDATE}'
+
+def compute_etag(cache_key: Tuple, versions: Iterable[Tuple[Any, Any]]) -> str:
+    """Сильный ETag из запроса и версий строк (id, updated_at), без сериализации тела"""
+    digest = hashlib.sha256(repr(cache_key).encode('utf-8'))
+    for row_id, updated_at in versions:
+        digest.update(f"{row_id}:{updated_at.isoformat() if updated_at else ''};".encode('utf-8'))
+    return f'"{digest.hexdigest()[:32]}"'
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Заголовок запроса без учёта регистра"""
+    headers = event.get('headers') or {}
+    lower_name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower_name:
+            return value
+    return None
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Проверка If-None-Match (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+def _json_default(value: Any) -> Any:
+    """Типы psycopg2, которых нет в JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(data: Any) -> str:
+    """JSON без экранирования кириллицы, через orjson, если он установлен"""
+    with measure('serialize') as sample:
+        if orjson is not None:
+            body = orjson.dumps(data, default=_json_default).decode('utf-8')
+        else:
+            body = json.dumps(data, ensure_ascii=False, default=_json_default)
+        sample['bytes'] = len(body)
+    return body
+
+def rows_to_dicts(description, rows: Iterable[Tuple], fields: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Строки курсора в словари по cursor.description; fields - колонка -> ключ в ответе"""
+    plan = [(index, fields[column.name]) for index, column in enumerate(description) if column.name in fields]
+    return [{key: row[index] for index, key in plan} for row in rows]
+
+def choose_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br, если клиент его принимает и установлен brotli, иначе gzip; None - без сжатия"""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, weight = item.partition(';')
+        weight = weight.replace(' ', '')
+        if weight.startswith('q=') and not weight[2:].strip('0.'):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def build_response(status: int, body: str, headers: Dict[str, str], event: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Ответ функции; тело от COMPRESSION_MIN_SIZE символов сжимается по Accept-Encoding запроса"""
+    encoding = None
+    if event is not None and len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = choose_content_encoding(get_request_header(event, 'Accept-Encoding'))
+    if encoding is None:
+        return {'statusCode': status, 'headers': headers, 'body': body, 'isBase64Encoded': False}
+    
+    raw = body.encode('utf-8')
+    with measure('compress') as sample:
+        if encoding == 'br':
+            compressed = brotli.compress(raw, quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(raw, compresslevel=COMPRESSION_GZIP_LEVEL)
+        sample['bytes'] = len(compressed)
+    return {
+        'statusCode': status,
+        'headers': {**headers, 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def json_response(status: int, data: Any, event: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """JSON-ответ с CORS; event нужен, чтобы сжать тело"""
+    return build_response(status, dumps(data), {**JSON_HEADERS, **(headers or {})}, event)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    """Ответ с ошибкой {'error': message}"""
+    return json_response(status, {'error': message})
+
+def not_modified_response(headers: Dict[str, str]) -> Dict[str, Any]:
+    """304 с пустым телом и валидаторами исходного ответа"""
+    return build_response(304, '', {key: value for key, value in headers.items() if key != 'Content-Type'})
+
+def make_cache_key(namespace: str, params: Dict[str, str]) -> Tuple:
+    """Ключ кэша из нормализованных query-параметров"""
+    return (namespace, tuple(sorted((k, v) for k, v in params.items() if v)))
+
+def cached_response(cached: Tuple[Dict[str, str], str], event: Dict[str, Any]) -> Dict[str, Any]:
+    """Ответ из закэшированных заголовков и тела, 304 при совпадении ETag"""
+    headers, body = cached
+    if etag_matches(get_request_header(event, 'If-None-Match'), headers.get('ETag')):
+        return not_modified_response(headers)
+    return build_response(200, body, {**headers, 'X-Cache': 'HIT'}, event)
+
+def cache_stats_response() -> Dict[str, Any]:
+    """Ответ со счётчиками кэша (GET /?cache_stats=true)"""
+    return json_response(200, response_cache.stats(), headers={'Cache-Control': 'no-store'})
+
+VERSION_EPOCH = datetime(1970, 1, 1)
+
+def version_etag(row_id: Any, updated_at: Optional[datetime]) -> str:
+    """Сильный ETag версии строки: id и updated_at в микросекундах, его же ждём в If-Match"""
+    micros = (updated_at - VERSION_EPOCH) // timedelta(microseconds=1) if updated_at else 0
+    return f'"{row_id}.{micros:x}"'
+
+def row_etag(cur, row: Tuple) -> str:
+    """ETag версии для строки, у которой в выборке есть id и updated_at"""
+    columns = [column.name for column in cur.description]
+    return version_etag(row[columns.index('id')], row[columns.index('updated_at')])
+
+def version_headers(cur, row: Tuple) -> Dict[str, str]:
+    """Заголовки ответа на запись с ETag новой версии"""
+    return {'ETag': row_etag(cur, row), 'Access-Control-Expose-Headers': 'ETag'}
+
+def parse_if_match(event: Dict[str, Any], row_id: Any) -> Optional[List[datetime]]:
+    """
+    Версии updated_at из If-Match для условной записи; None - заголовка нет или он равен *
+    ValueError, если ни один ETag не относится к этой строке (ответ 412)
+    """
+    if_match = (get_request_header(event, 'If-Match') or '').strip()
+    if not if_match or if_match == '*':
+        return None
+    versions = []
+    for tag in if_match.split(','):
+        # Слабые ETag для If-Match не подходят (RFC 9110, сильное сравнение)
+        match = re.fullmatch(r'"(\d+)\.([0-9a-f]+)"', tag.strip())
+        if match and match.group(1) == str(row_id):
+            versions.append(VERSION_EPOCH + timedelta(microseconds=int(match.group(2), 16)))
+    if not versions:
+        raise ValueError('If-Match does not match the current version')
+    return versions
+
+def version_condition(versions: Optional[List[datetime]]) -> Tuple[str, List[Any]]:
+    """Условие WHERE для записи только поверх одной из ожидаемых версий"""
+    if versions is None:
+        return '', []
+    return " AND COALESCE(updated_at, TIMESTAMP 'epoch') = ANY(%s)", [versions]
+
+def missing_or_conflict(cur, table: str, row_id: Any, label: str) -> Dict[str, Any]:
+    """Условная запись не нашла строку: 404, если её нет, иначе 412 с текущим ETag"""
+    cur.execute(f"SELECT id, updated_at FROM {table} WHERE id = %s", (row_id,))
+    row = cur.fetchone()
+    if not row:
+        return error_response(404, f'{label} not found')
+    return precondition_failed_response(version_etag(row[0], row[1]))
+
+def precondition_failed_response(current_etag: Optional[str] = None) -> Dict[str, Any]:
+    """412: запись изменена другим запросом, клиент должен перечитать её"""
+    headers = {'ETag': current_etag, 'Access-Control-Expose-Headers': 'ETag'} if current_etag else None
+    return json_response(412, {'error': 'Precondition failed: the record was modified, reload it and retry'}, headers=headers)
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+VIDEO_UPLOAD_MAX_SIZE = int(os.environ.get('VIDEO_UPLOAD_MAX_SIZE', str(2 * 1024 * 1024 * 1024)))
+UPLOAD_URL_EXPIRES = int(os.environ.get('UPLOAD_URL_EXPIRES', '3600'))
+# Загруженные файлы ждут здесь фоновой обработки (backend/video-worker), затем переносятся в videos/<id>/
+VIDEO_INCOMING_PREFIX = 'videos/incoming/'
+
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '10'))
+
+# Клиент создаётся при первой загрузке и переиспользуется тёплым контейнером;
+# boto3 импортируется только на путях, которые работают с S3
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def _s3_before_call(params: Dict[str, Any], context: Dict[str, Any], **kwargs) -> None:
+    """Начало замера запроса к S3 (событие botocore before-call)"""
+    body = params.get('body')
+    if isinstance(body, io.BytesIO):
+        body = body.getbuffer()
+    context['timing_started'] = time.perf_counter()
+    context['timing_bytes'] = len(body) if isinstance(body, (bytes, bytearray, memoryview)) else 0
+
+def _s3_after_call(http_response, context: Dict[str, Any], **kwargs) -> None:
+    """Время и объём запроса к S3 в фазу s3 текущего вызова"""
+    timings = _request_timings.get()
+    started = context.get('timing_started')
+    if timings is None or started is None:
+        return
+    received = int(http_response.headers.get('Content-Length') or 0)
+    timings.add('s3', time.perf_counter() - started, size=context.get('timing_bytes', 0) + received)
+
+def get_s3_client():
+    """Общий клиент S3 (S3_ENDPOINT_URL позволяет подменить хранилище локальным)"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+                _s3_client = boto3.client('s3',
+                    endpoint_url=S3_ENDPOINT_URL or None,
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+                    config=Config(
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                        connect_timeout=5,
+                        read_timeout=60,
+                        tcp_keepalive=True
+                    )
+                )
+                _s3_client.meta.events.register('before-call.s3', _s3_before_call)
+                _s3_client.meta.events.register('after-call.s3', _s3_after_call)
+    return _s3_client
+
+def cdn_url_for(key: str) -> str:
+    """Публичный CDN URL объекта в бакете"""
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+def initiate_multipart_upload(s3, key: str, content_type: str, size: int) -> Dict[str, Any]:
+    """Открывает multipart-загрузку и подписывает URL для каждой части"""
+    part_count = max(1, math.ceil(size / UPLOAD_PART_SIZE))
+    upload = s3.create_multipart_upload(Bucket=S3_BUCKET, Key=key, ContentType=content_type)
+    upload_id = upload['UploadId']
+    parts = [{
+        'part_number': part_number,
+        'url': s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': S3_BUCKET, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=UPLOAD_URL_EXPIRES
+        )
+    } for part_number in range(1, part_count + 1)]
+    return {
+        'key': key,
+        'upload_id': upload_id,
+        'part_size': UPLOAD_PART_SIZE,
+        'parts': parts,
+        'url': cdn_url_for(key)
+    }
+
+def parse_completed_parts(raw_parts: Any) -> List[Dict[str, Any]]:
+    """Проверка списка частей [{part_number, etag}] от клиента"""
+    if not isinstance(raw_parts, list) or not raw_parts:
+        raise ValueError('parts must be a non-empty list of {part_number, etag}')
+    parts = []
+    for part in raw_parts:
+        if not isinstance(part, dict) or not part.get('etag') or not isinstance(part.get('part_number'), int):
+            raise ValueError('parts must be a non-empty list of {part_number, etag}')
+        parts.append({'PartNumber': part['part_number'], 'ETag': part['etag']})
+    return sorted(parts, key=lambda part: part['PartNumber'])
+
+def handle_video_upload(action: str, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Загрузка видео и превью напрямую в бакет частями, минуя функцию
+    initiate - body: {size, kind: video|thumbnail} -> {key, upload_id, part_size, parts: [{part_number, url}], url}
+    complete - body: {key, upload_id, parts: [{part_number, etag}]} -> {url, key}
+    abort - body: {key, upload_id}
+    Полученный key передаётся в POST /videos как video_key / thumbnail_key
+    """
+    if action == 'initiate':
+        size = body_data.get('size')
+        kind = body_data.get('kind', 'video')
+        if not isinstance(size, int) or size <= 0 or kind not in ('video', 'thumbnail'):
+            return error_response(400, 'size and kind (video or thumbnail) are required')
+        if size > VIDEO_UPLOAD_MAX_SIZE:
+            return error_response(413, f'File is too large, maximum is {VIDEO_UPLOAD_MAX_SIZE} bytes')
+        
+        import uuid
+        if kind == 'video':
+            key, content_type = f'{VIDEO_INCOMING_PREFIX}{uuid.uuid4()}.mp4', 'video/mp4'
+        else:
+            key, content_type = f'{VIDEO_INCOMING_PREFIX}{uuid.uuid4()}.jpg', 'image/jpeg'
+        return json_response(200, initiate_multipart_upload(get_s3_client(), key, content_type, size))
+    
+    key = body_data.get('key', '')
+    upload_id = body_data.get('upload_id', '')
+    if not isinstance(key, str) or not key.startswith('videos/') or not upload_id:
+        return error_response(400, 'key and upload_id are required')
+    
+    if action == 'complete':
+        try:
+            parts = parse_completed_parts(body_data.get('parts'))
+        except ValueError as e:
+            return error_response(400, str(e))
+        get_s3_client().complete_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        return json_response(200, {'url': cdn_url_for(key), 'key': key})
+    
+    if action == 'abort':
+        get_s3_client().abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+        return json_response(200, {'success': True})
+    
+    return error_response(400, 'Unknown upload action. Use initiate, complete or abort')
+
+def put_incoming_base64(data: str, ext: str, content_type: str) -> str:
+    """Устаревшая загрузка файла в base64 внутри JSON: объект кладётся во входящие как есть"""
+    import uuid
+    key = f'{VIDEO_INCOMING_PREFIX}{uuid.uuid4()}.{ext}'
+    get_s3_client().put_object(Bucket=S3_BUCKET, Key=key, Body=base64.b64decode(data), ContentType=content_type)
+    return key
+
+# Колонки news и videos отдаются под своими именами
+NEWS_FIELDS = {column: column for column in ('id', 'title', 'content', 'image_url', 'created_at', 'updated_at', 'is_published')}
+VIDEO_FIELDS = {column: column for column in (
+    'id', 'title', 'description', 'video_url', 'thumbnail_url', 'created_at', 'updated_at', 'is_published',
+    'status', 'duration_seconds', 'width', 'height', 'hls_url'
+)}
+VIDEO_COLUMNS = ', '.join(VIDEO_FIELDS)
+
+CONTENT_MAX_LIMIT = int(os.environ.get('CONTENT_MAX_LIMIT', '100'))
+CONTENT_SUMMARY_LENGTH = int(os.environ.get('CONTENT_SUMMARY_LENGTH', '280'))
+CONTENT_MAX_IDS = int(os.environ.get('CONTENT_MAX_IDS', '100'))
+# Дельта отдаёт изменения не моложе CONTENT_SYNC_LAG секунд по часам базы: updated_at и deleted_at - время начала
+# транзакции записи, и запись, которая зафиксируется позже, иначе легла бы позади уже выданного sync_token
+CONTENT_SYNC_LAG = float(os.environ.get('CONTENT_SYNC_LAG', '5'))
+# Диапазон INTEGER: id (SERIAL) и целые колонки
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+# Колонки курсора, версии и публикации читаются всегда, даже если их нет в fields=
+FEED_KEY_COLUMNS = ('id', 'created_at', 'updated_at', 'is_published')
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Непрозрачный курсор по ключу (время, id)"""
+    raw = json.dumps([timestamp.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбор курсора, ValueError при некорректном значении или id вне диапазона SERIAL"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+        timestamp, row_id = datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError, OverflowError) as e:
+        raise ValueError('Invalid cursor') from e
+    # id вне диапазона SERIAL не совпадёт ни с одной записью, а вне BIGINT сломал бы сравнение в SQL
+    if not 0 <= row_id <= INT_MAX:
+        raise ValueError('Invalid cursor')
+    return timestamp, row_id
+
+def parse_since_param(value: str) -> Tuple[datetime, int]:
+    """
+    updated_since: ISO-время или sync_token прошлого ответа, ValueError при некорректном значении
+    Время с часовым поясом приводится к UTC без пояса, как updated_at и deleted_at в базе
+    """
+    try:
+        since_at, since_id = datetime.fromisoformat(value), 0
+    except ValueError:
+        try:
+            since_at, since_id = decode_cursor(value)
+        except ValueError as e:
+            raise ValueError('Parameter updated_since must be an ISO timestamp or sync_token') from e
+    if since_at.tzinfo is not None:
+        since_at = since_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return since_at, since_id
+
+def parse_fields_param(value: Optional[str], fields: Dict[str, str]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    fields=id,title,image_url: (колонки SELECT, поля ответа); id отдаётся всегда
+    Без fields - все поля; ValueError для полей не из белого списка fields
+    """
+    if not value:
+        return list(fields), fields
+    requested = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in fields]
+    if unknown or not requested:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(fields)}")
+    output = {column: key for column, key in fields.items() if column == 'id' or column in requested}
+    return [column for column in fields if column in output or column in FEED_KEY_COLUMNS], output
+
+def parse_int_param(value: str, name: str) -> int:
+    """Разбор целочисленного query-параметра"""
+    try:
+        return int(value)
+    except ValueError as e:
+        raise ValueError(f'Parameter {name} must be an integer') from e
+
+def parse_id_param(value: str, name: str = 'id') -> int:
+    """id записи: целое в диапазоне SERIAL, иначе ValueError (ответ 400, а не ошибка SQL)"""
+    row_id = parse_int_param(value, name)
+    if not 0 < row_id <= INT_MAX:
+        raise ValueError(f'Parameter {name} must be between 1 and {INT_MAX}')
+    return row_id
+
+def parse_ids_param(value: str) -> List[int]:
+    """ids=3,1,2: id без повторов в порядке запроса, ValueError для некорректных id и больше CONTENT_MAX_IDS id"""
+    ids = list(dict.fromkeys(parse_id_param(raw.strip(), 'ids') for raw in value.split(',') if raw.strip()))
+    if not ids:
+        raise ValueError('Parameter ids must list at least one id')
+    if len(ids) > CONTENT_MAX_IDS:
+        raise ValueError(f'Parameter ids accepts at most {CONTENT_MAX_IDS} ids')
+    return ids
+
+def parse_feed_params(params: Dict[str, str], fields: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Параметры ленты: id, limit, cursor, summary, fields, ids и updated_since (ISO-время или sync_token прошлого ответа)
+    ValueError при некорректных значениях, чтобы ответить 400 до подключения к базе
+    """
+    columns, output = parse_fields_param(params.get('fields'), fields)
+    feed: Dict[str, Any] = {'id': None, 'limit': None, 'cursor': None, 'summary': False, 'since': None, 'ids': None,
+                            'columns': columns, 'output': output}
+    if params.get('id'):
+        feed['id'] = parse_id_param(params['id'])
+    if params.get('limit'):
+        feed['limit'] = parse_int_param(params['limit'], 'limit')
+        if feed['limit'] < 1 or feed['limit'] > CONTENT_MAX_LIMIT:
+            raise ValueError(f'Parameter limit must be between 1 and {CONTENT_MAX_LIMIT}')
+    if params.get('summary'):
+        if params['summary'].lower() not in ('true', '1', 'false', '0'):
+            raise ValueError('Parameter summary must be true or false')
+        feed['summary'] = params['summary'].lower() in ('true', '1')
+    if params.get('updated_since'):
+        feed['since'] = parse_since_param(params['updated_since'])
+    if params.get('cursor'):
+        if params.get('q', '').strip() or feed['since'] is not None:
+            raise ValueError('Parameter cursor cannot be combined with q or updated_since')
+        feed['cursor'] = decode_cursor(params['cursor'])
+        feed['limit'] = feed['limit'] or CONTENT_MAX_LIMIT
+    if params.get('ids'):
+        if params.get('q', '').strip() or feed['since'] is not None or feed['cursor'] is not None:
+            raise ValueError('Parameter ids cannot be combined with q, cursor or updated_since')
+        feed['ids'] = parse_ids_param(params['ids'])
+    return feed
+
+def feed_columns(feed: Dict[str, Any], body_column: str) -> str:
+    """Колонки ленты из fields=; в режиме summary текст записи обрезается до CONTENT_SUMMARY_LENGTH символов"""
+    return ', '.join(
+        f'left({column}, {CONTENT_SUMMARY_LENGTH}) AS {column}' if feed['summary'] and column == body_column else column
+        for column in feed['columns']
+    )
+
+def build_feed_query(table: str, body_column: str, feed: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    """
+    SELECT опубликованных записей от новых к старым; с limit - страница по курсору (created_at, id)
+    Условие created_at <= ... даёт диапазон по индексу (is_published, created_at DESC), id различает записи с одинаковым временем
+    """
+    sql = f"SELECT {feed_columns(feed, body_column)} FROM {table} WHERE is_published = true"
+    args: List[Any] = []
+    if feed['cursor'] is not None:
+        created_at, row_id = feed['cursor']
+        sql += " AND created_at <= %s AND (created_at, id) < (%s, %s)"
+        args.extend([created_at, created_at, row_id])
+    sql += " ORDER BY created_at DESC, id DESC"
+    if feed['limit'] is not None:
+        # Лишняя строка показывает, есть ли следующая страница
+        sql += " LIMIT %s"
+        args.append(feed['limit'] + 1)
+    return sql, args
+
+def load_feed(cur, table: str, body_column: str, feed: Dict[str, Any]) -> Tuple[List[Tuple], Optional[str]]:
+    """Страница ленты и курсор следующей страницы (None - страница последняя или limit не задан)"""
+    cur.execute(*build_feed_query(table, body_column, feed))
+    rows = cur.fetchall()
+    if feed['limit'] is None or len(rows) <= feed['limit']:
+        return rows, None
+    rows = rows[:feed['limit']]
+    created_index = feed['columns'].index('created_at')
+    return rows, encode_cursor(rows[-1][created_index], rows[-1][0])
+
+def load_by_ids(cur, table: str, body_column: str, feed: Dict[str, Any]) -> Tuple[List[Tuple], List[int]]:
+    """Записи по feed['ids'] одним запросом WHERE id = ANY(...): строки в порядке ids и id, которых нет в таблице"""
+    cur.execute(f"SELECT {feed_columns(feed, body_column)} FROM {table} WHERE id = ANY(%s)", (feed['ids'],))
+    found = {row[0]: row for row in cur.fetchall()}
+    return [found[row_id] for row_id in feed['ids'] if row_id in found], [row_id for row_id in feed['ids'] if row_id not in found]
 
+def load_changes(cur, table: str, content_type: str, body_column: str,
+                 feed: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Tuple[Any, Any]]]:
+    """
+    Дельта ленты после feed['since'] по индексам (updated_at, id) и (content_type, deleted_at):
+    items - изменённые опубликованные записи, removed - id снятых с публикации и удалённых,
+    sync_token - значение updated_since для следующего запроса, has_more - дельта отдана не целиком
+    Изменения и надгробия идут по одной шкале (время, id), в ответе не больше limit событий обоих видов
+    События моложе CONTENT_SYNC_LAG секунд придут в следующей дельте: транзакции записи короче этого окна
+    не зафиксируют updated_at позади выданного sync_token
+    """
+    since_at, since_id = feed['since']
+    limit = feed['limit'] or CONTENT_MAX_LIMIT
+    cur.execute(
+        f"""SELECT {feed_columns(feed, body_column)} FROM {table}
+            WHERE updated_at >= %s AND (updated_at, id) > (%s, %s)
+              AND updated_at < LOCALTIMESTAMP - make_interval(secs => %s)
+            ORDER BY updated_at, id LIMIT %s""",
+        (since_at, since_at, since_id, CONTENT_SYNC_LAG, limit + 1)
+    )
+    rows = cur.fetchall()
+    description = cur.description
+    updated_index = feed['columns'].index('updated_at')
+    published_index = feed['columns'].index('is_published')
+    
+    cur.execute(
+        """SELECT item_id, deleted_at FROM content_deletions
+           WHERE content_type = %s AND deleted_at >= %s AND (deleted_at, item_id) > (%s, %s)
+             AND deleted_at < LOCALTIMESTAMP - make_interval(secs => %s)
+           ORDER BY deleted_at, item_id LIMIT %s""",
+        (content_type, since_at, since_at, since_id, CONTENT_SYNC_LAG, limit + 1)
+    )
+    deletions = cur.fetchall()
+    
+    # Страница - первые limit событий общей шкалы, sync_token - ключ последнего из них
+    events = sorted(
+        [((row[updated_index], row[0]), row) for row in rows] +
+        [((deleted_at, item_id), None) for item_id, deleted_at in deletions],
+        key=lambda event: event[0]
+    )
+    has_more = len(events) > limit
+    events = events[:limit]
+    rows = [row for _, row in events if row is not None]
+    result = {
+        'items': rows_to_dicts(description, [row for row in rows if row[published_index]], feed['output']),
+        'removed': [key[1] for key, row in events if row is None or not row[published_index]],
+        'sync_token': encode_cursor(*(events[-1][0] if events else (since_at, since_id))),
+        'has_more': has_more
+    }
+    versions = [(row[0], updated_at) if row is not None else (f'deleted:{item_id}', updated_at)
+                for (updated_at, item_id), row in events]
+    return result, versions
+
+NEWS_PATCH_COLUMNS = {'title': 'required', 'content': 'required', 'image_url': 'optional', 'is_published': 'bool'}
+VIDEO_PATCH_COLUMNS = {
+    'title': 'required',
+    'description': 'optional',
+    'video_url': 'required',
+    'thumbnail_url': 'optional',
+    'is_published': 'bool'
+}
+# POST видео: источник - video_key из ?upload=complete, внешний video_url или устаревшие video_data/thumbnail_data
+VIDEO_POST_COLUMNS = {
+    **VIDEO_PATCH_COLUMNS,
+    'video_url': 'optional',
+    'video_key': 'optional',
+    'thumbnail_key': 'optional',
+    'video_data': 'optional',
+    'thumbnail_data': 'optional'
+}
+# Длины VARCHAR-колонок news и videos (V0001, V0002): длинная строка - 400, а не ошибка базы
+NEWS_COLUMN_LENGTHS = {'title': 500, 'image_url': 1000}
+VIDEO_COLUMN_LENGTHS = {'title': 500, 'video_url': 1000, 'thumbnail_url': 1000}
+
+def mark_snapshots_stale(cur, names: Iterable[str]) -> None:
+    """
+    Помечает снимки списков names устаревшими в транзакции записи; выкладывает их функция catalog-snapshots
+    Метка ставится последней перед commit: строка catalog_snapshots заблокирована только до фиксации
+    """
+    cur.execute(
+        """UPDATE catalog_snapshots
+           SET stale_since = COALESCE(stale_since, CURRENT_TIMESTAMP), stale_version = stale_version + 1
+           WHERE name = ANY(%s)""",
+        (list(names),)
+    )
+
+def commit_write(conn, namespace: str) -> None:
+    """Фиксация записи вместе с меткой устаревшего снимка списка и сброс кэша ответов контейнера"""
+    with conn.cursor() as cur:
+        mark_snapshots_stale(cur, (namespace,))
+    conn.commit()
+    response_cache.invalidate(namespace)
+
+def parse_patch(body_data: Any, columns: Dict[str, str], lengths: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Переданные в теле PATCH поля, приведённые к значениям колонок
+    columns - колонка -> вид: required (непустая строка), optional (пустая строка -> NULL), int, bool
+    lengths - наибольшая длина строковых колонок
+    """
+    if not isinstance(body_data, dict):
+        raise ValueError('Body must be a JSON object')
+    changes: Dict[str, Any] = {}
+    for column, kind in columns.items():
+        if column not in body_data:
+            continue
+        value = body_data[column]
+        if kind in ('required', 'optional'):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f'{column} must be a string')
+            value = (value or '').strip() or None
+            if kind == 'required' and value is None:
+                raise ValueError(f'{column} cannot be empty')
+            if value is not None and lengths and len(value) > lengths.get(column, len(value)):
+                raise ValueError(f'{column} must be at most {lengths[column]} characters')
+        elif kind == 'int' and (isinstance(value, bool) or not isinstance(value, int) or not INT_MIN <= value <= INT_MAX):
+            raise ValueError(f'{column} must be an integer')
+        elif kind == 'bool' and not isinstance(value, bool):
+            raise ValueError(f'{column} must be true or false')
+        changes[column] = value
+    return changes
+
+def patch_row(cur, table: str, row_id: Any, changes: Dict[str, Any], returning: str,
+              versions: Optional[List[datetime]] = None) -> Tuple[Optional[Tuple], str]:
+    """
+    UPDATE только переданных колонок; если значения совпадают с текущими, строка не переписывается
+    и updated_at не меняется. versions - ожидаемые версии из If-Match, returning должен включать updated_at
+    Возвращает (строка или None, 'updated' | 'unchanged' | 'conflict')
+    """
+    condition, condition_args = version_condition(versions)
+    if changes:
+        columns = ', '.join(changes)
+        cur.execute(
+            f"""UPDATE {table}
+               SET {', '.join(f'{column} = %s' for column in changes)}, updated_at = CURRENT_TIMESTAMP
+               WHERE id = %s{condition} AND ({columns}) IS DISTINCT FROM ({', '.join(['%s'] * len(changes))})
+               RETURNING {returning}""",
+            [*changes.values(), row_id, *condition_args, *changes.values()]
+        )
+        row = cur.fetchone()
+        if row:
+            return row, 'updated'
+    cur.execute(f"SELECT {returning} FROM {table} WHERE id = %s", (row_id,))
+    row = cur.fetchone()
+    if row and versions is not None:
+        updated_at = row[[column.name for column in cur.description].index('updated_at')]
+        if (updated_at or VERSION_EPOCH) not in versions:
+            return row, 'conflict'
+    return row, 'unchanged'
+
+CONTENT_SEARCH_LIMIT = int(os.environ.get('CONTENT_SEARCH_LIMIT', '50'))
+
+def search_published(cur, table: str, columns: str, query: str) -> List[Tuple]:
+    """
+    Ранжированный полнотекстовый поиск по опубликованным записям (русская морфология)
+    Если по словам ничего не нашлось - нечёткий поиск по триграммам заголовка
+    """
+    cur.execute(
+        f"""SELECT {columns} FROM {table}
+            WHERE is_published = true AND search_vector @@ websearch_to_tsquery('russian', %s)
+            ORDER BY ts_rank_cd(search_vector, websearch_to_tsquery('russian', %s)) DESC, id DESC
+            LIMIT %s""",
+        (query, query, CONTENT_SEARCH_LIMIT)
+    )
+    rows = cur.fetchall()
+    if rows:
+        return rows
+    cur.execute(
+        f"""SELECT {columns} FROM {table}
+            WHERE is_published = true AND %s <%% title
+            ORDER BY word_similarity(%s, title) DESC, id DESC
+            LIMIT %s""",
+        (query, query, CONTENT_SEARCH_LIMIT)
+    )
+    return cur.fetchall()
+
+def news_values(method: str, body_data: Any) -> Dict[str, Any]:
+    """Поля новости из тела POST/PUT; без заголовка или текста, поля не того типа или длины - ValueError (см. parse_patch)"""
+    values = {'title': None, 'content': None, 'image_url': None, 'is_published': True,
+              **parse_patch(body_data, NEWS_PATCH_COLUMNS, NEWS_COLUMN_LENGTHS)}
+    if not values['title'] or not values['content']:
+        raise ValueError('Title and content are required')
+    return values
+
+def video_values(method: str, body_data: Any) -> Dict[str, Any]:
+    """
+    Поля видео из тела POST/PUT; POST принимает video_key из ?upload=complete, внешний video_url
+    или устаревшие video_data/thumbnail_data в base64. Поля не того типа или длины - ValueError (см. parse_patch)
+    """
+    columns = VIDEO_POST_COLUMNS if method == 'POST' else VIDEO_PATCH_COLUMNS
+    values = {**{column: None for column in columns}, 'is_published': True,
+              **parse_patch(body_data, columns, VIDEO_COLUMN_LENGTHS)}
+    if method == 'POST':
+        for name in ('video_key', 'thumbnail_key'):
+            if values[name] and not values[name].startswith(VIDEO_INCOMING_PREFIX):
+                raise ValueError(f'{name} must be a key returned by ?upload=complete')
+        if not values['title'] or not (values['video_key'] or values['video_data'] or values['video_url']):
+            raise ValueError('Title and video_key, video_url or video_data are required')
+    elif not values['title'] or not values['video_url']:
+        raise ValueError('Title and video_url are required')
+    return values
+
+def validate_write(method: str, params: Dict[str, str], event: Dict[str, Any], label: str,
+                   parse_values: Callable[[str, Any], Dict[str, Any]],
+                   patch_columns: Dict[str, str], lengths: Dict[str, int]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Проверка записи до подключения к базе: ответы 400, 405 и 412 не открывают соединение
+    Возвращает разобранный запрос {id, values | changes, versions} и None или готовый ответ с ошибкой
+    """
+    request: Dict[str, Any] = {}
+    if method not in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        return request, error_response(405, 'Method not allowed')
+    if method != 'POST' and not params.get('id'):
+        return request, error_response(400, f'{label} ID is required')
+    
+    try:
+        if method != 'POST':
+            request['id'] = parse_id_param(params['id'])
+        if method in ('POST', 'PUT'):
+            request['values'] = parse_values(method, json.loads(event.get('body') or '{}'))
+        elif method == 'PATCH':
+            request['changes'] = parse_patch(json.loads(event.get('body') or '{}'), patch_columns, lengths)
+    except ValueError as e:
+        return request, error_response(400, str(e))
+    
+    if method != 'POST':
+        try:
+            request['versions'] = parse_if_match(event, request['id'])
+        except ValueError:
+            return request, precondition_failed_response()
+    return request, None
+
+@instrumented('content')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Обработчик запросов для управления контентом
     
     Новости:
     GET /news - получить все новости
+    GET /news?limit=20 - страница новостей, курсор следующей страницы в заголовке X-Next-Cursor (GET /news?cursor=...)
+    GET /news?summary=true - текст новостей обрезан до CONTENT_SUMMARY_LENGTH символов (сочетается с остальными параметрами)
+    GET /news?fields=id,title,image_url - только перечисленные поля в списке, поиске и дельте (id есть всегда),
+        остальные колонки не читаются из базы
+    GET /news?updated_since=2024-10-19T10:00:00 - дельта для синхронизации: {items, removed, sync_token, has_more},
+        следующий запрос передаёт sync_token в updated_since (см. load_changes)
     GET /news?id=123 - получить конкретную новость
+    GET /news?ids=3,1,2 - несколько новостей одним запросом: {items, missing}, items в порядке ids,
+        missing - id, которых нет; не больше CONTENT_MAX_IDS id, сочетается с fields и summary
+    GET /news?q=выставка - поиск по заголовку и тексту с ранжированием
     POST /news - создать новость
     PUT /news?id=123 - обновить новость
+    PATCH /news?id=123 - обновить только переданные поля (например, is_published)
     DELETE /news?id=123 - удалить новость
     
     Видео:
-    GET /videos - получить все видео
+    GET /videos - получить все видео; limit, cursor, summary (обрезает description), fields и updated_since - как у новостей
     GET /videos?id=123 - получить конкретное видео
-    POST /videos - создать видео
+    GET /videos?ids=3,1,2 - несколько видео одним запросом, как у новостей
+    GET /videos?q=ваза - поиск по заголовку и описанию с ранжированием
+    POST /videos - создать видео со ссылкой (body: {title, description, video_url, thumbnail_url}) -> 201
+    POST /videos с video_key (и thumbnail_key) из ?upload=complete или устаревшими video_data/thumbnail_data в base64 ->
+        202 и status: processing; файл обрабатывает video-worker, после обработки видео публикуется
+        с hls_url - master-плейлистом HLS (360p/720p/1080p) для адаптивного воспроизведения
+    POST /videos?upload=initiate|complete|abort - загрузка файла видео напрямую в бакет частями
     PUT /videos?id=123 - обновить видео
+    PATCH /videos?id=123 - обновить только переданные поля
     DELETE /videos?id=123 - удалить видео
+    
+    GET /?cache_stats=true - счётчики кэша ответов
+    GET-ответы несут ETag и Cache-Control, на If-None-Match с тем же ETag отвечаем 304
+    PUT, PATCH и DELETE с If-Match: <ETag из GET ?id=> пишут только поверх этой версии, иначе 412
+    Запись помечает снимок публичного списка (catalog/news.<хэш>.json, catalog/videos.<хэш>.json)
+    устаревшим, новый выкладывает функция catalog-snapshots
     """
     method: str = event.get('httpMethod', 'GET')
     params = event.get('queryStringParameters', {}) or {}
@@ -41,457 +1069,335 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token, If-None-Match, If-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    if method == 'GET' and params.get('cache_stats'):
+        return cache_stats_response()
+    
     if content_type == 'news':
         return handle_news(event, method)
     elif content_type == 'videos':
         return handle_videos(event, method)
     else:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid type parameter. Use ?type=news or ?type=videos'}),
-            'isBase64Encoded': False
-        }
+        return error_response(400, 'Invalid type parameter. Use ?type=news or ?type=videos')
 
 def handle_news(event: Dict[str, Any], method: str) -> Dict[str, Any]:
     """Обработка запросов к новостям"""
+    params = event.get('queryStringParameters', {}) or {}
+    if method == 'GET':
+        cache_key = make_cache_key('news', params)
+        if_none_match = get_request_header(event, 'If-None-Match')
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached_response(cached, event)
+        try:
+            feed = parse_feed_params(params, NEWS_FIELDS)
+        except ValueError as e:
+            return error_response(400, str(e))
+    else:
+        request, error = validate_write(method, params, event, 'News', news_values, NEWS_PATCH_COLUMNS, NEWS_COLUMN_LENGTHS)
+        if error is not None:
+            return error
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
-            params = event.get('queryStringParameters', {}) or {}
-            news_id = params.get('id')
+            news_id = feed['id']
+            headers = {
+                **JSON_HEADERS,
+                'Access-Control-Expose-Headers': 'X-Next-Cursor, ETag',
+                'Cache-Control': cache_control_header(),
+                'Vary': 'Accept-Encoding'
+            }
             
-            if news_id:
+            if news_id is not None:
                 cur.execute(
                     "SELECT id, title, content, image_url, created_at, updated_at, is_published FROM news WHERE id = %s",
                     (news_id,)
                 )
                 row = cur.fetchone()
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'News not found'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response(404, 'News not found')
+                
+                headers['ETag'] = version_etag(row[0], row[5])
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
                 
-                result = {
-                    'id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'image_url': row[3],
-                    'created_at': row[4].isoformat() if row[4] else None,
-                    'updated_at': row[5].isoformat() if row[5] else None,
-                    'is_published': row[6]
-                }
+                result = rows_to_dicts(cur.description, [row], NEWS_FIELDS)[0]
+            elif feed['ids'] is not None:
+                rows, missing = load_by_ids(cur, 'news', 'content', feed)
+                updated_index = feed['columns'].index('updated_at')
+                headers['ETag'] = compute_etag(cache_key, ((row[0], row[updated_index]) for row in rows))
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                result = {'items': rows_to_dicts(cur.description, rows, feed['output']), 'missing': missing}
+            elif feed['since'] is not None:
+                result, versions = load_changes(cur, 'news', 'news', 'content', feed)
+                headers['ETag'] = compute_etag(cache_key, versions)
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
             else:
-                cur.execute(
-                    "SELECT id, title, content, image_url, created_at, updated_at, is_published FROM news WHERE is_published = true ORDER BY created_at DESC"
-                )
-                rows = cur.fetchall()
-                result = [{
-                    'id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'image_url': row[3],
-                    'created_at': row[4].isoformat() if row[4] else None,
-                    'updated_at': row[5].isoformat() if row[5] else None,
-                    'is_published': row[6]
-                } for row in rows]
+                query = params.get('q', '').strip()
+                if query:
+                    rows = search_published(cur, 'news', feed_columns(feed, 'content'), query)
+                else:
+                    rows, next_cursor = load_feed(cur, 'news', 'content', feed)
+                    if next_cursor:
+                        headers['X-Next-Cursor'] = next_cursor
+                updated_index = feed['columns'].index('updated_at')
+                headers['ETag'] = compute_etag(cache_key, ((row[0], row[updated_index]) for row in rows))
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                result = rows_to_dicts(cur.description, rows, feed['output'])
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            body = dumps(result)
+            response_cache.set(cache_key, headers, body)
+            return build_response(200, body, {**headers, 'X-Cache': 'MISS'}, event)
         
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            title = body_data.get('title', '').strip()
-            content = body_data.get('content', '').strip()
-            image_url = body_data.get('image_url', '').strip()
-            
-            if not title or not content:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Title and content are required'}),
-                    'isBase64Encoded': False
-                }
-            
+            values = request['values']
             cur.execute(
                 "INSERT INTO news (title, content, image_url) VALUES (%s, %s, %s) RETURNING id, title, content, image_url, created_at, updated_at, is_published",
-                (title, content, image_url if image_url else None)
+                (values['title'], values['content'], values['image_url'])
             )
             row = cur.fetchone()
-            conn.commit()
+            commit_write(conn, 'news')
             
-            result = {
-                'id': row[0],
-                'title': row[1],
-                'content': row[2],
-                'image_url': row[3],
-                'created_at': row[4].isoformat() if row[4] else None,
-                'updated_at': row[5].isoformat() if row[5] else None,
-                'is_published': row[6]
-            }
+            result = rows_to_dicts(cur.description, [row], NEWS_FIELDS)[0]
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(201, result, headers=version_headers(cur, row))
         
         elif method == 'PUT':
-            params = event.get('queryStringParameters', {}) or {}
-            news_id = params.get('id')
-            
-            if not news_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'News ID is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            body_data = json.loads(event.get('body', '{}'))
-            title = body_data.get('title', '').strip()
-            content = body_data.get('content', '').strip()
-            image_url = body_data.get('image_url', '').strip()
-            is_published = body_data.get('is_published', True)
-            
-            if not title or not content:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Title and content are required'}),
-                    'isBase64Encoded': False
-                }
-            
+            news_id = request['id']
+            values = request['values']
+            condition, condition_args = version_condition(request['versions'])
             cur.execute(
-                """UPDATE news 
+                f"""UPDATE news 
                    SET title = %s, content = %s, image_url = %s, is_published = %s, updated_at = CURRENT_TIMESTAMP 
-                   WHERE id = %s
+                   WHERE id = %s{condition}
                    RETURNING id, title, content, image_url, created_at, updated_at, is_published""",
-                (title, content, image_url if image_url else None, is_published, news_id)
+                (values['title'], values['content'], values['image_url'], values['is_published'], news_id, *condition_args)
             )
             row = cur.fetchone()
             
             if not row:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'News not found'}),
-                    'isBase64Encoded': False
-                }
+                return missing_or_conflict(cur, 'news', news_id, 'News')
             
-            conn.commit()
+            commit_write(conn, 'news')
             
-            result = {
-                'id': row[0],
-                'title': row[1],
-                'content': row[2],
-                'image_url': row[3],
-                'created_at': row[4].isoformat() if row[4] else None,
-                'updated_at': row[5].isoformat() if row[5] else None,
-                'is_published': row[6]
-            }
+            result = rows_to_dicts(cur.description, [row], NEWS_FIELDS)[0]
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, result, headers=version_headers(cur, row))
         
-        elif method == 'DELETE':
-            params = event.get('queryStringParameters', {}) or {}
-            news_id = params.get('id')
+        elif method == 'PATCH':
+            news_id = request['id']
+            row, outcome = patch_row(cur, 'news', news_id, request['changes'], ', '.join(NEWS_FIELDS), request['versions'])
+            if not row:
+                return error_response(404, 'News not found')
+            if outcome == 'conflict':
+                return precondition_failed_response(row_etag(cur, row))
             
-            if not news_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'News ID is required'}),
-                    'isBase64Encoded': False
-                }
+            if outcome == 'updated':
+                commit_write(conn, 'news')
             
-            cur.execute("DELETE FROM news WHERE id = %s RETURNING id", (news_id,))
+            return json_response(200, rows_to_dicts(cur.description, [row], NEWS_FIELDS)[0], headers=version_headers(cur, row))
+        
+        elif method == 'DELETE':
+            news_id = request['id']
+            condition, condition_args = version_condition(request['versions'])
+            cur.execute(f"DELETE FROM news WHERE id = %s{condition} RETURNING id", (news_id, *condition_args))
             row = cur.fetchone()
             
             if not row:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'News not found'}),
-                    'isBase64Encoded': False
-                }
+                return missing_or_conflict(cur, 'news', news_id, 'News')
             
-            conn.commit()
+            # Надгробие для дельты ?updated_since=: клиент узнаёт об удалении из removed
+            cur.execute("INSERT INTO content_deletions (content_type, item_id) VALUES (%s, %s)", ('news', row[0]))
+            commit_write(conn, 'news')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'News deleted successfully'}),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'message': 'News deleted successfully'})
     
     finally:
         cur.close()
-        conn.close()
+        release_db_connection(conn)
 
 def handle_videos(event: Dict[str, Any], method: str) -> Dict[str, Any]:
     """Обработка запросов к видео"""
+    params = event.get('queryStringParameters', {}) or {}
+    if method == 'POST' and params.get('upload'):
+        try:
+            body_data = json.loads(event.get('body') or '{}')
+        except ValueError:
+            body_data = None
+        if not isinstance(body_data, dict):
+            return error_response(400, 'Body must be a JSON object')
+        return handle_video_upload(params['upload'], body_data)
+    
+    if method == 'GET':
+        cache_key = make_cache_key('videos', params)
+        if_none_match = get_request_header(event, 'If-None-Match')
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached_response(cached, event)
+        try:
+            feed = parse_feed_params(params, VIDEO_FIELDS)
+        except ValueError as e:
+            return error_response(400, str(e))
+    else:
+        request, error = validate_write(method, params, event, 'Video', video_values, VIDEO_PATCH_COLUMNS, VIDEO_COLUMN_LENGTHS)
+        if error is not None:
+            return error
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
-            params = event.get('queryStringParameters', {}) or {}
-            video_id = params.get('id')
+            video_id = feed['id']
+            headers = {
+                **JSON_HEADERS,
+                'Access-Control-Expose-Headers': 'X-Next-Cursor, ETag',
+                'Cache-Control': cache_control_header(),
+                'Vary': 'Accept-Encoding'
+            }
             
-            if video_id:
+            if video_id is not None:
                 cur.execute(
-                    "SELECT id, title, description, video_url, thumbnail_url, created_at, updated_at, is_published FROM t_p4274353_souvenir_store_proje.videos WHERE id = %s",
+                    f"SELECT {VIDEO_COLUMNS} FROM videos WHERE id = %s",
                     (video_id,)
                 )
                 row = cur.fetchone()
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Video not found'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response(404, 'Video not found')
                 
-                result = {
-                    'id': row[0],
-                    'title': row[1],
-                    'description': row[2],
-                    'video_url': row[3],
-                    'thumbnail_url': row[4],
-                    'created_at': row[5].isoformat() if row[5] else None,
-                    'updated_at': row[6].isoformat() if row[6] else None,
-                    'is_published': row[7]
-                }
+                headers['ETag'] = version_etag(row[0], row[6])
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                
+                result = rows_to_dicts(cur.description, [row], VIDEO_FIELDS)[0]
+            elif feed['ids'] is not None:
+                rows, missing = load_by_ids(cur, 'videos', 'description', feed)
+                updated_index = feed['columns'].index('updated_at')
+                headers['ETag'] = compute_etag(cache_key, ((row[0], row[updated_index]) for row in rows))
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                result = {'items': rows_to_dicts(cur.description, rows, feed['output']), 'missing': missing}
+            elif feed['since'] is not None:
+                result, versions = load_changes(cur, 'videos', 'videos', 'description', feed)
+                headers['ETag'] = compute_etag(cache_key, versions)
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
             else:
-                cur.execute(
-                    "SELECT id, title, description, video_url, thumbnail_url, created_at, updated_at, is_published FROM t_p4274353_souvenir_store_proje.videos WHERE is_published = true ORDER BY created_at DESC"
-                )
-                rows = cur.fetchall()
-                result = [{
-                    'id': row[0],
-                    'title': row[1],
-                    'description': row[2],
-                    'video_url': row[3],
-                    'thumbnail_url': row[4],
-                    'created_at': row[5].isoformat() if row[5] else None,
-                    'updated_at': row[6].isoformat() if row[6] else None,
-                    'is_published': row[7]
-                } for row in rows]
+                query = params.get('q', '').strip()
+                if query:
+                    rows = search_published(cur, 'videos', feed_columns(feed, 'description'), query)
+                else:
+                    rows, next_cursor = load_feed(cur, 'videos', 'description', feed)
+                    if next_cursor:
+                        headers['X-Next-Cursor'] = next_cursor
+                updated_index = feed['columns'].index('updated_at')
+                headers['ETag'] = compute_etag(cache_key, ((row[0], row[updated_index]) for row in rows))
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                result = rows_to_dicts(cur.description, rows, feed['output'])
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result),
-                'isBase64Encoded': False
-            }
+            body = dumps(result)
+            response_cache.set(cache_key, headers, body)
+            return build_response(200, body, {**headers, 'X-Cache': 'MISS'}, event)
         
         elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            title = body_data.get('title', '').strip()
-            description = body_data.get('description', '').strip()
-            video_base64 = body_data.get('video_data', '')
-            thumbnail_base64 = body_data.get('thumbnail_data', '')
-            
-            if not title or not video_base64:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Title and video_data are required'}),
-                    'isBase64Encoded': False
-                }
-            
-            s3 = boto3.client('s3',
-                endpoint_url='https://bucket.poehali.dev',
-                aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-                aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-            )
-            
-            video_id = str(uuid.uuid4())
-            video_key = f'videos/{video_id}.mp4'
-            
-            video_data = base64.b64decode(video_base64)
-            s3.put_object(
-                Bucket='files',
-                Key=video_key,
-                Body=video_data,
-                ContentType='video/mp4'
-            )
+            values = request['values']
+            video_key, thumbnail_key = values['video_key'], values['thumbnail_key']
+            if values['video_data']:
+                video_key = put_incoming_base64(values['video_data'], 'mp4', 'video/mp4')
+            if values['thumbnail_data']:
+                thumbnail_key = put_incoming_base64(values['thumbnail_data'], 'jpg', 'image/jpeg')
+            thumbnail_url = cdn_url_for(thumbnail_key) if thumbnail_key else values['thumbnail_url']
             
-            video_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{video_key}"
-            
-            thumbnail_url = None
-            if thumbnail_base64:
-                thumbnail_key = f'videos/thumbnails/{video_id}.jpg'
-                thumbnail_data = base64.b64decode(thumbnail_base64)
-                s3.put_object(
-                    Bucket='files',
-                    Key=thumbnail_key,
-                    Body=thumbnail_data,
-                    ContentType='image/jpeg'
+            if not video_key:
+                # Внешняя ссылка (например, YouTube embed) публикуется сразу
+                cur.execute(
+                    f"INSERT INTO videos (title, description, video_url, thumbnail_url) VALUES (%s, %s, %s, %s) RETURNING {VIDEO_COLUMNS}",
+                    (values['title'], values['description'], values['video_url'], thumbnail_url)
                 )
-                thumbnail_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{thumbnail_key}"
-            
-            cur.execute(
-                "INSERT INTO t_p4274353_souvenir_store_proje.videos (title, description, video_url, thumbnail_url) VALUES (%s, %s, %s, %s) RETURNING id, title, description, video_url, thumbnail_url, created_at, updated_at, is_published",
-                (title, description if description else None, video_url, thumbnail_url if thumbnail_url else None)
-            )
-            row = cur.fetchone()
-            conn.commit()
+                row = cur.fetchone()
+            else:
+                # Загруженный файл обрабатывает video-worker: запись скрыта, пока status = processing
+                cur.execute(
+                    f"""INSERT INTO videos (title, description, video_url, thumbnail_url, status, is_published)
+                       VALUES (%s, %s, %s, %s, 'processing', false) RETURNING {VIDEO_COLUMNS}""",
+                    (values['title'], values['description'], cdn_url_for(video_key), thumbnail_url)
+                )
+                row = cur.fetchone()
+                with conn.cursor() as job_cur:
+                    job_cur.execute(
+                        "INSERT INTO video_jobs (video_id, source_key, thumbnail_key) VALUES (%s, %s, %s)",
+                        (row[0], video_key, thumbnail_key)
+                    )
+            commit_write(conn, 'videos')
             
-            result = {
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'video_url': row[3],
-                'thumbnail_url': row[4],
-                'created_at': row[5].isoformat() if row[5] else None,
-                'updated_at': row[6].isoformat() if row[6] else None,
-                'is_published': row[7]
-            }
+            result = rows_to_dicts(cur.description, [row], VIDEO_FIELDS)[0]
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result),
-                'isBase64Encoded': False
-            }
+            return json_response(202 if video_key else 201, result, headers=version_headers(cur, row))
         
         elif method == 'PUT':
-            params = event.get('queryStringParameters', {}) or {}
-            video_id = params.get('id')
-            
-            if not video_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Video ID is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            body_data = json.loads(event.get('body', '{}'))
-            title = body_data.get('title', '').strip()
-            description = body_data.get('description', '').strip()
-            video_url = body_data.get('video_url', '').strip()
-            thumbnail_url = body_data.get('thumbnail_url', '').strip()
-            is_published = body_data.get('is_published', True)
-            
-            if not title or not video_url:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Title and video_url are required'}),
-                    'isBase64Encoded': False
-                }
-            
+            video_id = request['id']
+            values = request['values']
+            condition, condition_args = version_condition(request['versions'])
             cur.execute(
-                """UPDATE t_p4274353_souvenir_store_proje.videos 
+                f"""UPDATE videos 
                    SET title = %s, description = %s, video_url = %s, thumbnail_url = %s, is_published = %s, updated_at = CURRENT_TIMESTAMP 
-                   WHERE id = %s
-                   RETURNING id, title, description, video_url, thumbnail_url, created_at, updated_at, is_published""",
-                (title, description if description else None, video_url, thumbnail_url if thumbnail_url else None, is_published, video_id)
+                   WHERE id = %s{condition}
+                   RETURNING {VIDEO_COLUMNS}""",
+                (values['title'], values['description'], values['video_url'], values['thumbnail_url'], values['is_published'], video_id, *condition_args)
             )
             row = cur.fetchone()
             
             if not row:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Video not found'}),
-                    'isBase64Encoded': False
-                }
+                return missing_or_conflict(cur, 'videos', video_id, 'Video')
             
-            conn.commit()
+            commit_write(conn, 'videos')
             
-            result = {
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'video_url': row[3],
-                'thumbnail_url': row[4],
-                'created_at': row[5].isoformat() if row[5] else None,
-                'updated_at': row[6].isoformat() if row[6] else None,
-                'is_published': row[7]
-            }
+            result = rows_to_dicts(cur.description, [row], VIDEO_FIELDS)[0]
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result),
-                'isBase64Encoded': False
-            }
+            return json_response(200, result, headers=version_headers(cur, row))
         
-        elif method == 'DELETE':
-            params = event.get('queryStringParameters', {}) or {}
-            video_id = params.get('id')
+        elif method == 'PATCH':
+            video_id = request['id']
+            row, outcome = patch_row(cur, 'videos', video_id, request['changes'], VIDEO_COLUMNS, request['versions'])
+            if not row:
+                return error_response(404, 'Video not found')
+            if outcome == 'conflict':
+                return precondition_failed_response(row_etag(cur, row))
             
-            if not video_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Video ID is required'}),
-                    'isBase64Encoded': False
-                }
+            if outcome == 'updated':
+                commit_write(conn, 'videos')
             
-            cur.execute("DELETE FROM t_p4274353_souvenir_store_proje.videos WHERE id = %s RETURNING id", (video_id,))
+            return json_response(200, rows_to_dicts(cur.description, [row], VIDEO_FIELDS)[0], headers=version_headers(cur, row))
+        
+        elif method == 'DELETE':
+            video_id = request['id']
+            condition, condition_args = version_condition(request['versions'])
+            cur.execute(f"DELETE FROM videos WHERE id = %s{condition} RETURNING id", (video_id, *condition_args))
             row = cur.fetchone()
             
             if not row:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Video not found'}),
-                    'isBase64Encoded': False
-                }
+                return missing_or_conflict(cur, 'videos', video_id, 'Video')
             
-            conn.commit()
+            # Надгробие для дельты ?updated_since=: клиент узнаёт об удалении из removed
+            cur.execute("INSERT INTO content_deletions (content_type, item_id) VALUES (%s, %s)", ('videos', row[0]))
+            commit_write(conn, 'videos')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'message': 'Video deleted successfully'}),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'message': 'Video deleted successfully'})
     
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
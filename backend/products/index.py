@@ -2,23 +2,1122 @@
 API для управления товарами каталога
 Поддерживает: получение списка товаров, создание, обновление, удаление
 """
+import io
+import csv
 import json
+import re
 import os
-import psycopg2
-from typing import Dict, Any
+import time
+import hashlib
+import threading
+import base64
+import gzip
+import random
+import functools
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+EXPLAIN_SAMPLE_RATE = float(os.environ.get('EXPLAIN_SAMPLE_RATE', '0'))
+REQUEST_LOG_ENABLED = os.environ.get('REQUEST_LOG', 'true').lower() in ('true', '1')
+
+class RequestTimings:
+    """Время одного вызова по фазам: длительность, число операций, строки и байты"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, phase: str, elapsed: float, rows: int = 0, size: int = 0) -> None:
+        with self._lock:
+            stats = self.phases.setdefault(phase, {'ms': 0.0, 'count': 0, 'rows': 0, 'bytes': 0})
+            stats['ms'] += elapsed * 1000
+            stats['count'] += 1
+            stats['rows'] += max(rows, 0)
+            stats['bytes'] += size
+    
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+    
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        entries = [f'{phase};dur={stats["ms"]:.1f};desc="{stats["count"]}x"' for phase, stats in self.phases.items()]
+        entries.append(f'total;dur={self.elapsed_ms():.1f}')
+        return ', '.join(entries)
+
+_request_timings: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+
+@contextmanager
+def measure(phase: str):
+    """Замер фазы текущего вызова; в словарь можно записать rows и bytes. Вне вызова ничего не делает"""
+    sample = {'rows': 0, 'bytes': 0}
+    timings = _request_timings.get()
+    started = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - started, sample['rows'], sample['bytes'])
+
+def log_event(entry: Dict[str, Any]) -> None:
+    """Структурированная строка лога (одна JSON-строка в stdout)"""
+    print(json.dumps(entry, ensure_ascii=False, default=str), flush=True)
+
+def instrumented(function_name: str):
+    """Декоратор обработчика: Server-Timing в ответе и строка лога с фазами вызова"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            timings = RequestTimings()
+            token = _request_timings.set(timings)
+            try:
+                response = func(event, context)
+            finally:
+                _request_timings.reset(token)
+            response['headers'] = {
+                **(response.get('headers') or {}),
+                'Server-Timing': timings.server_timing(),
+                'Timing-Allow-Origin': '*'
+            }
+            if REQUEST_LOG_ENABLED:
+                log_event({
+                    'event': 'request',
+                    'function': function_name,
+                    'method': event.get('httpMethod'),
+                    'params': event.get('queryStringParameters') or {},
+                    'status': response.get('statusCode'),
+                    'duration_ms': round(timings.elapsed_ms(), 1),
+                    'response_bytes': len(response.get('body') or ''),
+                    'phases': {phase: {**stats, 'ms': round(stats['ms'], 1)} for phase, stats in timings.phases.items()}
+                })
+            return response
+        return wrapper
+    return decorator
+
+@functools.lru_cache(maxsize=None)
+def timed_cursor_class() -> type:
+    """Класс TimedCursor; собирается при создании пула, когда psycopg2 уже импортирован"""
+    
+    class TimedCursor(psycopg2.extensions.cursor):
+        """Курсор, который пишет время запросов в фазу db и логирует медленные запросы"""
+        
+        def execute(self, query, vars=None):
+            timings = _request_timings.get()
+            if timings is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            # Только успешный запрос: после ошибки транзакция прервана, и EXPLAIN заменил бы исходную ошибку своей
+            result = super().execute(query, vars)
+            elapsed = time.perf_counter() - started
+            timings.add('db', elapsed, rows=self.rowcount)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                log_slow_query(self, query, vars, elapsed)
+            return result
+        
+        def copy_expert(self, sql, file, size=8192):
+            with measure('db') as sample:
+                result = super().copy_expert(sql, file, size)
+                sample['rows'] = self.rowcount
+            return result
+    
+    return TimedCursor
+
+def explain_analyze(conn, query, vars) -> Any:
+    """План с EXPLAIN (ANALYZE, BUFFERS); запрос повторяется в точке сохранения, ошибка не ломает транзакцию"""
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        try:
+            cur.execute('SAVEPOINT explain_sample')
+        except psycopg2.Error as e:
+            return {'error': str(e).strip()}
+        try:
+            cur.execute(b'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + cur.mogrify(query, vars))
+            plan = cur.fetchone()[0]
+        except psycopg2.Error as e:
+            cur.execute('ROLLBACK TO SAVEPOINT explain_sample')
+            return {'error': str(e).strip()}
+        cur.execute('RELEASE SAVEPOINT explain_sample')
+        return plan
+
+def log_slow_query(cur, query, vars, elapsed: float) -> None:
+    """Лог медленного запроса; SELECT с вероятностью EXPLAIN_SAMPLE_RATE дополняется планом выполнения"""
+    text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+    entry: Dict[str, Any] = {
+        'event': 'slow_query',
+        'duration_ms': round(elapsed * 1000, 1),
+        'rows': cur.rowcount,
+        'query': ' '.join(text.split())[:2000]
+    }
+    if (EXPLAIN_SAMPLE_RATE > 0 and random.random() < EXPLAIN_SAMPLE_RATE
+            and cur.name is None and entry['query'].upper().startswith('SELECT')):
+        entry['plan'] = explain_analyze(cur.connection, query, vars)
+    log_event(entry)
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает вызовы в тёплом контейнере,
+# DB_POOL_MIN_SIZE соединений остаются открытыми между вызовами.
+# psycopg2 импортируется при создании пула: OPTIONS, ответы из кэша и ошибки валидации обходятся без него
+psycopg2: Any = None
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    """Ленивое создание пула подключений к базе данных"""
+    global _db_pool, psycopg2
+    if _db_pool is None or _db_pool.closed:
+        import psycopg2.pool
+        import psycopg2.extensions
+        import psycopg2.extras
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(
+            DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ['DATABASE_URL'], cursor_factory=timed_cursor_class()
+        )
+        _db_last_used.clear()
+    return _db_pool
+
+def _is_connection_alive(conn) -> bool:
+    """Проверка соединения, простаивавшего дольше DB_POOL_PING_AFTER секунд"""
+    if conn.closed:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
-    """Создание подключения к базе данных"""
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    """Получение живого подключения из пула, устаревшие сокеты переоткрываются"""
+    with measure('db_connect'):
+        pool = get_db_pool()
+        for _ in range(DB_POOL_MAX_SIZE + 1):
+            conn = pool.getconn()
+            if _is_connection_alive(conn):
+                return conn
+            _db_last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def release_db_connection(conn) -> None:
+    """Возврат подключения в пул; открытая транзакция откатывается"""
+    pool = get_db_pool()
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '30'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256'))
+
+class ResponseCache:
+    """
+    LRU-кэш сериализованных ответов GET с ограниченным временем жизни
+    Живёт в тёплом контейнере и сбрасывается после записи в этом же контейнере,
+    остальные контейнеры видят изменения не позже чем через RESPONSE_CACHE_TTL секунд
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[Tuple, Tuple[float, Dict[str, str], str]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple) -> Optional[Tuple[Dict[str, str], str]]:
+        """Возвращает (headers, body) или None, если записи нет или она устарела"""
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+    
+    def set(self, key: Tuple, headers: Dict[str, str], body: str) -> None:
+        """Сохраняет ответ, вытесняя самые давно использованные записи"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, dict(headers), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, namespace: Optional[str] = None) -> None:
+        """Сбрасывает записи пространства имён (или весь кэш)"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Счётчики для подбора TTL и размера кэша"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
+
+response_cache = ResponseCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES)
+
+# По умолчанию no-cache: браузер и CDN хранят ответ, но перед каждым показом сверяют ETag (304 без тела),
+# поэтому запись сразу видна; max-age > 0 включается явно там, где допустима задержка
+CACHE_CONTROL_MAX_AGE = int(os.environ.get('CACHE_CONTROL_MAX_AGE', '0'))
+CACHE_CONTROL_STALE_WHILE_REVALIDATE = int(os.environ.get('CACHE_CONTROL_STALE_WHILE_REVALIDATE', '300'))
+
+def cache_control_header() -> str:
+    """Значение Cache-Control для публичных GET-ответов"""
+    if CACHE_CONTROL_MAX_AGE <= 0:
+        return 'no-cache'
+    return f'public, max-age={CACHE_CONTROL_MAX_AGE}, stale-while-revalidate={CACHE_CONTROL_STALE_WHILE_REVALIDATE}'
+
+def compute_etag(cache_key: Tuple, versions: Iterable[Tuple[Any, Any]]) -> str:
+    """Сильный ETag из запроса и версий строк (id, updated_at), без сериализации тела"""
+    digest = hashlib.sha256(repr(cache_key).encode('utf-8'))
+    for row_id, updated_at in versions:
+        digest.update(f"{row_id}:{updated_at.isoformat() if updated_at else ''};".encode('utf-8'))
+    return f'"{digest.hexdigest()[:32]}"'
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Заголовок запроса без учёта регистра"""
+    headers = event.get('headers') or {}
+    lower_name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower_name:
+            return value
+    return None
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Проверка If-None-Match (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+def _json_default(value: Any) -> Any:
+    """Типы psycopg2, которых нет в JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(data: Any) -> str:
+    """JSON без экранирования кириллицы, через orjson, если он установлен"""
+    with measure('serialize') as sample:
+        if orjson is not None:
+            body = orjson.dumps(data, default=_json_default).decode('utf-8')
+        else:
+            body = json.dumps(data, ensure_ascii=False, default=_json_default)
+        sample['bytes'] = len(body)
+    return body
+
+def rows_to_dicts(description, rows: Iterable[Tuple], fields: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Строки курсора в словари по cursor.description; fields - колонка -> ключ в ответе"""
+    plan = [(index, fields[column.name]) for index, column in enumerate(description) if column.name in fields]
+    return [{key: row[index] for index, key in plan} for row in rows]
+
+def choose_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br, если клиент его принимает и установлен brotli, иначе gzip; None - без сжатия"""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, weight = item.partition(';')
+        weight = weight.replace(' ', '')
+        if weight.startswith('q=') and not weight[2:].strip('0.'):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def build_response(status: int, body: str, headers: Dict[str, str], event: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Ответ функции; тело от COMPRESSION_MIN_SIZE символов сжимается по Accept-Encoding запроса"""
+    encoding = None
+    if event is not None and len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = choose_content_encoding(get_request_header(event, 'Accept-Encoding'))
+    if encoding is None:
+        return {'statusCode': status, 'headers': headers, 'body': body, 'isBase64Encoded': False}
+    
+    raw = body.encode('utf-8')
+    with measure('compress') as sample:
+        if encoding == 'br':
+            compressed = brotli.compress(raw, quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(raw, compresslevel=COMPRESSION_GZIP_LEVEL)
+        sample['bytes'] = len(compressed)
+    return {
+        'statusCode': status,
+        'headers': {**headers, 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def json_response(status: int, data: Any, event: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """JSON-ответ с CORS; event нужен, чтобы сжать тело"""
+    return build_response(status, dumps(data), {**JSON_HEADERS, **(headers or {})}, event)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    """Ответ с ошибкой {'error': message}"""
+    return json_response(status, {'error': message})
+
+def not_modified_response(headers: Dict[str, str]) -> Dict[str, Any]:
+    """304 с пустым телом и валидаторами исходного ответа"""
+    return build_response(304, '', {key: value for key, value in headers.items() if key != 'Content-Type'})
+
+def make_cache_key(namespace: str, params: Dict[str, str]) -> Tuple:
+    """Ключ кэша из нормализованных query-параметров"""
+    return (namespace, tuple(sorted((k, v) for k, v in params.items() if v)))
+
+def cached_response(cached: Tuple[Dict[str, str], str], event: Dict[str, Any]) -> Dict[str, Any]:
+    """Ответ из закэшированных заголовков и тела, 304 при совпадении ETag"""
+    headers, body = cached
+    if etag_matches(get_request_header(event, 'If-None-Match'), headers.get('ETag')):
+        return not_modified_response(headers)
+    return build_response(200, body, {**headers, 'X-Cache': 'HIT'}, event)
+
+def cache_stats_response() -> Dict[str, Any]:
+    """Ответ со счётчиками кэша (GET /?cache_stats=true)"""
+    return json_response(200, response_cache.stats(), headers={'Cache-Control': 'no-store'})
+
+VERSION_EPOCH = datetime(1970, 1, 1)
+
+def version_etag(row_id: Any, updated_at: Optional[datetime]) -> str:
+    """Сильный ETag версии строки: id и updated_at в микросекундах, его же ждём в If-Match"""
+    micros = (updated_at - VERSION_EPOCH) // timedelta(microseconds=1) if updated_at else 0
+    return f'"{row_id}.{micros:x}"'
+
+def row_etag(cur, row: Tuple) -> str:
+    """ETag версии для строки, у которой в выборке есть id и updated_at"""
+    columns = [column.name for column in cur.description]
+    return version_etag(row[columns.index('id')], row[columns.index('updated_at')])
+
+def version_headers(cur, row: Tuple) -> Dict[str, str]:
+    """Заголовки ответа на запись с ETag новой версии"""
+    return {'ETag': row_etag(cur, row), 'Access-Control-Expose-Headers': 'ETag'}
+
+def parse_if_match(event: Dict[str, Any], row_id: Any) -> Optional[List[datetime]]:
+    """
+    Версии updated_at из If-Match для условной записи; None - заголовка нет или он равен *
+    ValueError, если ни один ETag не относится к этой строке (ответ 412)
+    """
+    if_match = (get_request_header(event, 'If-Match') or '').strip()
+    if not if_match or if_match == '*':
+        return None
+    versions = []
+    for tag in if_match.split(','):
+        # Слабые ETag для If-Match не подходят (RFC 9110, сильное сравнение)
+        match = re.fullmatch(r'"(\d+)\.([0-9a-f]+)"', tag.strip())
+        if match and match.group(1) == str(row_id):
+            versions.append(VERSION_EPOCH + timedelta(microseconds=int(match.group(2), 16)))
+    if not versions:
+        raise ValueError('If-Match does not match the current version')
+    return versions
+
+def version_condition(versions: Optional[List[datetime]]) -> Tuple[str, List[Any]]:
+    """Условие WHERE для записи только поверх одной из ожидаемых версий"""
+    if versions is None:
+        return '', []
+    return " AND COALESCE(updated_at, TIMESTAMP 'epoch') = ANY(%s)", [versions]
+
+def missing_or_conflict(cur, table: str, row_id: Any, label: str) -> Dict[str, Any]:
+    """Условная запись не нашла строку: 404, если её нет, иначе 412 с текущим ETag"""
+    cur.execute(f"SELECT id, updated_at FROM {table} WHERE id = %s", (row_id,))
+    row = cur.fetchone()
+    if not row:
+        return error_response(404, f'{label} not found')
+    return precondition_failed_response(version_etag(row[0], row[1]))
+
+def precondition_failed_response(current_etag: Optional[str] = None) -> Dict[str, Any]:
+    """412: запись изменена другим запросом, клиент должен перечитать её"""
+    headers = {'ETag': current_etag, 'Access-Control-Expose-Headers': 'ETag'} if current_etag else None
+    return json_response(412, {'error': 'Precondition failed: the record was modified, reload it and retry'}, headers=headers)
+
+# Колонки products -> ключи ответа API
+PRODUCT_FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'description': 'description',
+    'price_text': 'price',
+    'price_num': 'priceNum',
+    'category': 'category',
+    'image_url': 'image',
+    'is_available': 'available'
+}
+PRODUCT_DETAIL_FIELDS = {**PRODUCT_FIELDS, 'created_at': 'created_at', 'updated_at': 'updated_at'}
+
+PRODUCTS_MAX_LIMIT = int(os.environ.get('PRODUCTS_MAX_LIMIT', '100'))
+# Диапазон INTEGER: id (SERIAL) и целые колонки
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+# Предел ids= в одном запросе: корзина, избранное, связанные товары
+PRODUCTS_MAX_IDS = int(os.environ.get('PRODUCTS_MAX_IDS', '100'))
+# Белый список fields=: имя поля в ответе -> колонка products
+PRODUCT_FIELD_COLUMNS = {key: column for column, key in PRODUCT_FIELDS.items()}
+
+# Нижние границы ценовых диапазонов, совпадают с product_price_bucket (V0008)
+PRICE_BUCKET_BOUNDS = (0, 1000, 2500, 5000, 10000, 20000)
+
+def load_facets(cur, category: Optional[str]) -> Tuple[Dict[str, Any], List[Tuple[Any, Any]]]:
+    """
+    Фасеты каталога из сводки product_facets, которую триггеры обновляют при каждой записи в products
+    Категории считаются по всему каталогу, наличие и цены - внутри category, если она задана
+    Возвращает (фасеты, версии строк сводки для ETag)
+    """
+    cur.execute("SELECT category, price_bucket, is_available, product_count, updated_at FROM product_facets ORDER BY category, price_bucket, is_available")
+    rows = cur.fetchall()
+    
+    categories: Dict[str, Dict[str, Any]] = {}
+    availability = {'available': 0, 'unavailable': 0}
+    buckets = {bound: 0 for bound in PRICE_BUCKET_BOUNDS}
+    for row_category, price_bucket, is_available, count, _ in rows:
+        if count <= 0:
+            continue
+        entry = categories.setdefault(row_category, {'name': row_category, 'count': 0, 'available': 0})
+        entry['count'] += count
+        entry['available'] += count if is_available else 0
+        if category and row_category != category:
+            continue
+        availability['available' if is_available else 'unavailable'] += count
+        buckets[price_bucket] = buckets.get(price_bucket, 0) + count
+    
+    upper_bounds = list(PRICE_BUCKET_BOUNDS[1:]) + [None]
+    facets = {
+        'total': availability['available'] + availability['unavailable'],
+        'categories': list(categories.values()),
+        'availability': availability,
+        'price_buckets': [
+            {'min': bound, 'max': upper, 'count': buckets.get(bound, 0)}
+            for bound, upper in zip(PRICE_BUCKET_BOUNDS, upper_bounds)
+        ]
+    }
+    versions = [(f'{row[0]}:{row[1]}:{row[2]}', row[4]) for row in rows]
+    return facets, versions
+
+def encode_cursor(created_at: datetime, product_id: int) -> str:
+    """Непрозрачный курсор по ключу (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), product_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбор курсора, ValueError при некорректном значении или id вне диапазона SERIAL"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, product_id = json.loads(raw)
+        created_at, product_id = datetime.fromisoformat(created_at), int(product_id)
+    except (TypeError, ValueError, UnicodeDecodeError, OverflowError) as e:
+        raise ValueError('Invalid cursor') from e
+    # id вне диапазона SERIAL не совпадёт ни с одной записью, а вне BIGINT сломал бы сравнение в SQL
+    if not 0 <= product_id <= INT_MAX:
+        raise ValueError('Invalid cursor')
+    return created_at, product_id
+
+def parse_bool_param(value: str, name: str) -> bool:
+    """Разбор булевого query-параметра"""
+    if value.lower() in ('true', '1'):
+        return True
+    if value.lower() in ('false', '0'):
+        return False
+    raise ValueError(f'Parameter {name} must be true or false')
+
+def parse_int_param(value: str, name: str) -> int:
+    """Разбор целочисленного query-параметра"""
+    try:
+        return int(value)
+    except ValueError as e:
+        raise ValueError(f'Parameter {name} must be an integer') from e
+
+def parse_id_param(value: str, name: str = 'id') -> int:
+    """id записи: целое в диапазоне SERIAL, иначе ValueError (ответ 400, а не ошибка SQL)"""
+    row_id = parse_int_param(value, name)
+    if not 0 < row_id <= INT_MAX:
+        raise ValueError(f'Parameter {name} must be between 1 and {INT_MAX}')
+    return row_id
+
+def parse_product_fields(value: Optional[str]) -> List[str]:
+    """
+    Колонки SELECT для fields=id,name,price,image (имена полей ответа), id выбирается всегда
+    Без fields - все поля PRODUCT_FIELDS; ValueError для полей не из белого списка
+    """
+    if not value:
+        return list(PRODUCT_FIELDS)
+    requested = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in requested if name not in PRODUCT_FIELD_COLUMNS]
+    if unknown or not requested:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PRODUCT_FIELD_COLUMNS)}")
+    return [column for column in PRODUCT_FIELDS if column == 'id' or PRODUCT_FIELDS[column] in requested]
+
+def parse_ids_param(value: str, max_ids: int) -> List[int]:
+    """
+    ids=3,1,2: id без повторов в порядке запроса
+    ValueError для нецелых id, пустого списка и больше max_ids id
+    """
+    ids = list(dict.fromkeys(parse_id_param(raw.strip(), 'ids') for raw in value.split(',') if raw.strip()))
+    if not ids:
+        raise ValueError('Parameter ids must list at least one id')
+    if len(ids) > max_ids:
+        raise ValueError(f'Parameter ids accepts at most {max_ids} ids')
+    return ids
+
+def load_products_by_ids(cur, ids: List[int], columns: List[str]) -> Tuple[List[Tuple], List[int]]:
+    """Товары по ids одним запросом WHERE id = ANY(...): строки в порядке ids и id, которых нет в каталоге"""
+    cur.execute(f"SELECT {', '.join(columns)}, updated_at FROM products WHERE id = ANY(%s)", (ids,))
+    found = {row[0]: row for row in cur.fetchall()}
+    return [found[row_id] for row_id in ids if row_id in found], [row_id for row_id in ids if row_id not in found]
+
+def build_products_list_query(params: Dict[str, str], fuzzy: bool = False) -> Tuple[str, List[Any], Optional[int]]:
+    """
+    Собирает SELECT для списка товаров по фильтрам и курсору
+    Параметры: limit, cursor, category, available, min_price, max_price, q, fields
+    С q выдача ранжируется полнотекстовым поиском (fuzzy=True - по триграммам названия)
+    fields сужает список колонок; created_at и updated_at (курсор и ETag) всегда идут последними
+    Возвращает (sql, аргументы, limit или None для полного списка)
+    """
+    conditions: List[str] = []
+    args: List[Any] = []
+    query = params.get('q', '').strip()
+    
+    if params.get('category'):
+        conditions.append('category = %s')
+        args.append(params['category'])
+    if params.get('available'):
+        conditions.append('is_available = %s')
+        args.append(parse_bool_param(params['available'], 'available'))
+    if params.get('min_price'):
+        conditions.append('price_num >= %s')
+        args.append(parse_int_param(params['min_price'], 'min_price'))
+    if params.get('max_price'):
+        conditions.append('price_num <= %s')
+        args.append(parse_int_param(params['max_price'], 'max_price'))
+    if params.get('cursor'):
+        if query:
+            raise ValueError('Parameter cursor cannot be combined with q')
+        conditions.append('(created_at, id) < (%s, %s)')
+        args.extend(decode_cursor(params['cursor']))
+    
+    order_by = "created_at DESC, id DESC"
+    order_args: List[Any] = []
+    if query and fuzzy:
+        conditions.append('%s <%% name')
+        args.append(query)
+        order_by = "word_similarity(%s, name) DESC, id DESC"
+        order_args.append(query)
+    elif query:
+        conditions.append("search_vector @@ websearch_to_tsquery('russian', %s)")
+        args.append(query)
+        order_by = "ts_rank_cd(search_vector, websearch_to_tsquery('russian', %s)) DESC, id DESC"
+        order_args.append(query)
+    
+    limit = None
+    if params.get('limit'):
+        limit = parse_int_param(params['limit'], 'limit')
+        if limit < 1 or limit > PRODUCTS_MAX_LIMIT:
+            raise ValueError(f'Parameter limit must be between 1 and {PRODUCTS_MAX_LIMIT}')
+    elif params.get('cursor') or query:
+        limit = PRODUCTS_MAX_LIMIT
+    
+    sql = f"SELECT {', '.join(parse_product_fields(params.get('fields')))}, created_at, updated_at FROM products"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + order_by
+    args.extend(order_args)
+    if limit is not None:
+        # Лишняя строка показывает, есть ли следующая страница
+        sql += " LIMIT %s"
+        args.append(limit + 1)
+    return sql, args, limit
+
+def mark_snapshots_stale(cur, names: Iterable[str]) -> None:
+    """
+    Помечает снимки списков names устаревшими в транзакции записи; выкладывает их функция catalog-snapshots
+    Метка ставится последней перед commit: строка catalog_snapshots заблокирована только до фиксации
+    """
+    cur.execute(
+        """UPDATE catalog_snapshots
+           SET stale_since = COALESCE(stale_since, CURRENT_TIMESTAMP), stale_version = stale_version + 1
+           WHERE name = ANY(%s)""",
+        (list(names),)
+    )
+
+def commit_write(conn, namespace: str) -> None:
+    """Фиксация записи вместе с меткой устаревшего снимка списка и сброс кэша ответов контейнера"""
+    with conn.cursor() as cur:
+        mark_snapshots_stale(cur, (namespace,))
+    conn.commit()
+    response_cache.invalidate(namespace)
+
+BULK_COLUMNS = ('sku', 'name', 'description', 'price_text', 'price_num', 'category', 'image_url', 'is_available')
+BULK_REQUIRED_COLUMNS = ('sku', 'name', 'price_text', 'price_num', 'category')
+# Ответ функции - одна строка, поэтому выгрузка идёт страницами: память вызова растёт со страницей, а не с каталогом
+BULK_EXPORT_PAGE_SIZE = int(os.environ.get('BULK_EXPORT_PAGE_SIZE', '5000'))
+
+def read_request_body(event: Dict[str, Any]) -> str:
+    """Тело запроса как текст (платформа кодирует не-JSON тела в base64)"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return body
+
+def ndjson_to_copy_buffer(body: str) -> Tuple[List[str], io.StringIO]:
+    """NDJSON -> CSV-буфер для COPY; пустые значения становятся NULL"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line_number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Line {line_number}: invalid JSON') from e
+        if not isinstance(item, dict):
+            raise ValueError(f'Line {line_number}: expected a JSON object')
+        writer.writerow([item.get(column) for column in BULK_COLUMNS])
+    buffer.seek(0)
+    return list(BULK_COLUMNS), buffer
+
+def csv_to_copy_buffer(body: str) -> Tuple[List[str], io.StringIO]:
+    """Проверка заголовка CSV; сами строки уходят в COPY без разбора в Python"""
+    buffer = io.StringIO(body)
+    header = next(csv.reader(buffer), None)
+    if not header:
+        raise ValueError('CSV header is required')
+    columns = [column.strip() for column in header]
+    unknown = [column for column in columns if column not in BULK_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown CSV columns: {', '.join(unknown)}")
+    buffer.seek(0)
+    return columns, buffer
+
+def import_products(conn, columns: List[str], buffer: io.StringIO, has_header: bool) -> Dict[str, int]:
+    """
+    COPY во временную таблицу и upsert по sku одним запросом
+    Строки, которые не изменились, не переписываются
+    """
+    missing = [column for column in BULK_REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    
+    with conn.cursor() as cur:
+        cur.execute(
+            """CREATE TEMP TABLE products_import (
+                   sku VARCHAR(100), name VARCHAR(500), description TEXT, price_text VARCHAR(100),
+                   price_num INTEGER, category VARCHAR(100), image_url VARCHAR(1000), is_available BOOLEAN
+               ) ON COMMIT DROP"""
+        )
+        cur.copy_expert(
+            f"COPY products_import ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER {'true' if has_header else 'false'})",
+            buffer
+        )
+        cur.execute(
+            "SELECT COUNT(*) FROM products_import WHERE sku IS NULL OR name IS NULL OR price_text IS NULL OR price_num IS NULL OR category IS NULL"
+        )
+        invalid = cur.fetchone()[0]
+        if invalid:
+            raise ValueError(f'{invalid} rows miss one of: {", ".join(BULK_REQUIRED_COLUMNS)}')
+        
+        cur.execute("SELECT COUNT(*) FROM products_import")
+        received = cur.fetchone()[0]
+        # Последняя строка с одинаковым sku побеждает
+        cur.execute(
+            """INSERT INTO products AS p (sku, name, description, price_text, price_num, category, image_url, is_available)
+               SELECT DISTINCT ON (sku) sku, name, description, price_text, price_num, category, image_url, COALESCE(is_available, true)
+               FROM products_import
+               ORDER BY sku, ctid DESC
+               ON CONFLICT (sku) DO UPDATE
+               SET name = EXCLUDED.name, description = EXCLUDED.description, price_text = EXCLUDED.price_text,
+                   price_num = EXCLUDED.price_num, category = EXCLUDED.category, image_url = EXCLUDED.image_url,
+                   is_available = EXCLUDED.is_available, updated_at = CURRENT_TIMESTAMP
+               WHERE (p.name, p.description, p.price_text, p.price_num, p.category, p.image_url, p.is_available)
+                     IS DISTINCT FROM
+                     (EXCLUDED.name, EXCLUDED.description, EXCLUDED.price_text, EXCLUDED.price_num, EXCLUDED.category, EXCLUDED.image_url, EXCLUDED.is_available)
+               RETURNING (xmax = 0) AS inserted"""
+        )
+        results = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT COUNT(DISTINCT sku) FROM products_import")
+        distinct = cur.fetchone()[0]
+    
+    inserted = sum(1 for is_insert in results if is_insert)
+    updated = len(results) - inserted
+    return {'received': received, 'inserted': inserted, 'updated': updated, 'unchanged': distinct - len(results)}
+
+def export_products(conn, fmt: str, after_id: int) -> Tuple[str, Optional[int]]:
+    """
+    Страница выгрузки по ключу id: до BULK_EXPORT_PAGE_SIZE товаров с id > after_id
+    Тело страницы собирается в памяти целиком; возвращает его и id, с которого продолжать (None - страница последняя)
+    Каждая CSV-страница начинается с заголовка и сама по себе годится для ?bulk=import, если у всех товаров есть sku:
+    sku необязателен (V0006), такие товары выгружаются с пустым sku, и импорт отклоняет страницу с ними целиком
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(BULK_COLUMNS)
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT id, {', '.join(BULK_COLUMNS)} FROM products WHERE id > %s ORDER BY id LIMIT %s",
+            (after_id, BULK_EXPORT_PAGE_SIZE + 1)
+        )
+        rows = cur.fetchall()
+    for row in rows[:BULK_EXPORT_PAGE_SIZE]:
+        if writer:
+            writer.writerow(row[1:])
+        else:
+            buffer.write(dumps(dict(zip(BULK_COLUMNS, row[1:]))))
+            buffer.write('\n')
+    next_id = rows[BULK_EXPORT_PAGE_SIZE - 1][0] if len(rows) > BULK_EXPORT_PAGE_SIZE else None
+    return buffer.getvalue(), next_id
 
+def handle_bulk(event: Dict[str, Any], method: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Пакетная загрузка и выгрузка каталога, требует заголовок X-Admin-Secret
+    POST /?bulk=import&format=csv|ndjson - upsert товаров по sku, ответ {received, inserted, updated, unchanged}
+    GET /?bulk=export&format=csv|ndjson - выгрузка каталога страницами по BULK_EXPORT_PAGE_SIZE товаров,
+        продолжение - GET /?bulk=export&cursor=<X-Next-Cursor>, пока заголовок есть в ответе
+    """
+    admin_secret = get_request_header(event, 'X-Admin-Secret')
+    expected_secret = os.environ.get('ADMIN_SECRET_KEY')
+    
+    if not expected_secret or admin_secret != expected_secret:
+        return error_response(403, 'Forbidden: Invalid admin secret')
+    
+    content_type = get_request_header(event, 'Content-Type') or ''
+    fmt = params.get('format') or ('csv' if 'csv' in content_type else 'ndjson')
+    action = (method, params['bulk'])
+    if fmt not in ('csv', 'ndjson') or action not in (('POST', 'import'), ('GET', 'export')):
+        return error_response(400, 'Use POST ?bulk=import or GET ?bulk=export with format=csv or format=ndjson')
+    
+    try:
+        if action == ('POST', 'import'):
+            body = read_request_body(event)
+            columns, buffer = csv_to_copy_buffer(body) if fmt == 'csv' else ndjson_to_copy_buffer(body)
+        else:
+            after_id = parse_int_param(params['cursor'], 'cursor') if params.get('cursor') else 0
+    except (ValueError, csv.Error) as e:
+        return error_response(400, str(e).strip())
+    
+    conn = get_db_connection()
+    try:
+        if action == ('GET', 'export'):
+            body, next_id = export_products(conn, fmt, after_id)
+            headers = {
+                'Content-Type': 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8',
+                'Content-Disposition': f'attachment; filename="products.{fmt}"',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': 'X-Next-Cursor',
+                'Vary': 'Accept-Encoding'
+            }
+            if next_id is not None:
+                headers['X-Next-Cursor'] = str(next_id)
+            return build_response(200, body, headers, event)
+        
+        started = time.monotonic()
+        try:
+            result = import_products(conn, columns, buffer, has_header=fmt == 'csv')
+        except (ValueError, psycopg2.DataError) as e:
+            conn.rollback()
+            return error_response(400, str(e).strip())
+        commit_write(conn, 'products')
+        
+        result['elapsed_ms'] = round((time.monotonic() - started) * 1000)
+        return json_response(200, result)
+    except Exception as e:
+        conn.rollback()
+        return error_response(500, str(e))
+    finally:
+        release_db_connection(conn)
+
+BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', '500'))
+PRODUCT_COLUMNS = 'id, name, description, price_text, price_num, category, image_url, is_available'
+PRODUCT_UPDATE_TEMPLATE = '(%s::integer, %s::varchar, %s::text, %s::varchar, %s::integer, %s::varchar, %s::varchar, %s::boolean)'
+
+def product_values(body_data: Any) -> Tuple:
+    """
+    Поля товара из тела запроса в порядке колонок (name, description, price_text, price_num, category, image_url, is_available)
+    Типы и длины проверяются до базы (см. parse_patch): ошибка одного товара в пакете не откатывает остальные
+    """
+    if not isinstance(body_data, dict):
+        raise ValueError('Body must be a JSON object')
+    if any(not body_data.get(column) for column in ('name', 'price_text', 'category')):
+        raise ValueError('Name, price_text and category are required')
+    values = {'price_num': 0, 'is_available': True, **parse_patch(body_data, PRODUCT_PATCH_COLUMNS, PRODUCT_COLUMN_LENGTHS)}
+    return tuple(values.get(column) for column in PRODUCT_PATCH_COLUMNS)
+
+PRODUCT_PATCH_COLUMNS = {
+    'name': 'required',
+    'description': 'optional',
+    'price_text': 'required',
+    'price_num': 'int',
+    'category': 'required',
+    'image_url': 'optional',
+    'is_available': 'bool'
+}
+# Длины VARCHAR-колонок products (V0003): длинная строка - 400 для товара, а не ошибка базы
+PRODUCT_COLUMN_LENGTHS = {'name': 500, 'price_text': 100, 'category': 100, 'image_url': 1000}
+
+def parse_patch(body_data: Any, columns: Dict[str, str], lengths: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """
+    Переданные в теле PATCH поля, приведённые к значениям колонок
+    columns - колонка -> вид: required (непустая строка), optional (пустая строка -> NULL), int, bool
+    lengths - наибольшая длина строковых колонок
+    """
+    if not isinstance(body_data, dict):
+        raise ValueError('Body must be a JSON object')
+    changes: Dict[str, Any] = {}
+    for column, kind in columns.items():
+        if column not in body_data:
+            continue
+        value = body_data[column]
+        if kind in ('required', 'optional'):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f'{column} must be a string')
+            value = (value or '').strip() or None
+            if kind == 'required' and value is None:
+                raise ValueError(f'{column} cannot be empty')
+            if value is not None and lengths and len(value) > lengths.get(column, len(value)):
+                raise ValueError(f'{column} must be at most {lengths[column]} characters')
+        elif kind == 'int' and (isinstance(value, bool) or not isinstance(value, int) or not INT_MIN <= value <= INT_MAX):
+            raise ValueError(f'{column} must be an integer')
+        elif kind == 'bool' and not isinstance(value, bool):
+            raise ValueError(f'{column} must be true or false')
+        changes[column] = value
+    return changes
+
+def patch_row(cur, table: str, row_id: Any, changes: Dict[str, Any], returning: str,
+              versions: Optional[List[datetime]] = None) -> Tuple[Optional[Tuple], str]:
+    """
+    UPDATE только переданных колонок; если значения совпадают с текущими, строка не переписывается
+    и updated_at не меняется. versions - ожидаемые версии из If-Match, returning должен включать updated_at
+    Возвращает (строка или None, 'updated' | 'unchanged' | 'conflict')
+    """
+    condition, condition_args = version_condition(versions)
+    if changes:
+        columns = ', '.join(changes)
+        cur.execute(
+            f"""UPDATE {table}
+               SET {', '.join(f'{column} = %s' for column in changes)}, updated_at = CURRENT_TIMESTAMP
+               WHERE id = %s{condition} AND ({columns}) IS DISTINCT FROM ({', '.join(['%s'] * len(changes))})
+               RETURNING {returning}""",
+            [*changes.values(), row_id, *condition_args, *changes.values()]
+        )
+        row = cur.fetchone()
+        if row:
+            return row, 'updated'
+    cur.execute(f"SELECT {returning} FROM {table} WHERE id = %s", (row_id,))
+    row = cur.fetchone()
+    if row and versions is not None:
+        updated_at = row[[column.name for column in cur.description].index('updated_at')]
+        if (updated_at or VERSION_EPOCH) not in versions:
+            return row, 'conflict'
+    return row, 'unchanged'
+
+def handle_batch(event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Пакет изменений товаров в одной транзакции
+    POST /?batch=true - body: {operations: [{op: 'create', data}, {op: 'update', id, data}, {op: 'delete', id}]}
+    Ответ: {results: [{index, op, status, id, product | error}], succeeded, failed}
+    Невалидные операции (типы и длины полей проверяются до базы) и ненайденные товары отмечаются в results,
+    остальные применяются; ошибка базы данных откатывает весь пакет
+    """
+    try:
+        operations = json.loads(event.get('body') or '{}').get('operations')
+    except (ValueError, AttributeError):
+        operations = None
+    if not isinstance(operations, list) or not operations:
+        return error_response(400, 'operations must be a non-empty list')
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return error_response(413, f'Too many operations, maximum is {BATCH_MAX_OPERATIONS}')
+    
+    results: List[Dict[str, Any]] = []
+    creates: List[Tuple[int, Tuple]] = []
+    updates: List[Tuple[int, Tuple]] = []
+    deletes: List[Tuple[int, int]] = []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        result: Dict[str, Any] = {'index': index, 'op': op}
+        results.append(result)
+        try:
+            if op not in ('create', 'update', 'delete'):
+                raise ValueError('op must be create, update or delete')
+            data = operation.get('data') or {}
+            if not isinstance(data, dict):
+                raise ValueError('data must be an object')
+            if op == 'create':
+                creates.append((index, product_values(data)))
+                continue
+            
+            product_id = parse_id_param(str(operation.get('id', '')))
+            result['id'] = product_id
+            if product_id in seen_ids:
+                raise ValueError('Product appears more than once in the batch')
+            seen_ids.add(product_id)
+            if op == 'update':
+                updates.append((index, (product_id, *product_values(data))))
+            else:
+                deletes.append((index, product_id))
+        except ValueError as e:
+            result.update(status=400, error=str(e))
+    
+    if creates or updates or deletes:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            if creates:
+                rows = psycopg2.extras.execute_values(
+                    cur,
+                    f"""INSERT INTO products (name, description, price_text, price_num, category, image_url, is_available)
+                       VALUES %s RETURNING {PRODUCT_COLUMNS}""",
+                    [values for _, values in creates],
+                    page_size=len(creates),
+                    fetch=True
+                )
+                for (index, _), product in zip(creates, rows_to_dicts(cur.description, rows, PRODUCT_FIELDS)):
+                    results[index].update(status=201, id=product['id'], product=product)
+            
+            if updates:
+                rows = psycopg2.extras.execute_values(
+                    cur,
+                    f"""UPDATE products p
+                       SET name = v.name, description = v.description, price_text = v.price_text, price_num = v.price_num,
+                           category = v.category, image_url = v.image_url, is_available = v.is_available, updated_at = CURRENT_TIMESTAMP
+                       FROM (VALUES %s) AS v({PRODUCT_COLUMNS})
+                       WHERE p.id = v.id
+                       RETURNING {', '.join(f'p.{column}' for column in PRODUCT_COLUMNS.split(', '))}""",
+                    [values for _, values in updates],
+                    template=PRODUCT_UPDATE_TEMPLATE,
+                    page_size=len(updates),
+                    fetch=True
+                )
+                updated = {product['id']: product for product in rows_to_dicts(cur.description, rows, PRODUCT_FIELDS)}
+                for index, values in updates:
+                    if values[0] in updated:
+                        results[index].update(status=200, product=updated[values[0]])
+                    else:
+                        results[index].update(status=404, error='Product not found')
+            
+            if deletes:
+                cur.execute("DELETE FROM products WHERE id = ANY(%s) RETURNING id", ([product_id for _, product_id in deletes],))
+                deleted = {row[0] for row in cur.fetchall()}
+                for index, product_id in deletes:
+                    if product_id in deleted:
+                        results[index].update(status=200)
+                    else:
+                        results[index].update(status=404, error='Product not found')
+            
+            commit_write(conn, 'products')
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            # Сюда доходят только ошибки, которые не поймала проверка операций; текст SQL клиенту не отдаём
+            conn.rollback()
+            log_event({'event': 'batch_rolled_back', 'error': type(e).__name__, 'pgcode': e.pgcode})
+            return error_response(400, 'Batch rolled back: the database rejected one of the operations')
+        except Exception as e:
+            conn.rollback()
+            return error_response(500, str(e))
+        finally:
+            cur.close()
+            release_db_connection(conn)
+    
+    failed = sum(1 for result in results if 'error' in result)
+    return json_response(200, {'results': results, 'succeeded': len(results) - failed, 'failed': failed}, event)
+
+def validate_write(method: str, params: Dict[str, str], event: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """
+    Проверка записи до подключения к базе: ответы 400, 405 и 412 не открывают соединение
+    Возвращает разобранный запрос {id, values | changes, versions} и None или готовый ответ с ошибкой
+    """
+    request: Dict[str, Any] = {}
+    if method not in ('POST', 'PUT', 'PATCH', 'DELETE'):
+        return request, error_response(405, 'Method not allowed')
+    if method != 'POST' and not params.get('id'):
+        return request, error_response(400, 'Product ID is required')
+    
+    try:
+        if method != 'POST':
+            request['id'] = parse_id_param(params['id'])
+        if method in ('POST', 'PUT'):
+            request['values'] = product_values(json.loads(event.get('body') or '{}'))
+        elif method == 'PATCH':
+            request['changes'] = parse_patch(json.loads(event.get('body') or '{}'), PRODUCT_PATCH_COLUMNS, PRODUCT_COLUMN_LENGTHS)
+    except ValueError as e:
+        return request, error_response(400, str(e))
+    
+    if method != 'POST':
+        try:
+            request['versions'] = parse_if_match(event, request['id'])
+        except ValueError:
+            return request, precondition_failed_response()
+    return request, None
+
+@instrumented('products')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Обработчик запросов для управления товарами
     GET / - получить все товары
+    GET /?limit=20&category=Вазы&available=true&min_price=1000&max_price=5000 - страница товаров,
+        курсор следующей страницы возвращается в заголовке X-Next-Cursor (GET /?cursor=...)
+    GET /?q=ваза берёза - поиск по названию, категории и описанию с ранжированием (до limit результатов)
+    GET /?fields=id,name,price,image - только перечисленные поля в списке и поиске (id есть всегда),
+        остальные колонки не читаются из базы (см. PRODUCT_FIELD_COLUMNS)
     GET /?id=123 - получить конкретный товар
+    GET /?ids=3,1,2 - несколько товаров одним запросом: {items, missing}, items в порядке ids,
+        missing - id, которых нет в каталоге; не больше PRODUCTS_MAX_IDS id, fields= тоже работает
+    GET /?facets=true&category=Вазы - счётчики по категориям, наличию и ценовым диапазонам (см. load_facets)
+    GET /?cache_stats=true - счётчики кэша ответов
+    GET-ответы несут ETag и Cache-Control, на If-None-Match с тем же ETag отвечаем 304
     POST / - создать товар (body: {name, description, price_text, price_num, category, image_url, is_available})
     PUT /?id=123 - обновить товар
+    PATCH /?id=123 - обновить только переданные поля; без изменений запись не выполняется
+    PUT, PATCH и DELETE с If-Match: <ETag из GET /?id=> пишут только поверх этой версии, иначе 412
     DELETE /?id=123 - удалить товар
+    POST /?bulk=import, GET /?bulk=export - пакетная загрузка и выгрузка CSV/NDJSON (см. handle_bulk)
+    POST /?batch=true - создание, обновление и удаление нескольких товаров в одной транзакции (см. handle_batch)
+    Запись помечает снимок списка catalog/products.<хэш>.json устаревшим, новый выкладывает функция catalog-snapshots
     """
     method: str = event.get('httpMethod', 'GET')
     
@@ -28,23 +1127,64 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token, X-Admin-Secret, If-None-Match, If-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    params = event.get('queryStringParameters', {}) or {}
+    if params.get('bulk'):
+        return handle_bulk(event, method, params)
+    if params.get('batch'):
+        if method != 'POST':
+            return error_response(405, 'Use POST ?batch=true')
+        return handle_batch(event)
+    
+    if method == 'GET':
+        if params.get('cache_stats'):
+            return cache_stats_response()
+        cache_key = make_cache_key('products', params)
+        if_none_match = get_request_header(event, 'If-None-Match')
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached_response(cached, event)
+        try:
+            product_id = parse_id_param(params['id']) if params.get('id') else None
+            if not params.get('facets') and product_id is None:
+                if params.get('ids'):
+                    ids = parse_ids_param(params['ids'], PRODUCTS_MAX_IDS)
+                    columns = parse_product_fields(params.get('fields'))
+                else:
+                    list_query = build_products_list_query(params)
+        except ValueError as e:
+            return error_response(400, str(e))
+    else:
+        request, error = validate_write(method, params, event)
+        if error is not None:
+            return error
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         if method == 'GET':
-            params = event.get('queryStringParameters', {}) or {}
-            product_id = params.get('id')
+            headers = {
+                **JSON_HEADERS,
+                'Access-Control-Expose-Headers': 'X-Next-Cursor, ETag',
+                'Cache-Control': cache_control_header(),
+                'Vary': 'Accept-Encoding'
+            }
             
-            if product_id:
+            if params.get('facets'):
+                # Фасеты каталога: категории, наличие и ценовые диапазоны
+                result, versions = load_facets(cur, params.get('category'))
+                headers['ETag'] = compute_etag(cache_key, versions)
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+            elif product_id is not None:
                 # Получить один товар
                 cur.execute(
                     "SELECT id, name, description, price_text, price_num, category, image_url, is_available, created_at, updated_at FROM products WHERE id = %s",
@@ -52,211 +1192,113 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 )
                 row = cur.fetchone()
                 if not row:
-                    return {
-                        'statusCode': 404,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'body': json.dumps({'error': 'Product not found'}),
-                        'isBase64Encoded': False
-                    }
+                    return error_response(404, 'Product not found')
+                
+                headers['ETag'] = version_etag(row[0], row[9])
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
                 
-                result = {
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'price': row[3],
-                    'priceNum': row[4],
-                    'category': row[5],
-                    'image': row[6],
-                    'available': row[7],
-                    'created_at': row[8].isoformat() if row[8] else None,
-                    'updated_at': row[9].isoformat() if row[9] else None
-                }
+                result = rows_to_dicts(cur.description, [row], PRODUCT_DETAIL_FIELDS)[0]
+            elif params.get('ids'):
+                # Несколько товаров по id (корзина, избранное) вместо отдельного запроса на каждый
+                rows, missing = load_products_by_ids(cur, ids, columns)
+                headers['ETag'] = compute_etag(cache_key, ((row[0], row[-1]) for row in rows))
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                result = {'items': rows_to_dicts(cur.description, rows, PRODUCT_FIELDS), 'missing': missing}
             else:
-                # Получить все товары
-                cur.execute(
-                    "SELECT id, name, description, price_text, price_num, category, image_url, is_available FROM products ORDER BY created_at DESC"
-                )
+                # Получить список товаров с фильтрами и постраничной выдачей
+                sql, args, limit = list_query
+                cur.execute(sql, args)
                 rows = cur.fetchall()
-                result = [{
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'price': row[3],
-                    'priceNum': row[4],
-                    'category': row[5],
-                    'image': row[6],
-                    'available': row[7]
-                } for row in rows]
+                if not rows and params.get('q', '').strip():
+                    # Ничего не нашлось по словам - пробуем нечёткий поиск, устойчивый к опечаткам
+                    sql, args, limit = build_products_list_query(params, fuzzy=True)
+                    cur.execute(sql, args)
+                    rows = cur.fetchall()
+                if limit is not None and len(rows) > limit:
+                    rows = rows[:limit]
+                    if not params.get('q', '').strip():
+                        last = rows[-1]
+                        headers['X-Next-Cursor'] = encode_cursor(last[-2], last[0])
+                
+                headers['ETag'] = compute_etag(cache_key, ((row[0], row[-1]) for row in rows))
+                if etag_matches(if_none_match, headers['ETag']):
+                    return not_modified_response(headers)
+                result = rows_to_dicts(cur.description, rows, PRODUCT_FIELDS)
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            body = dumps(result)
+            response_cache.set(cache_key, headers, body)
+            return build_response(200, body, {**headers, 'X-Cache': 'MISS'}, event)
         
         elif method == 'POST':
             # Создать товар
-            body_data = json.loads(event.get('body', '{}'))
-            name = body_data.get('name', '').strip()
-            description = body_data.get('description', '').strip()
-            price_text = body_data.get('price_text', '').strip()
-            price_num = body_data.get('price_num', 0)
-            category = body_data.get('category', '').strip()
-            image_url = body_data.get('image_url', '').strip()
-            is_available = body_data.get('is_available', True)
-            
-            if not name or not price_text or not category:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Name, price_text and category are required'}),
-                    'isBase64Encoded': False
-                }
-            
             cur.execute(
                 """INSERT INTO products (name, description, price_text, price_num, category, image_url, is_available) 
                    VALUES (%s, %s, %s, %s, %s, %s, %s) 
-                   RETURNING id, name, description, price_text, price_num, category, image_url, is_available""",
-                (name, description if description else None, price_text, price_num, category, image_url if image_url else None, is_available)
+                   RETURNING id, name, description, price_text, price_num, category, image_url, is_available, updated_at""",
+                request['values']
             )
             row = cur.fetchone()
-            conn.commit()
+            commit_write(conn, 'products')
             
-            result = {
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'price': row[3],
-                'priceNum': row[4],
-                'category': row[5],
-                'image': row[6],
-                'available': row[7]
-            }
+            result = rows_to_dicts(cur.description, [row], PRODUCT_FIELDS)[0]
             
-            return {
-                'statusCode': 201,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(201, result, headers=version_headers(cur, row))
         
         elif method == 'PUT':
             # Обновить товар
-            params = event.get('queryStringParameters', {}) or {}
-            product_id = params.get('id')
-            
-            if not product_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Product ID is required'}),
-                    'isBase64Encoded': False
-                }
-            
-            body_data = json.loads(event.get('body', '{}'))
-            name = body_data.get('name', '').strip()
-            description = body_data.get('description', '').strip()
-            price_text = body_data.get('price_text', '').strip()
-            price_num = body_data.get('price_num', 0)
-            category = body_data.get('category', '').strip()
-            image_url = body_data.get('image_url', '').strip()
-            is_available = body_data.get('is_available', True)
-            
-            if not name or not price_text or not category:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Name, price_text and category are required'}),
-                    'isBase64Encoded': False
-                }
-            
+            product_id = request['id']
+            condition, condition_args = version_condition(request['versions'])
             cur.execute(
-                """UPDATE products 
+                f"""UPDATE products 
                    SET name = %s, description = %s, price_text = %s, price_num = %s, category = %s, image_url = %s, is_available = %s, updated_at = CURRENT_TIMESTAMP 
-                   WHERE id = %s
-                   RETURNING id, name, description, price_text, price_num, category, image_url, is_available""",
-                (name, description if description else None, price_text, price_num, category, image_url if image_url else None, is_available, product_id)
+                   WHERE id = %s{condition}
+                   RETURNING id, name, description, price_text, price_num, category, image_url, is_available, updated_at""",
+                (*request['values'], product_id, *condition_args)
             )
             row = cur.fetchone()
             
             if not row:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Product not found'}),
-                    'isBase64Encoded': False
-                }
+                return missing_or_conflict(cur, 'products', product_id, 'Product')
             
-            conn.commit()
+            commit_write(conn, 'products')
             
-            result = {
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'price': row[3],
-                'priceNum': row[4],
-                'category': row[5],
-                'image': row[6],
-                'available': row[7]
-            }
+            result = rows_to_dicts(cur.description, [row], PRODUCT_FIELDS)[0]
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps(result, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            return json_response(200, result, headers=version_headers(cur, row))
         
-        elif method == 'DELETE':
-            # Удалить товар
-            params = event.get('queryStringParameters', {}) or {}
-            product_id = params.get('id')
+        elif method == 'PATCH':
+            # Частично обновить товар: пишутся только переданные и изменившиеся поля
+            product_id = request['id']
+            row, outcome = patch_row(cur, 'products', product_id, request['changes'], f'{PRODUCT_COLUMNS}, updated_at', request['versions'])
+            if not row:
+                return error_response(404, 'Product not found')
+            if outcome == 'conflict':
+                return precondition_failed_response(row_etag(cur, row))
             
-            if not product_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Product ID is required'}),
-                    'isBase64Encoded': False
-                }
+            if outcome == 'updated':
+                commit_write(conn, 'products')
             
-            cur.execute("DELETE FROM products WHERE id = %s RETURNING id", (product_id,))
+            return json_response(200, rows_to_dicts(cur.description, [row], PRODUCT_FIELDS)[0], headers=version_headers(cur, row))
+        
+        elif method == 'DELETE':
+            # Удалить товар
+            product_id = request['id']
+            condition, condition_args = version_condition(request['versions'])
+            cur.execute(f"DELETE FROM products WHERE id = %s{condition} RETURNING id", (product_id, *condition_args))
             row = cur.fetchone()
             
             if not row:
-                return {
-                    'statusCode': 404,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'body': json.dumps({'error': 'Product not found'}),
-                    'isBase64Encoded': False
-                }
+                return missing_or_conflict(cur, 'products', product_id, 'Product')
             
-            conn.commit()
+            commit_write(conn, 'products')
             
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'success': True, 'id': row[0]}),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
+            return json_response(200, {'success': True, 'id': row[0]})
     
     except Exception as e:
         conn.rollback()
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return error_response(500, str(e))
     finally:
         cur.close()
-        conn.close()
+        release_db_connection(conn)
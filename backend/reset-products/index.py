@@ -1,198 +1,306 @@
 """
 API для сброса и загрузки всех товаров
 ВНИМАНИЕ: Удаляет ВСЕ товары и загружает новые
+Каталог сводится к initial_products() одной транзакцией через промежуточную таблицу:
+меняются только отличающиеся строки, читатели не ждут блокировок
+Сброс помечает снимок каталога в бакете устаревшим, новый выкладывает функция catalog-snapshots
 """
 import json
 import os
-import psycopg2
-from typing import Dict, Any, List
+import time
+from typing import Dict, Any, Iterable, List, Optional
 
-INITIAL_PRODUCTS = [
-    {
-        "name": "Ваза из осины №111",
-        "description": "Размер 20,5×16 см, высота 10 см. Плавные линии осины создают изящную форму, будто созданную самим ветром.",
-        "price_text": "2 500 ₽",
-        "price_num": 2500,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_939a7e38.jpg"
-    },
-    {
-        "name": "Шкатулка из берёзы №113",
-        "description": "Размер 12×10 см, высота 8 см. Природная фактура берёзы с тёмными включениями создаёт живописный узор.",
-        "price_text": "1 500 ₽",
-        "price_num": 1500,
-        "category": "Шкатулки",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_999fa5cc.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №133",
-        "description": "Размер 19×21 см, высота 13 см. Объёмная форма с необычным основанием, подчёркивающая текстуру древесины.",
-        "price_text": "3 000 ₽",
-        "price_num": 3000,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_2650fca9.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №92",
-        "description": "Размер 20×16 см, высота 12 см. Волнистые края и органичная форма создают эффект морской раковины.",
-        "price_text": "3 000 ₽",
-        "price_num": 3000,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.43_9e50f45d.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №114",
-        "description": "Размер 25×28 см, высота 19 см. Крупная ваза с выразительной текстурой и природными включениями.",
-        "price_text": "9 000 ₽",
-        "price_num": 9000,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_0a58527b.jpg"
-    },
-    {
-        "name": "Шкатулка из капа берёзы №21",
-        "description": "Размер 11×11 см, высота 11 см. Компактная шкатулка с уникальным рисунком капа и природной фактурой.",
-        "price_text": "1 700 ₽",
-        "price_num": 1700,
-        "category": "Шкатулки",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_2aa4c392.jpg"
-    },
-    {
-        "name": "Подсвечник из бузины №42",
-        "description": "Размер 10×10 см, высота 22 см. Высокий элегантный подсвечник с естественными наростами.",
-        "price_text": "1 000 ₽",
-        "price_num": 1000,
-        "category": "Подсвечники",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_2ba5876e.jpg"
-    },
-    {
-        "name": "Конфетница из берёзы №77",
-        "description": "Размер 16×13 см, высота 13 см. Утончённая форма на изящной ножке с природными узорами.",
-        "price_text": "1 700 ₽",
-        "price_num": 1700,
-        "category": "Конфетницы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_6b1b3824.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №115",
-        "description": "Размер 24×12 см, высота 13 см. Необычная раздвоенная форма, напоминающая природную расщелину.",
-        "price_text": "2 700 ₽",
-        "price_num": 2700,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_6c752827.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №117",
-        "description": "Размер 39×29 см, высота 19,5 см. Крупная декоративная ваза с выраженной фактурой и органичным основанием.",
-        "price_text": "13 000 ₽",
-        "price_num": 13000,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_9ead7830.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №134",
-        "description": "Размер 23×23 см, высота 15 см. Тёмные природные включения создают контрастный рисунок на светлой древесине.",
-        "price_text": "9 000 ₽",
-        "price_num": 9000,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_682a1093.jpg"
-    },
-    {
-        "name": "Декоративная чаша из берёзы №104",
-        "description": "Размер 26×20 см, высота 8 см. Широкая чаша с золотистыми переливами и природной текстурой.",
-        "price_text": "По запросу",
-        "price_num": 0,
-        "category": "Декор",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.43_62c6a861.jpg"
-    },
-    {
-        "name": "Шкатулка из черёмухи/берёзы №119",
-        "description": "Комбинированная работа с контрастом светлой берёзы и тёмной черёмухи. Уникальное сочетание пород.",
-        "price_text": "1 700 ₽",
-        "price_num": 1700,
-        "category": "Шкатулки",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_46d33e20.jpg"
-    },
-    {
-        "name": "Ваза из черёмухи №110",
-        "description": "Размер 21×16 см, высота 11 см. Фигурные края и насыщенный природный рисунок черёмухи с контрастными включениями.",
-        "price_text": "4 500 ₽",
-        "price_num": 4500,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_b9ad141e.jpg"
-    },
-    {
-        "name": "Ваза из капа берёзы №87",
-        "description": "Размер 23×10 см, высота 11 см. Золотистые оттенки капа с природными наростами и выразительной текстурой.",
-        "price_text": "2 500 ₽",
-        "price_num": 2500,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_da5fc4f9.jpg"
-    },
-    {
-        "name": "Конфетница из капа берёзы №29",
-        "description": "Размер 22×12 см, высота 5 см. Изящная плоская форма с мягкими линиями и мраморным узором капа.",
-        "price_text": "2 000 ₽",
-        "price_num": 2000,
-        "category": "Конфетницы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_ddef6712.jpg"
-    },
-    {
-        "name": "Декоративная ваза из берёзы №100",
-        "description": "Размер 17×13,5 см, высота 11,5 см. Органичная форма с природными линиями и мягкими переходами.",
-        "price_text": "2 000 ₽",
-        "price_num": 2000,
-        "category": "Декор",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_e2bd3762.jpg"
-    },
-    {
-        "name": "Шкатулка из капа берёзы №67",
-        "description": "Размер 14×13 см, высота 5 см. Двойная шкатулка с уникальным рисунком капа и природными включениями.",
-        "price_text": "1 500 ₽",
-        "price_num": 1500,
-        "category": "Шкатулки",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_efcc7889.jpg"
-    },
-    {
-        "name": "Конфетница из черёмухи №22",
-        "description": "Размер 14×18 см, высота 7 см. Богатейший рисунок капа с золотистыми переливами на изящной ножке.",
-        "price_text": "1 700 ₽",
-        "price_num": 1700,
-        "category": "Конфетницы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_5752bf2b.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №27",
-        "description": "Размер 17×12 см, высота 12 см. Свободная форма с плавными изгибами и контрастным основанием.",
-        "price_text": "2 800 ₽",
-        "price_num": 2800,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_50143ecd.jpg"
-    },
-    {
-        "name": "Декоративная композиция из берёзы №107",
-        "description": "Размер 37×29,5 см, высота 22 см. Впечатляющая скульптурная форма с выраженной текстурой и природными линиями.",
-        "price_text": "4 500 ₽",
-        "price_num": 4500,
-        "category": "Декор",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_68582e8d.jpg"
-    },
-    {
-        "name": "Ваза из берёзы №118",
-        "description": "Размер 31×27 см, высота 16 см. Изящная белоснежная ваза с утончёнными формами на органичном основании.",
-        "price_text": "9 000 ₽",
-        "price_num": 9000,
-        "category": "Вазы",
-        "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_afe33472.jpg"
-    }
-]
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает вызовы в тёплом контейнере,
+# DB_POOL_MIN_SIZE соединений остаются открытыми между вызовами.
+# psycopg2 импортируется при создании пула: OPTIONS и отказы 403/405 обходятся без него
+psycopg2: Any = None
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    """Ленивое создание пула подключений к базе данных"""
+    global _db_pool, psycopg2
+    if _db_pool is None or _db_pool.closed:
+        import psycopg2.pool
+        import psycopg2.extensions
+        import psycopg2.extras
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ['DATABASE_URL'])
+        _db_last_used.clear()
+    return _db_pool
+
+def _is_connection_alive(conn) -> bool:
+    """Проверка соединения, простаивавшего дольше DB_POOL_PING_AFTER секунд"""
+    if conn.closed:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    """Получение живого подключения из пула, устаревшие сокеты переоткрываются"""
+    pool = get_db_pool()
+    for _ in range(DB_POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        if _is_connection_alive(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def release_db_connection(conn) -> None:
+    """Возврат подключения в пул; открытая транзакция откатывается"""
+    pool = get_db_pool()
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+def initial_products() -> List[Dict[str, Any]]:
+    """Начальный каталог; список собирается при сбросе, а не при импорте модуля"""
+    return [
+        {
+            "name": "Ваза из осины №111",
+            "description": "Размер 20,5×16 см, высота 10 см. Плавные линии осины создают изящную форму, будто созданную самим ветром.",
+            "price_text": "2 500 ₽",
+            "price_num": 2500,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_939a7e38.jpg"
+        },
+        {
+            "name": "Шкатулка из берёзы №113",
+            "description": "Размер 12×10 см, высота 8 см. Природная фактура берёзы с тёмными включениями создаёт живописный узор.",
+            "price_text": "1 500 ₽",
+            "price_num": 1500,
+            "category": "Шкатулки",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_999fa5cc.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №133",
+            "description": "Размер 19×21 см, высота 13 см. Объёмная форма с необычным основанием, подчёркивающая текстуру древесины.",
+            "price_text": "3 000 ₽",
+            "price_num": 3000,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_2650fca9.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №92",
+            "description": "Размер 20×16 см, высота 12 см. Волнистые края и органичная форма создают эффект морской раковины.",
+            "price_text": "3 000 ₽",
+            "price_num": 3000,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.43_9e50f45d.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №114",
+            "description": "Размер 25×28 см, высота 19 см. Крупная ваза с выразительной текстурой и природными включениями.",
+            "price_text": "9 000 ₽",
+            "price_num": 9000,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_0a58527b.jpg"
+        },
+        {
+            "name": "Шкатулка из капа берёзы №21",
+            "description": "Размер 11×11 см, высота 11 см. Компактная шкатулка с уникальным рисунком капа и природной фактурой.",
+            "price_text": "1 700 ₽",
+            "price_num": 1700,
+            "category": "Шкатулки",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_2aa4c392.jpg"
+        },
+        {
+            "name": "Подсвечник из бузины №42",
+            "description": "Размер 10×10 см, высота 22 см. Высокий элегантный подсвечник с естественными наростами.",
+            "price_text": "1 000 ₽",
+            "price_num": 1000,
+            "category": "Подсвечники",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_2ba5876e.jpg"
+        },
+        {
+            "name": "Конфетница из берёзы №77",
+            "description": "Размер 16×13 см, высота 13 см. Утончённая форма на изящной ножке с природными узорами.",
+            "price_text": "1 700 ₽",
+            "price_num": 1700,
+            "category": "Конфетницы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_6b1b3824.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №115",
+            "description": "Размер 24×12 см, высота 13 см. Необычная раздвоенная форма, напоминающая природную расщелину.",
+            "price_text": "2 700 ₽",
+            "price_num": 2700,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_6c752827.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №117",
+            "description": "Размер 39×29 см, высота 19,5 см. Крупная декоративная ваза с выраженной фактурой и органичным основанием.",
+            "price_text": "13 000 ₽",
+            "price_num": 13000,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_9ead7830.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №134",
+            "description": "Размер 23×23 см, высота 15 см. Тёмные природные включения создают контрастный рисунок на светлой древесине.",
+            "price_text": "9 000 ₽",
+            "price_num": 9000,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_682a1093.jpg"
+        },
+        {
+            "name": "Декоративная чаша из берёзы №104",
+            "description": "Размер 26×20 см, высота 8 см. Широкая чаша с золотистыми переливами и природной текстурой.",
+            "price_text": "По запросу",
+            "price_num": 0,
+            "category": "Декор",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.43_62c6a861.jpg"
+        },
+        {
+            "name": "Шкатулка из черёмухи/берёзы №119",
+            "description": "Комбинированная работа с контрастом светлой берёзы и тёмной черёмухи. Уникальное сочетание пород.",
+            "price_text": "1 700 ₽",
+            "price_num": 1700,
+            "category": "Шкатулки",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_46d33e20.jpg"
+        },
+        {
+            "name": "Ваза из черёмухи №110",
+            "description": "Размер 21×16 см, высота 11 см. Фигурные края и насыщенный природный рисунок черёмухи с контрастными включениями.",
+            "price_text": "4 500 ₽",
+            "price_num": 4500,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_b9ad141e.jpg"
+        },
+        {
+            "name": "Ваза из капа берёзы №87",
+            "description": "Размер 23×10 см, высота 11 см. Золотистые оттенки капа с природными наростами и выразительной текстурой.",
+            "price_text": "2 500 ₽",
+            "price_num": 2500,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_da5fc4f9.jpg"
+        },
+        {
+            "name": "Конфетница из капа берёзы №29",
+            "description": "Размер 22×12 см, высота 5 см. Изящная плоская форма с мягкими линиями и мраморным узором капа.",
+            "price_text": "2 000 ₽",
+            "price_num": 2000,
+            "category": "Конфетницы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_ddef6712.jpg"
+        },
+        {
+            "name": "Декоративная ваза из берёзы №100",
+            "description": "Размер 17×13,5 см, высота 11,5 см. Органичная форма с природными линиями и мягкими переходами.",
+            "price_text": "2 000 ₽",
+            "price_num": 2000,
+            "category": "Декор",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_e2bd3762.jpg"
+        },
+        {
+            "name": "Шкатулка из капа берёзы №67",
+            "description": "Размер 14×13 см, высота 5 см. Двойная шкатулка с уникальным рисунком капа и природными включениями.",
+            "price_text": "1 500 ₽",
+            "price_num": 1500,
+            "category": "Шкатулки",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_efcc7889.jpg"
+        },
+        {
+            "name": "Конфетница из черёмухи №22",
+            "description": "Размер 14×18 см, высота 7 см. Богатейший рисунок капа с золотистыми переливами на изящной ножке.",
+            "price_text": "1 700 ₽",
+            "price_num": 1700,
+            "category": "Конфетницы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_5752bf2b.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №27",
+            "description": "Размер 17×12 см, высота 12 см. Свободная форма с плавными изгибами и контрастным основанием.",
+            "price_text": "2 800 ₽",
+            "price_num": 2800,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_50143ecd.jpg"
+        },
+        {
+            "name": "Декоративная композиция из берёзы №107",
+            "description": "Размер 37×29,5 см, высота 22 см. Впечатляющая скульптурная форма с выраженной текстурой и природными линиями.",
+            "price_text": "4 500 ₽",
+            "price_num": 4500,
+            "category": "Декор",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_68582e8d.jpg"
+        },
+        {
+            "name": "Ваза из берёзы №118",
+            "description": "Размер 31×27 см, высота 16 см. Изящная белоснежная ваза с утончёнными формами на органичном основании.",
+            "price_text": "9 000 ₽",
+            "price_num": 9000,
+            "category": "Вазы",
+            "image_url": "https://cdn.poehali.dev/files/Изображение WhatsApp 2024-10-19 в 10.13.44_afe33472.jpg"
+        }
+    ]
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+def dumps(data: Any) -> str:
+    """JSON без экранирования кириллицы, через orjson, если он установлен"""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False)
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Заголовок запроса без учёта регистра"""
+    headers = event.get('headers') or {}
+    lower_name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower_name:
+            return value
+    return None
+
+def json_response(status: int, data: Any) -> Dict[str, Any]:
+    """JSON-ответ с CORS"""
+    return {'statusCode': status, 'headers': JSON_HEADERS, 'body': dumps(data), 'isBase64Encoded': False}
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    """Ответ с ошибкой {'error': message}"""
+    return json_response(status, {'error': message})
+
+def mark_snapshots_stale(cur, names: Iterable[str]) -> None:
+    """
+    Помечает снимки списков names устаревшими в транзакции записи; выкладывает их функция catalog-snapshots
+    Метка ставится последней перед commit: строка catalog_snapshots заблокирована только до фиксации
+    """
+    cur.execute(
+        """UPDATE catalog_snapshots
+           SET stale_since = COALESCE(stale_since, CURRENT_TIMESTAMP), stale_version = stale_version + 1
+           WHERE name = ANY(%s)""",
+        (list(names),)
+    )
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Сбрасывает базу товаров и загружает начальные данные
-    POST / - удалить все товары и загрузить INITIAL_PRODUCTS
+    POST / - привести каталог к initial_products()
+    Возвращает: {success, message, count, inserted, updated, deleted, elapsed_ms}
     Требует заголовок X-Admin-Secret с правильным ключом
     """
     method: str = event.get('httpMethod', 'GET')
@@ -211,70 +319,91 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return error_response(405, 'Method not allowed')
     
-    headers = event.get('headers', {})
-    admin_secret = headers.get('X-Admin-Secret') or headers.get('x-admin-secret')
+    admin_secret = get_request_header(event, 'X-Admin-Secret')
     expected_secret = os.environ.get('ADMIN_SECRET_KEY')
     
     if not expected_secret or admin_secret != expected_secret:
-        return {
-            'statusCode': 403,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Forbidden: Invalid admin secret'}),
-            'isBase64Encoded': False
-        }
+        return error_response(403, 'Forbidden: Invalid admin secret')
     
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        cur.execute("DELETE FROM products")
+        started = time.monotonic()
+        # Параллельные сбросы выполняются по очереди; SELECT в products не блокируется
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('reset-products'))")
+        cur.execute("SET LOCAL lock_timeout = '5s'")
+        cur.execute(
+            """CREATE TEMP TABLE products_reset (
+                   name VARCHAR(500), description TEXT, price_text VARCHAR(100),
+                   price_num INTEGER, category VARCHAR(100), image_url VARCHAR(1000)
+               ) ON COMMIT DROP"""
+        )
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO products_reset (name, description, price_text, price_num, category, image_url) VALUES %s",
+            [(
+                product['name'],
+                product['description'],
+                product['price_text'],
+                product['price_num'],
+                product['category'],
+                product.get('image_url')
+            ) for product in initial_products()]
+        )
+        
+        # Товары сопоставляются по названию; дубликаты и лишние товары удаляются
+        cur.execute(
+            """WITH ranked AS (
+                   SELECT id, name, row_number() OVER (PARTITION BY name ORDER BY id) AS rn FROM products
+               )
+               DELETE FROM products p USING ranked r
+               WHERE p.id = r.id
+                 AND (r.rn > 1 OR NOT EXISTS (SELECT 1 FROM products_reset s WHERE s.name = r.name))"""
+        )
+        deleted = cur.rowcount
         
-        for product in INITIAL_PRODUCTS:
-            cur.execute(
-                """INSERT INTO products (name, description, price_text, price_num, category, image_url, is_available) 
-                   VALUES (%s, %s, %s, %s, %s, %s, %s)""",
-                (
-                    product['name'],
-                    product['description'],
-                    product['price_text'],
-                    product['price_num'],
-                    product['category'],
-                    product.get('image_url'),
-                    True
-                )
-            )
+        cur.execute(
+            """UPDATE products p
+               SET description = s.description, price_text = s.price_text, price_num = s.price_num,
+                   category = s.category, image_url = s.image_url, is_available = true, updated_at = CURRENT_TIMESTAMP
+               FROM products_reset s
+               WHERE p.name = s.name
+                 AND (p.description, p.price_text, p.price_num, p.category, p.image_url, p.is_available)
+                     IS DISTINCT FROM (s.description, s.price_text, s.price_num, s.category, s.image_url, true)"""
+        )
+        updated = cur.rowcount
         
+        cur.execute(
+            """INSERT INTO products (name, description, price_text, price_num, category, image_url, is_available)
+               SELECT s.name, s.description, s.price_text, s.price_num, s.category, s.image_url, true
+               FROM products_reset s
+               WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.name = s.name)"""
+        )
+        inserted = cur.rowcount
+        
+        if inserted or updated or deleted:
+            mark_snapshots_stale(cur, ('products',))
         conn.commit()
         
         cur.execute("SELECT COUNT(*) FROM products")
         count = cur.fetchone()[0]
         
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({
-                'success': True,
-                'message': f'База обновлена. Загружено {count} товаров',
-                'count': count
-            }, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {
+            'success': True,
+            'message': f'База обновлена. Загружено {count} товаров',
+            'count': count,
+            'inserted': inserted,
+            'updated': updated,
+            'deleted': deleted,
+            'elapsed_ms': round((time.monotonic() - started) * 1000)
+        })
         
     except Exception as e:
         conn.rollback()
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return error_response(500, str(e))
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
@@ -1,19 +1,637 @@
 """
 API для загрузки изображений товаров в S3
-Принимает изображение в base64, сохраняет в S3 и возвращает CDN URL
+Принимает изображение в base64, проверяет формат по сигнатуре, удаляет EXIF,
+нарезает адаптивные размеры с WebP-вариантами и возвращает CDN URL и srcset-манифест
+Для больших файлов выдаёт presigned URL частей multipart-загрузки: файл идёт
+из браузера прямо в бакет, минуя функцию
+Ключи адресуются SHA-256 исходного файла: повторная загрузка того же файла находит
+манифест в uploaded_images и не кладёт в бакет ничего нового, а объекты неизменяемы
+и отдаются с Cache-Control: immutable на год
 """
+import io
 import json
 import os
-import boto3
+import re
+import math
+import time
+import hashlib
+import functools
+import contextvars
+import threading
 import base64
-import uuid
-from typing import Dict, Any
+import gzip
+from contextlib import contextmanager
+from typing import Dict, Any, BinaryIO, List, Optional, Tuple
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+REQUEST_LOG_ENABLED = os.environ.get('REQUEST_LOG', 'true').lower() in ('true', '1')
+
+class RequestTimings:
+    """Время одного вызова по фазам: длительность, число операций, строки и байты"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, phase: str, elapsed: float, rows: int = 0, size: int = 0) -> None:
+        with self._lock:
+            stats = self.phases.setdefault(phase, {'ms': 0.0, 'count': 0, 'rows': 0, 'bytes': 0})
+            stats['ms'] += elapsed * 1000
+            stats['count'] += 1
+            stats['rows'] += max(rows, 0)
+            stats['bytes'] += size
+    
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+    
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        entries = [f'{phase};dur={stats["ms"]:.1f};desc="{stats["count"]}x"' for phase, stats in self.phases.items()]
+        entries.append(f'total;dur={self.elapsed_ms():.1f}')
+        return ', '.join(entries)
+
+_request_timings: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+
+@contextmanager
+def measure(phase: str):
+    """Замер фазы текущего вызова; в словарь можно записать rows и bytes. Вне вызова ничего не делает"""
+    sample = {'rows': 0, 'bytes': 0}
+    timings = _request_timings.get()
+    started = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - started, sample['rows'], sample['bytes'])
+
+def log_event(entry: Dict[str, Any]) -> None:
+    """Структурированная строка лога (одна JSON-строка в stdout)"""
+    print(json.dumps(entry, ensure_ascii=False, default=str), flush=True)
+
+def instrumented(function_name: str):
+    """Декоратор обработчика: Server-Timing в ответе и строка лога с фазами вызова"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            timings = RequestTimings()
+            token = _request_timings.set(timings)
+            try:
+                response = func(event, context)
+            finally:
+                _request_timings.reset(token)
+            response['headers'] = {
+                **(response.get('headers') or {}),
+                'Server-Timing': timings.server_timing(),
+                'Timing-Allow-Origin': '*'
+            }
+            if REQUEST_LOG_ENABLED:
+                log_event({
+                    'event': 'request',
+                    'function': function_name,
+                    'method': event.get('httpMethod'),
+                    'params': event.get('queryStringParameters') or {},
+                    'status': response.get('statusCode'),
+                    'duration_ms': round(timings.elapsed_ms(), 1),
+                    'response_bytes': len(response.get('body') or ''),
+                    'phases': {phase: {**stats, 'ms': round(stats['ms'], 1)} for phase, stats in timings.phases.items()}
+                })
+            return response
+        return wrapper
+    return decorator
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает вызовы в тёплом контейнере.
+# psycopg2 импортируется при первой проверке хэша: OPTIONS и ответы 400 обходятся без него
+psycopg2: Any = None
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    """Ленивое создание пула подключений к базе данных"""
+    global _db_pool, psycopg2
+    if _db_pool is None or _db_pool.closed:
+        import psycopg2.pool
+        import psycopg2.extensions
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ['DATABASE_URL'])
+        _db_last_used.clear()
+    return _db_pool
+
+def _is_connection_alive(conn) -> bool:
+    """Проверка соединения, простаивавшего дольше DB_POOL_PING_AFTER секунд"""
+    if conn.closed:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_db_connection():
+    """Получение живого подключения из пула, устаревшие сокеты переоткрываются"""
+    with measure('db_connect'):
+        pool = get_db_pool()
+        for _ in range(DB_POOL_MAX_SIZE + 1):
+            conn = pool.getconn()
+            if _is_connection_alive(conn):
+                return conn
+            _db_last_used.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def release_db_connection(conn) -> None:
+    """Возврат подключения в пул; открытая транзакция откатывается"""
+    pool = get_db_pool()
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+UPLOAD_PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(50 * 1024 * 1024)))
+UPLOAD_URL_EXPIRES = int(os.environ.get('UPLOAD_URL_EXPIRES', '3600'))
+UPLOAD_KEY_PREFIX = 'products/'
+# Исходники multipart-загрузок до обработки; удаляются сразу после неё (правило жизненного цикла бакета
+# может подчищать брошенные загрузки по этому префиксу)
+UPLOAD_INCOMING_PREFIX = 'products/incoming/'
+UPLOAD_HASH_CHUNK_SIZE = 1024 * 1024
+# Сколько байт исходника multipart-загрузки держать в памяти, остальное уходит во временный файл
+UPLOAD_SPOOL_SIZE = int(os.environ.get('UPLOAD_SPOOL_SIZE', str(2 * 1024 * 1024)))
+# Ключ варианта зависит только от содержимого исходника и IMAGE_VARIANT_SPEC, поэтому объект по URL никогда не меняется
+IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '10'))
+
+# Клиент создаётся при первой загрузке и переиспользуется тёплым контейнером;
+# boto3 импортируется только на путях, которые работают с S3
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def _s3_before_call(params: Dict[str, Any], context: Dict[str, Any], **kwargs) -> None:
+    """Начало замера запроса к S3 (событие botocore before-call)"""
+    body = params.get('body')
+    if isinstance(body, io.BytesIO):
+        body = body.getbuffer()
+    context['timing_started'] = time.perf_counter()
+    context['timing_bytes'] = len(body) if isinstance(body, (bytes, bytearray, memoryview)) else 0
+
+def _s3_after_call(http_response, context: Dict[str, Any], **kwargs) -> None:
+    """Время и объём запроса к S3 в фазу s3 текущего вызова"""
+    timings = _request_timings.get()
+    started = context.get('timing_started')
+    if timings is None or started is None:
+        return
+    received = int(http_response.headers.get('Content-Length') or 0)
+    timings.add('s3', time.perf_counter() - started, size=context.get('timing_bytes', 0) + received)
+
+def get_s3_client():
+    """Общий клиент S3 (S3_ENDPOINT_URL позволяет подменить хранилище локальным)"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+                _s3_client = boto3.client('s3',
+                    endpoint_url=S3_ENDPOINT_URL or None,
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+                    config=Config(
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                        connect_timeout=5,
+                        read_timeout=60,
+                        tcp_keepalive=True
+                    )
+                )
+                _s3_client.meta.events.register('before-call.s3', _s3_before_call)
+                _s3_client.meta.events.register('after-call.s3', _s3_after_call)
+    return _s3_client
+
+def cdn_url_for(key: str) -> str:
+    """Публичный CDN URL объекта в бакете"""
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+def guess_content_type(ext: str) -> str:
+    """Content-Type по расширению файла"""
+    content_type = 'image/jpeg'
+    if ext.lower() in ['png']:
+        content_type = 'image/png'
+    elif ext.lower() in ['gif']:
+        content_type = 'image/gif'
+    elif ext.lower() in ['webp']:
+        content_type = 'image/webp'
+    return content_type
+
+IMAGE_VARIANT_WIDTHS = sorted(int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '320,640,1280').split(','))
+IMAGE_EXTRA_FORMATS = [fmt.strip() for fmt in os.environ.get('IMAGE_EXTRA_FORMATS', 'webp').split(',') if fmt.strip()]
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', str(40 * 1000 * 1000)))
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', '8'))
+
+# Pillow, пул потоков и uuid импортируются внутри функций загрузки:
+# OPTIONS и ответы 400 не платят за них при холодном старте
+
+# Формат Pillow, Content-Type, расширение и параметры кодирования
+IMAGE_ENCODERS = {
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'image/png', 'png', {'optimize': True}),
+    'webp': ('WEBP', 'image/webp', 'webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'image/avif', 'avif', {'quality': 60})
+}
+
+# Отпечаток настроек нарезки: ширины, форматы и параметры кодирования. Он входит в ключи вариантов
+# и в запись uploaded_images, поэтому после смены настроек тот же файл нарезается заново
+IMAGE_VARIANT_SPEC = hashlib.sha256(
+    json.dumps([IMAGE_VARIANT_WIDTHS, IMAGE_EXTRA_FORMATS, IMAGE_ENCODERS], sort_keys=True).encode('utf-8')
+).hexdigest()[:12]
+
+def detect_image_format(data: bytes) -> Optional[str]:
+    """Настоящий формат изображения по сигнатуре, а не по имени файла"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data[4:8] == b'ftyp' and data[8:12] in (b'avif', b'avis'):
+        return 'avif'
+    return None
+
+def encode_image(image: 'Image.Image', fmt: str, icc_profile: Optional[bytes]) -> bytes:
+    """Кодирование без EXIF и прочих метаданных (цветовой профиль сохраняется)"""
+    pil_format, _, _, options = IMAGE_ENCODERS[fmt]
+    buffer = io.BytesIO()
+    if icc_profile:
+        options = {**options, 'icc_profile': icc_profile}
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+def render_image_variants(source_file: BinaryIO) -> List[Dict[str, Any]]:
+    """
+    Набор адаптивных размеров изображения: основной формат (JPEG или PNG при прозрачности)
+    плюс IMAGE_EXTRA_FORMATS для каждой ширины из IMAGE_VARIANT_WIDTHS
+    Анимированные GIF сохраняются без изменений
+    Pillow читает исходник из файла сам; JPEG декодируется сразу в уменьшенном масштабе (draft),
+    если самый большой вариант хотя бы вдвое меньше оригинала
+    """
+    from PIL import Image, ImageOps
+    with Image.open(source_file) as source:
+        if source.width * source.height > IMAGE_MAX_PIXELS:
+            raise ValueError(f'Image is too large, maximum is {IMAGE_MAX_PIXELS} pixels')
+        if getattr(source, 'is_animated', False):
+            source_file.seek(0)
+            return [{'data': source_file.read(), 'width': source.width, 'height': source.height, 'format': 'gif',
+                     'content_type': 'image/gif', 'ext': 'gif'}]
+        if source.format == 'JPEG':
+            # Квадрат со стороной наибольшей ширины: после поворота по EXIF ширина всё равно не меньше неё
+            source.draft(None, (IMAGE_VARIANT_WIDTHS[-1], IMAGE_VARIANT_WIDTHS[-1]))
+        icc_profile = source.info.get('icc_profile')
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    
+    formats = ['png' if has_alpha else 'jpeg'] + [fmt for fmt in IMAGE_EXTRA_FORMATS if fmt in IMAGE_ENCODERS]
+    widths = [width for width in IMAGE_VARIANT_WIDTHS if width < image.width]
+    widths.append(min(image.width, IMAGE_VARIANT_WIDTHS[-1]))
+    
+    variants = []
+    for width in sorted(set(widths)):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            _, content_type, ext, _ = IMAGE_ENCODERS[fmt]
+            variants.append({
+                'data': encode_image(resized, fmt, icc_profile),
+                'width': width,
+                'height': height,
+                'format': fmt,
+                'content_type': content_type,
+                'ext': ext
+            })
+    return variants
+
+def upload_image_variants(base_key: str, variants: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Параллельная загрузка вариантов в бакет и манифест в стиле srcset"""
+    from concurrent.futures import ThreadPoolExecutor
+    s3 = get_s3_client()
+    
+    def put_variant(variant: Dict[str, Any]) -> Dict[str, Any]:
+        key = f"{base_key}/{variant['width']}w.{variant['ext']}"
+        s3.put_object(Bucket=S3_BUCKET, Key=key, Body=variant['data'], ContentType=variant['content_type'],
+                      CacheControl=IMAGE_CACHE_CONTROL)
+        return {
+            'url': cdn_url_for(key),
+            'width': variant['width'],
+            'height': variant['height'],
+            'type': variant['content_type']
+        }
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(UPLOAD_CONCURRENCY, len(variants)))) as executor:
+        # Каждая задача получает копию контекста, чтобы загрузки попадали в Server-Timing вызова
+        futures = [executor.submit(contextvars.copy_context().run, put_variant, variant) for variant in variants]
+        uploaded = [future.result() for future in futures]
+    
+    srcset: Dict[str, str] = {}
+    for variant in uploaded:
+        entry = f"{variant['url']} {variant['width']}w"
+        srcset[variant['type']] = f"{srcset[variant['type']]}, {entry}" if variant['type'] in srcset else entry
+    # Самый большой вариант основного формата остаётся совместимым полем url
+    fallback_type = uploaded[0]['type']
+    largest = max((variant for variant in uploaded if variant['type'] == fallback_type), key=lambda variant: variant['width'])
+    return {
+        'url': largest['url'],
+        'width': largest['width'],
+        'height': largest['height'],
+        'srcset': srcset,
+        'variants': uploaded
+    }
+
+def spool_hashed(stream) -> Tuple[BinaryIO, str]:
+    """
+    Копия тела объекта S3 во временный файл частями с подсчётом SHA-256 по ходу чтения
+    В памяти не больше UPLOAD_SPOOL_SIZE байт; формат проверяется по первой части,
+    чтобы не скачивать целиком файл, который всё равно будет отклонён (ValueError)
+    """
+    import tempfile
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE)
+    try:
+        for chunk in stream.iter_chunks(UPLOAD_HASH_CHUNK_SIZE):
+            if not spool.tell() and detect_image_format(chunk) is None:
+                raise ValueError('Unsupported image format. Use JPEG, PNG, GIF, WebP or AVIF')
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, digest.hexdigest()
+
+def find_uploaded_image(sha256: str) -> Optional[Dict[str, Any]]:
+    """Манифест ранее загруженного файла с тем же SHA-256, нарезанного по текущим настройкам (IMAGE_VARIANT_SPEC)"""
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur, measure('db'):
+            cur.execute('SELECT manifest FROM uploaded_images WHERE sha256 = %s AND variant_spec = %s', (sha256, IMAGE_VARIANT_SPEC))
+            row = cur.fetchone()
+        return row[0] if row else None
+    finally:
+        release_db_connection(conn)
+
+def save_uploaded_image(sha256: str, size: int, manifest: Dict[str, Any]) -> None:
+    """
+    Запись в индекс хэш -> манифест; параллельная загрузка того же файла уже могла её сделать
+    Запись, нарезанная по прежним настройкам, заменяется; её варианты остаются в бакете под старыми ключами
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur, measure('db'):
+            cur.execute(
+                '''INSERT INTO uploaded_images (sha256, url, manifest, size_bytes, variant_spec)
+                   VALUES (%s, %s, %s, %s, %s)
+                   ON CONFLICT (sha256) DO UPDATE
+                   SET url = EXCLUDED.url, manifest = EXCLUDED.manifest, size_bytes = EXCLUDED.size_bytes,
+                       variant_spec = EXCLUDED.variant_spec, created_at = CURRENT_TIMESTAMP
+                   WHERE uploaded_images.variant_spec <> EXCLUDED.variant_spec''',
+                (sha256, manifest['url'], json.dumps(manifest), size, IMAGE_VARIANT_SPEC)
+            )
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+
+def process_and_upload_image(source_file: BinaryIO, sha256: str, size: int) -> Dict[str, Any]:
+    """
+    Нарезка размеров и загрузка исходника с проверенной сигнатурой; ValueError, если он не декодируется
+    Уже загруженный файл (тот же SHA-256) не обрабатывается повторно: возвращается сохранённый манифест
+    """
+    manifest = find_uploaded_image(sha256)
+    if manifest is not None:
+        return manifest
+    
+    from PIL import Image
+    try:
+        with measure('image') as sample:
+            variants = render_image_variants(source_file)
+            sample['bytes'] = size
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError('Image could not be decoded') from e
+    manifest = upload_image_variants(f"{UPLOAD_KEY_PREFIX}{sha256}/{IMAGE_VARIANT_SPEC}", variants)
+    save_uploaded_image(sha256, size, manifest)
+    return manifest
+
+JSON_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Заголовок запроса без учёта регистра"""
+    headers = event.get('headers') or {}
+    lower_name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower_name:
+            return value
+    return None
+
+def dumps(data: Any) -> str:
+    """JSON без экранирования кириллицы, через orjson, если он установлен"""
+    with measure('serialize') as sample:
+        body = orjson.dumps(data).decode('utf-8') if orjson is not None else json.dumps(data, ensure_ascii=False)
+        sample['bytes'] = len(body)
+    return body
+
+def choose_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """br, если клиент его принимает и установлен brotli, иначе gzip; None - без сжатия"""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, weight = item.partition(';')
+        weight = weight.replace(' ', '')
+        if weight.startswith('q=') and not weight[2:].strip('0.'):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def build_response(status: int, body: str, headers: Dict[str, str], event: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Ответ функции; тело от COMPRESSION_MIN_SIZE символов сжимается по Accept-Encoding запроса"""
+    encoding = None
+    if event is not None and len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = choose_content_encoding(get_request_header(event, 'Accept-Encoding'))
+    if encoding is None:
+        return {'statusCode': status, 'headers': headers, 'body': body, 'isBase64Encoded': False}
+    
+    raw = body.encode('utf-8')
+    with measure('compress') as sample:
+        if encoding == 'br':
+            compressed = brotli.compress(raw, quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(raw, compresslevel=COMPRESSION_GZIP_LEVEL)
+        sample['bytes'] = len(compressed)
+    return {
+        'statusCode': status,
+        'headers': {**headers, 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def json_response(status: int, data: Any, event: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """JSON-ответ с CORS; event нужен, чтобы сжать тело"""
+    return build_response(status, dumps(data), {**JSON_HEADERS, **(headers or {})}, event)
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    """Ответ с ошибкой {'error': message}"""
+    return json_response(status, {'error': message})
+
+def initiate_multipart_upload(s3, key: str, content_type: str, size: int) -> Dict[str, Any]:
+    """Открывает multipart-загрузку и подписывает URL для каждой части"""
+    part_count = max(1, math.ceil(size / UPLOAD_PART_SIZE))
+    upload = s3.create_multipart_upload(Bucket=S3_BUCKET, Key=key, ContentType=content_type)
+    upload_id = upload['UploadId']
+    parts = [{
+        'part_number': part_number,
+        'url': s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': S3_BUCKET, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+            ExpiresIn=UPLOAD_URL_EXPIRES
+        )
+    } for part_number in range(1, part_count + 1)]
+    return {
+        'key': key,
+        'upload_id': upload_id,
+        'part_size': UPLOAD_PART_SIZE,
+        'parts': parts
+    }
+
+def parse_completed_parts(raw_parts: Any) -> List[Dict[str, Any]]:
+    """Проверка списка частей [{part_number, etag}] от клиента"""
+    if not isinstance(raw_parts, list) or not raw_parts:
+        raise ValueError('parts must be a non-empty list of {part_number, etag}')
+    parts = []
+    for part in raw_parts:
+        if not isinstance(part, dict) or not part.get('etag') or not isinstance(part.get('part_number'), int):
+            raise ValueError('parts must be a non-empty list of {part_number, etag}')
+        parts.append({'PartNumber': part['part_number'], 'ETag': part['etag']})
+    return sorted(parts, key=lambda part: part['PartNumber'])
+
+def handle_multipart(action: str, body_data: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Шаги multipart-загрузки:
+    initiate - body: {filename, size, sha256?} -> {key, upload_id, part_size, parts: [{part_number, url}]};
+        если файл с таким SHA-256 уже загружен, сразу возвращается его манифест с duplicate: true и загрузка не нужна
+    complete - body: {key, upload_id, parts: [{part_number, etag}]} -> манифест как у обычной загрузки
+    abort - body: {key, upload_id}
+    """
+    if action == 'initiate':
+        filename = body_data.get('filename') or 'image.jpg'
+        if not isinstance(filename, str):
+            return error_response(400, 'filename must be a string')
+        size = body_data.get('size')
+        if not isinstance(size, int) or size <= 0:
+            return error_response(400, 'File size is required')
+        if size > UPLOAD_MAX_SIZE:
+            return error_response(413, f'File is too large, maximum is {UPLOAD_MAX_SIZE} bytes')
+        sha256 = body_data.get('sha256')
+        if sha256 is not None:
+            if not isinstance(sha256, str) or not re.fullmatch(r'[0-9a-f]{64}', sha256.lower()):
+                return error_response(400, 'sha256 must be a hex SHA-256 digest')
+            # Хэш от клиента только позволяет пропустить загрузку уже известного файла;
+            # новый файл всё равно хэшируется на complete, поэтому подделать манифест нельзя
+            manifest = find_uploaded_image(sha256.lower())
+            if manifest is not None:
+                return json_response(200, {**manifest, 'duplicate': True}, event)
+        
+        import uuid
+        ext = filename.split('.')[-1] if '.' in filename else 'jpg'
+        key = f"{UPLOAD_INCOMING_PREFIX}{uuid.uuid4()}.{ext}"
+        return json_response(200, initiate_multipart_upload(get_s3_client(), key, guess_content_type(ext), size), event)
+    
+    key = body_data.get('key', '')
+    upload_id = body_data.get('upload_id', '')
+    if not isinstance(key, str) or not key.startswith(UPLOAD_INCOMING_PREFIX) or not isinstance(upload_id, str) or not upload_id:
+        return error_response(400, 'key and upload_id are required')
+    
+    if action == 'complete':
+        try:
+            parts = parse_completed_parts(body_data.get('parts'))
+        except ValueError as e:
+            return error_response(400, str(e))
+        s3 = get_s3_client()
+        s3.complete_multipart_upload(
+            Bucket=S3_BUCKET,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        # Исходник с EXIF не публикуется: остаются только обработанные варианты.
+        # Тело читается потоком во временный файл, а не в память функции
+        try:
+            source = s3.get_object(Bucket=S3_BUCKET, Key=key)
+            if source['ContentLength'] > UPLOAD_MAX_SIZE:
+                source['Body'].close()
+                return error_response(413, f'File is too large, maximum is {UPLOAD_MAX_SIZE} bytes')
+            source_file, sha256 = spool_hashed(source['Body'])
+        except ValueError as e:
+            return error_response(415, str(e))
+        finally:
+            s3.delete_object(Bucket=S3_BUCKET, Key=key)
+        with source_file:
+            try:
+                manifest = process_and_upload_image(source_file, sha256, source['ContentLength'])
+            except ValueError as e:
+                return error_response(415, str(e))
+        return json_response(200, manifest, event)
+    
+    if action == 'abort':
+        get_s3_client().abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+        return json_response(200, {'success': True})
+    
+    return error_response(400, 'Unknown upload action. Use initiate, complete or abort')
+
+@instrumented('upload-image')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Загружает изображение в S3 хранилище
     POST / - загрузить изображение (body: {image: base64, filename: string})
-    Возвращает: {url: string}
+    Возвращает: {url, width, height, srcset: {content_type: "url 320w, ..."}, variants: [{url, width, height, type}]}
+    url указывает на самый большой JPEG/PNG-вариант
+    Повторная загрузка того же файла возвращает прежний манифест без записи в бакет
+    
+    Загрузка напрямую в бакет частями:
+    POST /?upload=initiate - body: {filename, size, sha256?}, клиент отправляет PUT каждой части на её url;
+        с sha256 уже загруженного файла сразу отвечает его манифестом с duplicate: true
+    POST /?upload=complete - body: {key, upload_id, parts: [{part_number, etag}]}, возвращает тот же манифест
+    POST /?upload=abort - body: {key, upload_id}
     """
     method: str = event.get('httpMethod', 'GET')
     
@@ -31,68 +649,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
+        return error_response(405, 'Method not allowed')
     
     try:
-        body_data = json.loads(event.get('body', '{}'))
+        body_data = json.loads(event.get('body') or '{}')
+    except ValueError:
+        body_data = None
+    if not isinstance(body_data, dict):
+        return error_response(400, 'Body must be a JSON object')
+    
+    try:
+        params = event.get('queryStringParameters', {}) or {}
+        if params.get('upload'):
+            return handle_multipart(params['upload'], body_data, event)
+        
         image_base64 = body_data.get('image', '')
-        filename = body_data.get('filename', 'image.jpg')
         
         if not image_base64:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Image data is required'}),
-                'isBase64Encoded': False
-            }
+            return error_response(400, 'Image data is required')
+        if not isinstance(image_base64, str):
+            return error_response(400, 'image must be a base64 string')
         
         if ',' in image_base64:
             image_base64 = image_base64.split(',')[1]
         
-        image_data = base64.b64decode(image_base64)
-        
-        ext = filename.split('.')[-1] if '.' in filename else 'jpg'
-        unique_filename = f"products/{uuid.uuid4()}.{ext}"
-        
-        content_type = 'image/jpeg'
-        if ext.lower() in ['png']:
-            content_type = 'image/png'
-        elif ext.lower() in ['gif']:
-            content_type = 'image/gif'
-        elif ext.lower() in ['webp']:
-            content_type = 'image/webp'
+        try:
+            image_data = base64.b64decode(image_base64)
+        except ValueError:
+            return error_response(400, 'image must be a base64 string')
+        if detect_image_format(image_data) is None:
+            return error_response(415, 'Unsupported image format. Use JPEG, PNG, GIF, WebP or AVIF')
         
-        s3 = boto3.client('s3',
-            endpoint_url='https://bucket.poehali.dev',
-            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-        )
-        
-        s3.put_object(
-            Bucket='files',
-            Key=unique_filename,
-            Body=image_data,
-            ContentType=content_type
-        )
-        
-        cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{unique_filename}"
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'url': cdn_url}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        try:
+            manifest = process_and_upload_image(io.BytesIO(image_data), hashlib.sha256(image_data).hexdigest(), len(image_data))
+        except ValueError as e:
+            return error_response(415, str(e))
         
+        return json_response(200, manifest, event)
+    
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': str(e)}),
-            'isBase64Encoded': False
-        }
+        return error_response(500, str(e))
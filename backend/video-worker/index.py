@@ -0,0 +1,509 @@
+"""
+Фоновая обработка загруженных видео
+Забирает задачи из video_jobs (FOR UPDATE SKIP LOCKED, несколько воркеров не мешают друг другу),
+переносит файл из videos/incoming/ в videos/<id>/, снимает длительность и разрешение,
+делает постер из кадра видео (если превью не загружено), нарезает HLS-лестницу
+(несколько качеств, сегменты и master-плейлист в videos/<id>/hls/) и публикует видео
+Задача берётся в аренду на VIDEO_JOB_LEASE секунд: если воркер упал, её заберёт следующий,
+но не больше VIDEO_JOB_MAX_ATTEMPTS попыток всего
+Опубликованное видео помечает снимок списка catalog/videos.<хэш>.json устаревшим (см. функцию catalog-snapshots)
+"""
+import json
+import os
+import re
+import time
+import shutil
+import functools
+import tempfile
+import threading
+import subprocess
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+VIDEO_JOB_LEASE = int(os.environ.get('VIDEO_JOB_LEASE', '900'))
+VIDEO_JOB_MAX_ATTEMPTS = int(os.environ.get('VIDEO_JOB_MAX_ATTEMPTS', '5'))
+VIDEO_JOB_RETRY_DELAY = int(os.environ.get('VIDEO_JOB_RETRY_DELAY', '30'))
+VIDEO_WORKER_TIME_BUDGET = float(os.environ.get('VIDEO_WORKER_TIME_BUDGET', '240'))
+# Новую задачу не берём, если до конца бюджета осталось меньше: она только потратила бы попытку
+VIDEO_JOB_MIN_TIME = float(os.environ.get('VIDEO_JOB_MIN_TIME', '60'))
+VIDEO_WORKER_POLL_INTERVAL = float(os.environ.get('VIDEO_WORKER_POLL_INTERVAL', '5'))
+VIDEO_POSTER_WIDTH = int(os.environ.get('VIDEO_POSTER_WIDTH', '1280'))
+# Предел одного вызова ffmpeg; фактический таймаут ещё и не дальше конца бюджета вызова (см. ffmpeg_timeout)
+FFMPEG_TIMEOUT = int(os.environ.get('FFMPEG_TIMEOUT', '180'))
+
+# Лестница HLS: высота кадра (по короткой стороне) и битрейт видео в кбит/с
+VIDEO_HLS_LADDER = [
+    tuple(int(value) for value in step.split(':'))
+    for step in os.environ.get('VIDEO_HLS_LADDER', '360:800,720:2500,1080:5000').split(',')
+]
+VIDEO_HLS_SEGMENT_SECONDS = int(os.environ.get('VIDEO_HLS_SEGMENT_SECONDS', '6'))
+VIDEO_HLS_AUDIO_BITRATE = os.environ.get('VIDEO_HLS_AUDIO_BITRATE', '128k')
+VIDEO_HLS_PRESET = os.environ.get('VIDEO_HLS_PRESET', 'veryfast')
+VIDEO_UPLOAD_CONCURRENCY = int(os.environ.get('VIDEO_UPLOAD_CONCURRENCY', '8'))
+
+HLS_CONTENT_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t'}
+
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '2'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает вызовы в тёплом контейнере.
+# psycopg2 импортируется при создании пула: OPTIONS и отказы 403/405 обходятся без него
+psycopg2: Any = None
+_db_pool = None
+_db_last_used: Dict[int, float] = {}
+
+def get_db_pool() -> 'psycopg2.pool.ThreadedConnectionPool':
+    """Ленивое создание пула подключений к базе данных"""
+    global _db_pool, psycopg2
+    if _db_pool is None or _db_pool.closed:
+        import psycopg2.pool
+        import psycopg2.extensions
+        _db_pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, os.environ['DATABASE_URL'])
+        _db_last_used.clear()
+    return _db_pool
+
+def _is_connection_alive(conn) -> bool:
+    """Проверка соединения, простаивавшего дольше DB_POOL_PING_AFTER секунд"""
+    if conn.closed:
+        return False
+    last_used = _db_last_used.get(id(conn))
+    if last_used is None or time.monotonic() - last_used < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def get_db_connection():
+    """Получение живого подключения из пула, устаревшие сокеты переоткрываются"""
+    pool = get_db_pool()
+    for _ in range(DB_POOL_MAX_SIZE + 1):
+        conn = pool.getconn()
+        if _is_connection_alive(conn):
+            return conn
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    raise psycopg2.OperationalError('Could not obtain a healthy database connection')
+
+def release_db_connection(conn) -> None:
+    """Возврат подключения в пул; открытая транзакция откатывается"""
+    pool = get_db_pool()
+    if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            pass
+    if conn.closed:
+        _db_last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        return
+    _db_last_used[id(conn)] = time.monotonic()
+    pool.putconn(conn)
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+
+# Клиент создаётся при первой задаче и переиспользуется тёплым контейнером
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    """Общий клиент S3 (S3_ENDPOINT_URL позволяет подменить хранилище локальным)"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+                _s3_client = boto3.client('s3',
+                    endpoint_url=S3_ENDPOINT_URL or None,
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+                    config=Config(
+                        retries={'max_attempts': 3, 'mode': 'standard'},
+                        connect_timeout=5,
+                        read_timeout=120,
+                        tcp_keepalive=True
+                    )
+                )
+    return _s3_client
+
+def cdn_url_for(key: str) -> str:
+    """Публичный CDN URL объекта в бакете"""
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+def log_event(entry: Dict[str, Any]) -> None:
+    """Структурированная строка лога (одна JSON-строка в stdout)"""
+    print(json.dumps(entry, ensure_ascii=False, default=str), flush=True)
+
+def mark_snapshots_stale(cur, names: Iterable[str]) -> None:
+    """
+    Помечает снимки списков names устаревшими в транзакции записи; выкладывает их функция catalog-snapshots
+    Метка ставится последней перед commit: строка catalog_snapshots заблокирована только до фиксации
+    """
+    cur.execute(
+        """UPDATE catalog_snapshots
+           SET stale_since = COALESCE(stale_since, CURRENT_TIMESTAMP), stale_version = stale_version + 1
+           WHERE name = ANY(%s)""",
+        (list(names),)
+    )
+
+def ffmpeg_binary() -> str:
+    """ffmpeg из FFMPEG_BINARY, пакета imageio-ffmpeg (статическая сборка) или PATH"""
+    if os.environ.get('FFMPEG_BINARY'):
+        return os.environ['FFMPEG_BINARY']
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        pass
+    path = shutil.which('ffmpeg')
+    if path is None:
+        raise RuntimeError('ffmpeg is not available')
+    return path
+
+def ffmpeg_timeout(deadline: float) -> float:
+    """Таймаут вызова ffmpeg: FFMPEG_TIMEOUT, но не позже deadline (time.monotonic()), чтобы вызов не пережил бюджет функции"""
+    return max(1.0, min(FFMPEG_TIMEOUT, deadline - time.monotonic()))
+
+def probe_video(path: str, deadline: float) -> Dict[str, Any]:
+    """Длительность, разрешение и наличие звука по выводу ffmpeg -i; ValueError, если в файле нет видеопотока"""
+    # Без выходного файла ffmpeg завершается с ошибкой, но успевает напечатать сведения о потоках
+    output = subprocess.run([ffmpeg_binary(), '-hide_banner', '-i', path],
+                            capture_output=True, text=True, timeout=ffmpeg_timeout(deadline)).stderr
+    video = re.search(r'Stream #\S+.*?: Video: .*?\b(\d{2,5})x(\d{2,5})\b', output)
+    if video is None:
+        raise ValueError('File has no video stream')
+    width, height = int(video.group(1)), int(video.group(2))
+    if re.search(r'rotation of -?(90|270)\.', output):
+        # Видео с телефона: кадр хранится повёрнутым, показывается с другой ориентацией
+        width, height = height, width
+    
+    duration = re.search(r'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)', output)
+    seconds = None
+    if duration:
+        seconds = round(int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3)), 3)
+    has_audio = re.search(r'Stream #\S+.*?: Audio: ', output) is not None
+    return {'duration_seconds': seconds, 'width': width, 'height': height, 'has_audio': has_audio}
+
+def extract_poster(path: str, duration: Optional[float], output_path: str, deadline: float) -> None:
+    """Постер JPEG из кадра на первой секунде (или середины короткого ролика) шириной до VIDEO_POSTER_WIDTH"""
+    offset = min(1.0, duration / 2) if duration else 0
+    subprocess.run(
+        [ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y', '-ss', f'{offset:.3f}', '-i', path,
+         '-frames:v', '1', '-vf', f"scale='min({VIDEO_POSTER_WIDTH},iw)':-2", '-q:v', '3', output_path],
+        capture_output=True, check=True, timeout=ffmpeg_timeout(deadline)
+    )
+
+def hls_renditions(width: int, height: int) -> List[Tuple[int, int]]:
+    """Ступени лестницы не выше исходного видео; ролик меньше нижней ступени идёт одной ступенью в своём размере"""
+    short_side = min(width, height)
+    ladder = [(size, bitrate) for size, bitrate in VIDEO_HLS_LADDER if size <= short_side]
+    return ladder or [(short_side - short_side % 2, VIDEO_HLS_LADDER[0][1])]
+
+def package_hls(path: str, metadata: Dict[str, Any], output_dir: str, deadline: float) -> List[str]:
+    """
+    HLS одной командой ffmpeg: видео декодируется один раз и масштабируется на все ступени
+    Ключевые кадры выровнены по границам сегментов, поэтому плеер переключает качество без рывков
+    Результат: output_dir/master.m3u8 и output_dir/<360p|720p|...>/index.m3u8 с сегментами
+    """
+    renditions = hls_renditions(metadata['width'], metadata['height'])
+    portrait = metadata['height'] > metadata['width']
+    split = f"[0:v]split={len(renditions)}" + ''.join(f'[v{index}]' for index in range(len(renditions)))
+    scales = [
+        f"[v{index}]scale={f'{size}:-2' if portrait else f'-2:{size}'}[v{index}out]"
+        for index, (size, _) in enumerate(renditions)
+    ]
+    command = [ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y', '-i', path,
+               '-filter_complex', ';'.join([split, *scales])]
+    
+    names, stream_map = [], []
+    for index, (size, bitrate) in enumerate(renditions):
+        names.append(f'{size}p')
+        command += ['-map', f'[v{index}out]', f'-b:v:{index}', f'{bitrate}k',
+                    f'-maxrate:v:{index}', f'{round(bitrate * 1.1)}k', f'-bufsize:v:{index}', f'{bitrate * 2}k']
+        if metadata['has_audio']:
+            command += ['-map', 'a:0']
+            stream_map.append(f'v:{index},a:{index},name:{size}p')
+        else:
+            stream_map.append(f'v:{index},name:{size}p')
+    
+    command += ['-c:v', 'libx264', '-preset', VIDEO_HLS_PRESET, '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+                '-sc_threshold', '0', '-force_key_frames', f'expr:gte(t,n_forced*{VIDEO_HLS_SEGMENT_SECONDS})']
+    if metadata['has_audio']:
+        command += ['-c:a', 'aac', '-b:a', VIDEO_HLS_AUDIO_BITRATE, '-ac', '2']
+    command += ['-f', 'hls', '-hls_time', str(VIDEO_HLS_SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                '-hls_flags', 'independent_segments',
+                '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%03d.ts'),
+                '-master_pl_name', 'master.m3u8', '-var_stream_map', ' '.join(stream_map),
+                os.path.join(output_dir, '%v', 'index.m3u8')]
+    subprocess.run(command, capture_output=True, check=True, timeout=ffmpeg_timeout(deadline))
+    return names
+
+def upload_directory(directory: str, prefix: str) -> int:
+    """Параллельная загрузка плейлистов и сегментов HLS в бакет под prefix; возвращает число файлов"""
+    from concurrent.futures import ThreadPoolExecutor
+    s3 = get_s3_client()
+    files = [
+        os.path.join(root, name)
+        for root, _, names in os.walk(directory)
+        for name in names
+    ]
+    
+    def put_file(path: str) -> None:
+        key = f"{prefix}/{os.path.relpath(path, directory).replace(os.sep, '/')}"
+        content_type = HLS_CONTENT_TYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        s3.upload_file(path, S3_BUCKET, key, ExtraArgs={'ContentType': content_type})
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(VIDEO_UPLOAD_CONCURRENCY, len(files)))) as executor:
+        list(executor.map(put_file, files))
+    return len(files)
+
+def claim_job() -> Optional[Dict[str, Any]]:
+    """
+    Аренда следующей задачи: ожидающей или с истёкшей арендой, пока попытки не исчерпаны
+    SKIP LOCKED пропускает строки, которые в этот момент забирает другой воркер
+    Задача, на которой воркер падает целиком (OOM, таймаут функции), не доходит до fail_job:
+    когда её аренда истекает после последней попытки, она и видео помечаются failed здесь
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """WITH exhausted AS (
+                       UPDATE video_jobs
+                       SET status = 'failed', locked_until = NULL, updated_at = CURRENT_TIMESTAMP,
+                           last_error = COALESCE(last_error, 'Worker stopped while processing the job')
+                       WHERE status IN ('pending', 'running') AND attempts >= %s
+                         AND (status = 'pending' OR locked_until < CURRENT_TIMESTAMP)
+                       RETURNING video_id
+                   )
+                   UPDATE videos SET status = 'failed', updated_at = CURRENT_TIMESTAMP
+                   WHERE id IN (SELECT video_id FROM exhausted)""",
+                (VIDEO_JOB_MAX_ATTEMPTS,)
+            )
+            cur.execute(
+                """UPDATE video_jobs
+                   SET status = 'running', attempts = attempts + 1,
+                       locked_until = CURRENT_TIMESTAMP + %s * INTERVAL '1 second', updated_at = CURRENT_TIMESTAMP
+                   WHERE id = (
+                       SELECT id FROM video_jobs
+                       WHERE status IN ('pending', 'running') AND run_after <= CURRENT_TIMESTAMP
+                         AND (status = 'pending' OR locked_until < CURRENT_TIMESTAMP) AND attempts < %s
+                       ORDER BY run_after, id
+                       LIMIT 1
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   RETURNING id, video_id, source_key, thumbnail_key, attempts""",
+                (VIDEO_JOB_LEASE, VIDEO_JOB_MAX_ATTEMPTS)
+            )
+            row = cur.fetchone()
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+    if row is None:
+        return None
+    return dict(zip(('id', 'video_id', 'source_key', 'thumbnail_key', 'attempts'), row))
+
+def process_job(job: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+    """
+    Перенос файлов в videos/<id>/, метаданные, постер и HLS; возвращает новые поля видео
+    Вызовы ffmpeg не переживают deadline: не успевшая задача повторится со следующей попыткой
+    HLS - дополнение к MP4, а не условие публикации: при его сбое видео публикуется без hls_url
+    """
+    s3 = get_s3_client()
+    prefix = f"videos/{job['video_id']}"
+    video_key = f'{prefix}/video.mp4'
+    poster_key = f'{prefix}/poster.jpg'
+    hls_key = f'{prefix}/hls/master.m3u8'
+    
+    with tempfile.TemporaryDirectory(prefix='video-job-') as workdir:
+        source_path = os.path.join(workdir, 'source.mp4')
+        s3.download_file(S3_BUCKET, job['source_key'], source_path)
+        metadata = probe_video(source_path, deadline)
+        
+        # Копирование внутри бакета: файл не проходит через функцию второй раз
+        s3.copy({'Bucket': S3_BUCKET, 'Key': job['source_key']}, S3_BUCKET, video_key,
+                ExtraArgs={'ContentType': 'video/mp4', 'MetadataDirective': 'REPLACE'})
+        if job['thumbnail_key']:
+            s3.copy({'Bucket': S3_BUCKET, 'Key': job['thumbnail_key']}, S3_BUCKET, poster_key,
+                    ExtraArgs={'ContentType': 'image/jpeg', 'MetadataDirective': 'REPLACE'})
+        else:
+            poster_path = os.path.join(workdir, 'poster.jpg')
+            extract_poster(source_path, metadata['duration_seconds'], poster_path, deadline)
+            s3.upload_file(poster_path, S3_BUCKET, poster_key, ExtraArgs={'ContentType': 'image/jpeg'})
+        
+        hls_dir = os.path.join(workdir, 'hls')
+        os.makedirs(hls_dir)
+        hls_url, renditions, files, hls_error = None, [], 0, None
+        try:
+            renditions = package_hls(source_path, metadata, hls_dir, deadline)
+            # Ссылка на master.m3u8 попадает в базу только после загрузки всех сегментов
+            files = upload_directory(hls_dir, f'{prefix}/hls')
+            hls_url = cdn_url_for(hls_key)
+        except Exception as e:
+            renditions, hls_error = [], str(e)[:2000]
+    
+    return {
+        **metadata,
+        'video_url': cdn_url_for(video_key),
+        'thumbnail_url': cdn_url_for(poster_key),
+        'hls_url': hls_url,
+        'renditions': renditions,
+        'hls_files': files,
+        'hls_error': hls_error
+    }
+
+def complete_job(job: Dict[str, Any], video: Dict[str, Any]) -> bool:
+    """
+    Публикация видео и закрытие задачи одной транзакцией
+    attempts служит меткой аренды: если задачу уже перехватил другой воркер, ничего не пишем
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """UPDATE video_jobs SET status = 'done', locked_until = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = %s AND attempts = %s AND status = 'running'""",
+                (job['id'], job['attempts'])
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False
+            cur.execute(
+                """UPDATE videos
+                   SET video_url = %s, thumbnail_url = %s, hls_url = %s, duration_seconds = %s, width = %s, height = %s,
+                       status = 'ready', is_published = true, updated_at = CURRENT_TIMESTAMP
+                   WHERE id = %s""",
+                (video['video_url'], video['thumbnail_url'], video['hls_url'], video['duration_seconds'],
+                 video['width'], video['height'], job['video_id'])
+            )
+            mark_snapshots_stale(cur, ('videos',))
+        conn.commit()
+        return True
+    finally:
+        release_db_connection(conn)
+
+def fail_job(job: Dict[str, Any], error: Exception) -> str:
+    """
+    Повтор с экспоненциальной задержкой; битый файл (ValueError) или исчерпанные попытки -
+    задача и видео помечаются failed
+    """
+    final = isinstance(error, ValueError) or job['attempts'] >= VIDEO_JOB_MAX_ATTEMPTS
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """UPDATE video_jobs
+                   SET status = %s, last_error = %s, locked_until = NULL, updated_at = CURRENT_TIMESTAMP,
+                       run_after = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                   WHERE id = %s AND attempts = %s AND status = 'running'""",
+                ('failed' if final else 'pending', str(error)[:2000],
+                 VIDEO_JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1), job['id'], job['attempts'])
+            )
+            if final and cur.rowcount:
+                cur.execute(
+                    "UPDATE videos SET status = 'failed', updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                    (job['video_id'],)
+                )
+        conn.commit()
+    finally:
+        release_db_connection(conn)
+    return 'failed' if final else 'retry'
+
+def run_jobs(time_budget: float) -> Dict[str, int]:
+    """
+    Обработка задач по одной, пока есть задачи и не истёк time_budget секунд
+    Новая задача берётся, только если до конца бюджета остаётся хотя бы VIDEO_JOB_MIN_TIME секунд
+    """
+    deadline = time.monotonic() + time_budget
+    stats = {'processed': 0, 'failed': 0, 'retried': 0}
+    while deadline - time.monotonic() >= min(VIDEO_JOB_MIN_TIME, time_budget):
+        job = claim_job()
+        if job is None:
+            break
+        started = time.monotonic()
+        try:
+            video = process_job(job, deadline)
+        except Exception as e:
+            outcome = fail_job(job, e)
+            stats['failed' if outcome == 'failed' else 'retried'] += 1
+            log_event({'event': 'video_job', 'job_id': job['id'], 'video_id': job['video_id'], 'outcome': outcome, 'error': str(e)})
+            continue
+        
+        completed = complete_job(job, video)
+        if completed:
+            # Входящие файлы удаляются только после публикации: при сбое выше задача повторится с ними
+            objects = [{'Key': key} for key in (job['source_key'], job['thumbnail_key']) if key]
+            get_s3_client().delete_objects(Bucket=S3_BUCKET, Delete={'Objects': objects, 'Quiet': True})
+            stats['processed'] += 1
+        log_event({
+            'event': 'video_job',
+            'job_id': job['id'],
+            'video_id': job['video_id'],
+            'outcome': 'done' if completed else 'lease_lost',
+            'duration_ms': round((time.monotonic() - started) * 1000),
+            **{key: video[key] for key in ('duration_seconds', 'width', 'height', 'renditions', 'hls_files', 'hls_error')}
+        })
+    return stats
+
+def get_request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Заголовок запроса без учёта регистра"""
+    headers = event.get('headers') or {}
+    lower_name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower_name:
+            return value
+    return None
+
+def json_response(status: int, data: Any) -> Dict[str, Any]:
+    """JSON-ответ с CORS"""
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(data, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Обработка очереди загруженных видео
+    POST / - обработать задачи, пока они есть, но не дольше VIDEO_WORKER_TIME_BUDGET секунд
+    Возвращает: {processed, failed, retried}
+    Требует заголовок X-Admin-Secret; вызывается по расписанию, например раз в минуту
+    Постоянный воркер без HTTP: python index.py
+    """
+    method: str = event.get('httpMethod', 'POST')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Secret',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method != 'POST':
+        return json_response(405, {'error': 'Method not allowed'})
+    
+    admin_secret = get_request_header(event, 'X-Admin-Secret')
+    expected_secret = os.environ.get('ADMIN_SECRET_KEY')
+    
+    if not expected_secret or admin_secret != expected_secret:
+        return json_response(403, {'error': 'Forbidden: Invalid admin secret'})
+    
+    return json_response(200, run_jobs(VIDEO_WORKER_TIME_BUDGET))
+
+if __name__ == '__main__':
+    # Постоянный воркер: при пустой очереди ждёт VIDEO_WORKER_POLL_INTERVAL секунд
+    while True:
+        if not any(run_jobs(VIDEO_WORKER_TIME_BUDGET).values()):
+            time.sleep(VIDEO_WORKER_POLL_INTERVAL)
@@ -0,0 +1,427 @@
+"""
+Нагрузочный бенчмарк backend-функций без деплоя
+Вызывает handler(event, context) функций напрямую против одноразового Postgres
+(pgserver или BENCH_DATABASE_URL) и S3 на moto, засевает каталог на 100 / 10k / 100k товаров
+и меряет p50/p95/p99, запросы в секунду и пиковый RSS процесса для сценариев:
+list (страницы по курсору), list_fields (то же с fields=), get (товар по id), get_many (20 товаров по ids=), facets, write (PATCH цены), upload (загрузка изображения;
+upload_duplicate - повторная загрузка того же файла)
+Функция content на лентах из того же числа новостей и видео: news_list, news_summary (summary=true с fields=), news_get,
+news_delta (дельта по updated_since, страницы по sync_token), news_write (PATCH заголовка), videos_list
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/run.py --sizes 100,10000,100000 --output benchmarks/results/run.json
+    python benchmarks/run.py --baseline benchmarks/results/run.json
+
+BENCH_DATABASE_URL - своя база вместо pgserver; схема bench в ней пересоздаётся
+"""
+import argparse
+import base64
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_SCHEMA = 'bench'
+CONTENT_SCENARIOS = ('news_list', 'news_summary', 'news_get', 'news_delta', 'news_write', 'videos_list')
+# Записей в начальной дельте news_delta: последние по updated_at
+CONTENT_DELTA_ROWS = 100
+CATEGORIES = ['Вазы', 'Шкатулки', 'Декор', 'Конфетницы', 'Подсвечники']
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark backend handlers against local Postgres and moto S3')
+    parser.add_argument('--sizes', default='100,10000,100000', help='catalog sizes, comma separated')
+    parser.add_argument('--requests', type=int, default=300, help='measured requests per scenario')
+    parser.add_argument('--upload-requests', type=int, default=20, help='measured image uploads')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests before each scenario')
+    parser.add_argument('--scenarios', default='list,list_fields,get,get_many,facets,write,upload,'
+                                                'news_list,news_summary,news_get,news_delta,news_write,videos_list')
+    parser.add_argument('--output', default=None, help='JSON file for results (default benchmarks/results/<time>.json)')
+    parser.add_argument('--baseline', default=None, help='earlier results JSON to compare against')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_postgres(workdir: str) -> tuple:
+    """URL одноразовой базы и объект сервера, который нужно держать живым до конца прогона"""
+    url = os.environ.get('BENCH_DATABASE_URL')
+    if url:
+        return url, None
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit('pgserver is not installed: pip install -r benchmarks/requirements.txt or set BENCH_DATABASE_URL')
+    server = pgserver.get_server(workdir, cleanup_mode='delete')
+    return server.get_uri(), server
+
+def apply_migrations(url: str) -> List[str]:
+    """Пересоздаёт схему bench и накатывает db_migrations; возвращает предупреждения"""
+    import psycopg2
+    warnings = []
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE')
+        cur.execute(f'CREATE SCHEMA {BENCH_SCHEMA}')
+        cur.execute(f'SET search_path TO {BENCH_SCHEMA}, public')
+        for path in sorted((ROOT / 'db_migrations').glob('V*.sql')):
+            sql = path.read_text(encoding='utf-8')
+            try:
+                cur.execute(sql)
+            except (psycopg2.errors.UndefinedFile, psycopg2.errors.FeatureNotSupported) as e:
+                if 'pg_trgm' not in str(e):
+                    raise
+                # Сборки Postgres без contrib: триграммные индексы пропускаются, нечёткий поиск не меряется
+                cur.execute('\n'.join(line for line in sql.splitlines() if 'pg_trgm' not in line and 'trgm_ops' not in line))
+                warnings.append(f'{path.name}: pg_trgm is not available, trigram indexes skipped')
+    conn.close()
+    return warnings
+
+def with_search_path(url: str) -> str:
+    separator = '&' if '?' in url else '?'
+    return f'{url}{separator}options=-csearch_path%3D{BENCH_SCHEMA}'
+
+def start_s3() -> Any:
+    """S3 на moto с бакетом files"""
+    from moto.server import ThreadedMotoServer
+    import boto3
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port, verbose=False)
+    server.start()
+    os.environ['S3_ENDPOINT_URL'] = f'http://127.0.0.1:{port}'
+    boto3.client('s3', endpoint_url=os.environ['S3_ENDPOINT_URL'], region_name='us-east-1').create_bucket(Bucket='files')
+    return server
+
+def load_function(name: str) -> Any:
+    """Модуль backend/<name>/index.py под уникальным именем"""
+    path = ROOT / 'backend' / name / 'index.py'
+    spec = importlib.util.spec_from_file_location(f"bench_{name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def seed_products(url: str, size: int) -> None:
+    """Каталог из size товаров одним INSERT ... SELECT; сводка фасетов пересчитывается триггером"""
+    import psycopg2
+    conn = psycopg2.connect(url)
+    with conn, conn.cursor() as cur:
+        cur.execute('TRUNCATE products RESTART IDENTITY')
+        cur.execute('TRUNCATE product_facets')
+        cur.execute(
+            """INSERT INTO products (sku, name, description, price_text, price_num, category, image_url, is_available, created_at)
+               SELECT 'BENCH-' || g, 'Изделие из берёзы №' || g,
+                      'Размер ' || (10 + g %% 30) || ' см. Ручная работа, натуральный кап и сувель, масло и воск.',
+                      (500 + g %% 30000) || ' ₽', 500 + g %% 30000,
+                      (%s::text[])[1 + g %% 5], 'https://cdn.poehali.dev/files/bench-' || (g %% 50) || '.jpg',
+                      g %% 7 <> 0, now() - g * interval '1 second'
+               FROM generate_series(1, %s) AS g""",
+            (CATEGORIES, size)
+        )
+        cur.execute('ANALYZE products')
+    conn.close()
+
+def seed_content(url: str, size: int) -> datetime:
+    """Ленты из size новостей и size видео, обе опубликованы; возвращает время засева по часам базы"""
+    import psycopg2
+    conn = psycopg2.connect(url)
+    with conn, conn.cursor() as cur:
+        cur.execute('TRUNCATE news, videos, content_deletions RESTART IDENTITY CASCADE')
+        cur.execute('SELECT LOCALTIMESTAMP')
+        seeded_at = cur.fetchone()[0]
+        cur.execute(
+            """INSERT INTO news (title, content, image_url, created_at, updated_at)
+               SELECT 'Новости мастерской №' || g,
+                      repeat('Новая партия изделий из капа и сувеля: вазы, шкатулки и подсвечники ручной работы. ', 6 + g %% 6),
+                      'https://cdn.poehali.dev/files/bench-news-' || (g %% 50) || '.jpg',
+                      %s - g * interval '1 second', %s - g * interval '1 second'
+               FROM generate_series(1, %s) AS g""",
+            (seeded_at, seeded_at, size)
+        )
+        cur.execute(
+            """INSERT INTO videos (title, description, video_url, thumbnail_url, created_at, updated_at)
+               SELECT 'Как делают вазу №' || g, 'Токарная обработка капа, шлифовка и покрытие маслом',
+                      'https://cdn.poehali.dev/files/bench-video-' || (g %% 50) || '.mp4',
+                      'https://cdn.poehali.dev/files/bench-video-' || (g %% 50) || '.jpg',
+                      %s - g * interval '1 second', %s - g * interval '1 second'
+               FROM generate_series(1, %s) AS g""",
+            (seeded_at, seeded_at, size)
+        )
+        cur.execute('ANALYZE news')
+        cur.execute('ANALYZE videos')
+    conn.close()
+    return seeded_at
+
+def sample_image(seed: int = 0) -> str:
+    """JPEG 1600x1200 в base64, как его присылает админка; seed делает файл уникальным"""
+    from PIL import Image
+    image = Image.linear_gradient('L').resize((1600, 1200)).convert('RGB')
+    image.putpixel((0, 0), (seed % 256, seed // 256 % 256, seed // 65536 % 256))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=90)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(share * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_scenario(handler: Callable, next_event: Callable[[], Dict[str, Any]], count: int, warmup: int,
+                 observe: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Последовательные вызовы handler; latency по каждому вызову, RPS по общему времени"""
+    for _ in range(warmup):
+        response = handler(next_event(), None)
+        if observe:
+            observe(response)
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        event = next_event()
+        call_started = time.perf_counter()
+        response = handler(event, None)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+        if response.get('statusCode', 500) >= 400:
+            errors += 1
+        if observe:
+            observe(response)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': count,
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'rps': round(count / elapsed, 1) if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def product_scenarios(size: int, rng: random.Random) -> Dict[str, tuple]:
+    """Сценарии каталога: (next_event, observe)"""
+    cursor = {'value': None}
+
+    def list_event(fields: Optional[str] = None) -> Dict[str, Any]:
+        params = {'limit': '20'}
+        if cursor['value']:
+            params['cursor'] = cursor['value']
+        if fields:
+            params['fields'] = fields
+        return {'httpMethod': 'GET', 'queryStringParameters': params, 'headers': {'Accept-Encoding': 'gzip'}}
+
+    def list_observe(response: Dict[str, Any]) -> None:
+        # Листаем каталог по X-Next-Cursor, в конце возвращаемся к первой странице
+        cursor['value'] = response['headers'].get('X-Next-Cursor')
+
+    def get_event() -> Dict[str, Any]:
+        return {'httpMethod': 'GET', 'queryStringParameters': {'id': str(rng.randint(1, size))}, 'headers': {}}
+
+    def get_many_event() -> Dict[str, Any]:
+        # Корзина или избранное: 20 случайных товаров одним запросом
+        ids = ','.join(str(rng.randint(1, size)) for _ in range(20))
+        return {'httpMethod': 'GET', 'queryStringParameters': {'ids': ids}, 'headers': {}}
+
+    def facets_event() -> Dict[str, Any]:
+        return {'httpMethod': 'GET', 'queryStringParameters': {'facets': 'true'}, 'headers': {}}
+
+    def write_event() -> Dict[str, Any]:
+        price = rng.randint(500, 30000)
+        return {
+            'httpMethod': 'PATCH',
+            'queryStringParameters': {'id': str(rng.randint(1, size))},
+            'headers': {},
+            'body': json.dumps({'price_num': price, 'price_text': f'{price} ₽'})
+        }
+
+    return {
+        'list': (list_event, list_observe),
+        # Карточка сетки: только поля, которые она показывает
+        'list_fields': (lambda: list_event('id,name,price,image'), list_observe),
+        'get': (get_event, None),
+        'get_many': (get_many_event, None),
+        'facets': (facets_event, None),
+        'write': (write_event, None)
+    }
+
+def content_scenarios(size: int, rng: random.Random, seeded_at: datetime) -> Dict[str, tuple]:
+    """Сценарии лент функции content: (next_event, observe)"""
+    cursors = {'news': None, 'videos': None}
+    delta_start = (seeded_at - timedelta(seconds=CONTENT_DELTA_ROWS)).isoformat()
+    delta = {'since': delta_start}
+
+    def list_event(content_type: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        params = {'type': content_type, 'limit': '20', **(extra or {})}
+        if cursors[content_type]:
+            params['cursor'] = cursors[content_type]
+        return {'httpMethod': 'GET', 'queryStringParameters': params, 'headers': {'Accept-Encoding': 'gzip'}}
+
+    def list_observe(content_type: str) -> Callable[[Dict[str, Any]], None]:
+        def observe(response: Dict[str, Any]) -> None:
+            cursors[content_type] = response['headers'].get('X-Next-Cursor')
+        return observe
+
+    def get_event() -> Dict[str, Any]:
+        return {'httpMethod': 'GET', 'queryStringParameters': {'type': 'news', 'id': str(rng.randint(1, size))}, 'headers': {}}
+
+    def delta_event() -> Dict[str, Any]:
+        params = {'type': 'news', 'updated_since': delta['since'], 'limit': '20'}
+        return {'httpMethod': 'GET', 'queryStringParameters': params, 'headers': {'Accept-Encoding': 'gzip'}}
+
+    def delta_observe(response: Dict[str, Any]) -> None:
+        # Клиент догоняет дельту по sync_token, догнав - начинает синхронизацию заново
+        if response.get('isBase64Encoded'):
+            body = gzip.decompress(base64.b64decode(response['body']))
+        else:
+            body = response['body']
+        data = json.loads(body)
+        delta['since'] = data['sync_token'] if data['has_more'] else delta_start
+
+    def write_event() -> Dict[str, Any]:
+        return {
+            'httpMethod': 'PATCH',
+            'queryStringParameters': {'type': 'news', 'id': str(rng.randint(1, size))},
+            'headers': {},
+            'body': json.dumps({'title': f'Новости мастерской, выпуск {rng.randint(1, 10 ** 6)}'})
+        }
+
+    return {
+        'news_list': (lambda: list_event('news'), list_observe('news')),
+        # Лента на главной: заголовок, картинка и анонс вместо полного текста
+        'news_summary': (lambda: list_event('news', {'summary': 'true', 'fields': 'id,title,content,image_url'}), list_observe('news')),
+        'news_get': (get_event, None),
+        'news_delta': (delta_event, delta_observe),
+        'news_write': (write_event, None),
+        'videos_list': (lambda: list_event('videos'), list_observe('videos'))
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results: List[Dict[str, Any]], baseline: Optional[Dict[str, Any]]) -> None:
+    """Таблица результатов; с baseline - изменение p95 и RPS в процентах"""
+    previous = {}
+    if baseline:
+        previous = {(row['scenario'], row['size']): row for row in baseline['results']}
+    header = f"{'scenario':<16} {'size':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9} {'rss MB':>8} {'err':>4}"
+    if previous:
+        header += f" {'p95 Δ':>8} {'rps Δ':>8}"
+    print(header)
+    for row in results:
+        line = (f"{row['scenario']:<16} {row['size']:>7} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+                f" {row['rps']:>9.1f} {row['peak_rss_mb']:>8.1f} {row['errors']:>4}")
+        before = previous.get((row['scenario'], row['size']))
+        if before:
+            p95_change = (row['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0.0
+            rps_change = (row['rps'] / before['rps'] - 1) * 100 if before['rps'] else 0.0
+            line += f" {p95_change:>+7.1f}% {rps_change:>+7.1f}%"
+        print(line)
+
+def main() -> None:
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    rng = random.Random(args.seed)
+
+    # Меряем работу обработчиков: кэш ответов и строки логов отключены
+    os.environ['RESPONSE_CACHE_TTL'] = '0'
+    os.environ['REQUEST_LOG'] = 'false'
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('NO_PROXY', '127.0.0.1,localhost')
+    os.environ.setdefault('no_proxy', os.environ['NO_PROXY'])
+
+    with tempfile.TemporaryDirectory(prefix='bench-pg-') as workdir:
+        url, pg_server = start_postgres(workdir)
+        warnings = apply_migrations(url)
+        for warning in warnings:
+            print(f'warning: {warning}', file=sys.stderr)
+        os.environ['DATABASE_URL'] = with_search_path(url)
+
+        s3_server = start_s3() if 'upload' in scenarios else None
+        products = load_function('products')
+        content = load_function('content') if set(scenarios) & set(CONTENT_SCENARIOS) else None
+        results: List[Dict[str, Any]] = []
+        try:
+            for size in sizes:
+                seed_products(os.environ['DATABASE_URL'], size)
+                available = {name: (products.handler, *scenario) for name, scenario in product_scenarios(size, rng).items()}
+                if content is not None:
+                    seeded_at = seed_content(os.environ['DATABASE_URL'], size)
+                    available.update({name: (content.handler, *scenario) for name, scenario in content_scenarios(size, rng, seeded_at).items()})
+                for name in scenarios:
+                    if name not in available:
+                        continue
+                    handler, next_event, observe = available[name]
+                    stats = run_scenario(handler, next_event, args.requests, args.warmup, observe)
+                    results.append({'scenario': name, 'size': size, **stats})
+                    print(f'{name} size={size}: p95={stats["p95_ms"]} ms, {stats["rps"]} rps', file=sys.stderr)
+
+            if 'upload' in scenarios:
+                upload = load_function('upload-image')
+                # Каждый запрос - новый файл: повтор того же файла отвечает из индекса uploaded_images
+                images = iter([sample_image(seed) for seed in range(args.upload_requests + min(args.warmup, 2))])
+                event = lambda: {'httpMethod': 'POST', 'queryStringParameters': {}, 'headers': {}, 'body': json.dumps({'image': next(images)})}
+                stats = run_scenario(upload.handler, event, args.upload_requests, min(args.warmup, 2))
+                results.append({'scenario': 'upload', 'size': 0, **stats})
+                duplicate = sample_image()
+                event = lambda: {'httpMethod': 'POST', 'queryStringParameters': {}, 'headers': {}, 'body': json.dumps({'image': duplicate})}
+                stats = run_scenario(upload.handler, event, args.upload_requests, min(args.warmup, 2))
+                results.append({'scenario': 'upload_duplicate', 'size': 0, **stats})
+        finally:
+            if s3_server is not None:
+                s3_server.stop()
+            if pg_server is not None:
+                pg_server.cleanup()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'upload_requests': args.upload_requests,
+            'warnings': warnings
+        },
+        'results': results
+    }
+    output = Path(args.output) if args.output else ROOT / 'benchmarks' / 'results' / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8')) if args.baseline else None
+    print_results(results, baseline)
+    print(f'saved {output}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Дельта лент content не теряет изменений длинных транзакций
+updated_at - время начала транзакции записи: запись, которая зафиксировалась позже соседней,
+не должна оказаться позади sync_token, выданного между двумя фиксациями
+
+    python -m pytest benchmarks/test_content_delta.py -q
+
+Нужен pgserver из benchmarks/requirements.txt или BENCH_DATABASE_URL
+"""
+import json
+import os
+import time
+from typing import Any, Dict
+
+import pytest
+
+import run
+
+SYNC_LAG = 1.0
+
+@pytest.fixture(scope='module')
+def content(tmp_path_factory) -> Any:
+    pytest.importorskip('psycopg2')
+    if not os.environ.get('BENCH_DATABASE_URL'):
+        pytest.importorskip('pgserver')
+    url, server = run.start_postgres(str(tmp_path_factory.mktemp('pg')))
+    run.apply_migrations(url)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('DATABASE_URL', run.with_search_path(url))
+        patch.setenv('CONTENT_SYNC_LAG', str(SYNC_LAG))
+        patch.setenv('RESPONSE_CACHE_TTL', '0')
+        patch.setenv('REQUEST_LOG', 'false')
+        module = run.load_function('content')
+        yield module
+        module.get_db_pool().closeall()
+    if server is not None:
+        server.cleanup()
+
+def connect() -> Any:
+    import psycopg2
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def delta(content: Any, since: str) -> Dict[str, Any]:
+    response = content.handler({
+        'httpMethod': 'GET',
+        'queryStringParameters': {'type': 'news', 'updated_since': since},
+        'headers': {}
+    }, None)
+    assert response['statusCode'] == 200, response['body']
+    return json.loads(response['body'])
+
+def test_late_commit_is_not_behind_sync_token(content: Any) -> None:
+    conn = connect()
+    with conn, conn.cursor() as cur:
+        cur.execute('TRUNCATE news, content_deletions RESTART IDENTITY')
+        cur.execute(
+            """INSERT INTO news (title, content, updated_at)
+               SELECT 'Новость ' || g, 'Текст', LOCALTIMESTAMP - interval '1 hour' FROM generate_series(1, 2) AS g"""
+        )
+    conn.close()
+    initial = delta(content, '2000-01-01T00:00:00')
+    assert [item['id'] for item in initial['items']] == [1, 2]
+
+    # Транзакция A начинается раньше B, но фиксируется после неё и после чтения дельты
+    slow, fast = connect(), connect()
+    with slow.cursor() as cur:
+        cur.execute("UPDATE news SET title = 'A', updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+    time.sleep(0.05)
+    with fast, fast.cursor() as cur:
+        cur.execute("UPDATE news SET title = 'B', updated_at = CURRENT_TIMESTAMP WHERE id = 2")
+    between = delta(content, initial['sync_token'])
+    slow.commit()
+    slow.close()
+    fast.close()
+
+    time.sleep(SYNC_LAG + 0.2)
+    after = delta(content, between['sync_token'])
+    seen = {item['id']: item['title'] for item in between['items'] + after['items']}
+    assert seen == {1: 'A', 2: 'B'}
@@ -0,0 +1,68 @@
+"""
+Бюджет холодного старта backend-функций
+Каждая функция импортируется в отдельном процессе под python -X importtime; тест падает,
+если суммарное время импорта index превышает бюджет или на старте грузятся тяжёлые зависимости,
+которые должны импортироваться только на путях, где они нужны
+
+    python -m pytest benchmarks/test_import_time.py -q
+
+IMPORT_TIME_BUDGET_SCALE - множитель бюджетов для медленных машин (например, 2 в CI)
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+BUDGET_SCALE = float(os.environ.get('IMPORT_TIME_BUDGET_SCALE', '1'))
+RUNS = 3
+
+# Бюджет импорта модуля index в миллисекундах, без запуска самого интерпретатора
+IMPORT_BUDGETS_MS = {
+    'products': 45,
+    'content': 40,
+    'upload-image': 35,
+    'reset-products': 30,
+    'video-worker': 30,
+    'catalog-snapshots': 30
+}
+
+# Загружаются при первом обращении к базе, S3 или изображению, а не при импорте
+LAZY_MODULES = ('psycopg2', 'boto3', 'botocore', 'PIL', 'concurrent.futures')
+
+def import_profile(function: str, pycache: Path) -> Dict[str, int]:
+    """Суммарное время импорта каждого модуля в микросекундах по выводу -X importtime"""
+    env = {**os.environ, 'PYTHONPYCACHEPREFIX': str(pycache)}
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import index'],
+        cwd=ROOT / 'backend' / function, env=env, capture_output=True, text=True, check=True
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+@pytest.fixture(scope='module')
+def pycache(tmp_path_factory) -> Path:
+    return tmp_path_factory.mktemp('pycache')
+
+@pytest.mark.parametrize('function', sorted(IMPORT_BUDGETS_MS))
+def test_heavy_dependencies_are_lazy(function: str, pycache: Path) -> None:
+    loaded = import_profile(function, pycache)
+    eager = [module for module in LAZY_MODULES if module in loaded]
+    assert not eager, f'{function} imports {", ".join(eager)} at module load'
+
+@pytest.mark.parametrize('function', sorted(IMPORT_BUDGETS_MS))
+def test_import_time_budget(function: str, pycache: Path) -> None:
+    # Первый запуск компилирует байткод, дальше берём лучший из RUNS замеров
+    import_profile(function, pycache)
+    samples: List[float] = [import_profile(function, pycache)['index'] / 1000 for _ in range(RUNS)]
+    budget = IMPORT_BUDGETS_MS[function] * BUDGET_SCALE
+    assert min(samples) <= budget, f'{function} imports in {min(samples):.1f} ms, budget is {budget:.0f} ms'
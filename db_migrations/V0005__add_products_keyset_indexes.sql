@@ -0,0 +1,7 @@
+-- created_at участвует в курсоре постраничной выдачи и не должен быть NULL
+UPDATE products SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
+
+-- Индексы для keyset-пагинации по (created_at, id) с фильтрами
+CREATE INDEX idx_products_created_id ON products(created_at DESC, id DESC);
+CREATE INDEX idx_products_category_created_id ON products(category, created_at DESC, id DESC);
@@ -0,0 +1,3 @@
+-- Артикул поставщика: естественный ключ для пакетной загрузки каталога
+ALTER TABLE products ADD COLUMN sku VARCHAR(100);
+CREATE UNIQUE INDEX idx_products_sku ON products(sku);
@@ -0,0 +1,24 @@
+-- Полнотекстовый поиск с русской морфологией и нечёткий поиск по триграммам
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE products ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(category, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+) STORED;
+CREATE INDEX idx_products_search ON products USING GIN (search_vector);
+CREATE INDEX idx_products_name_trgm ON products USING GIN (name gin_trgm_ops);
+
+ALTER TABLE news ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(content, '')), 'B')
+) STORED;
+CREATE INDEX idx_news_search ON news USING GIN (search_vector);
+CREATE INDEX idx_news_title_trgm ON news USING GIN (title gin_trgm_ops);
+
+ALTER TABLE videos ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+) STORED;
+CREATE INDEX idx_videos_search ON videos USING GIN (search_vector);
+CREATE INDEX idx_videos_title_trgm ON videos USING GIN (title gin_trgm_ops);
@@ -0,0 +1,73 @@
+-- Сводка для фасетов каталога: число товаров по категории, ценовому диапазону и наличию.
+-- Обновляется триггерами на каждую запись в products, поэтому фасеты не сканируют весь каталог.
+
+-- Нижняя граница ценового диапазона для price_num
+CREATE FUNCTION product_price_bucket(price INTEGER) RETURNS INTEGER AS $$
+    SELECT (ARRAY[0, 1000, 2500, 5000, 10000, 20000])[width_bucket(price, ARRAY[1000, 2500, 5000, 10000, 20000]) + 1]
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE product_facets (
+    category VARCHAR(100) NOT NULL,
+    price_bucket INTEGER NOT NULL,
+    is_available BOOLEAN NOT NULL,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (category, price_bucket, is_available)
+);
+
+INSERT INTO product_facets (category, price_bucket, is_available, product_count)
+SELECT category, product_price_bucket(price_num), coalesce(is_available, true), count(*)
+FROM products
+GROUP BY 1, 2, 3;
+
+-- Триггеры уровня оператора: пакетная загрузка и сброс каталога дают одно обновление сводки на оператор.
+-- Строки с нулевой разницей (например, поменялось только название) не трогаются.
+CREATE FUNCTION product_facets_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO product_facets AS f (category, price_bucket, is_available, product_count)
+        SELECT category, product_price_bucket(price_num), coalesce(is_available, true), count(*)
+        FROM new_rows
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (category, price_bucket, is_available)
+        DO UPDATE SET product_count = f.product_count + EXCLUDED.product_count, updated_at = CURRENT_TIMESTAMP;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO product_facets AS f (category, price_bucket, is_available, product_count)
+        SELECT category, product_price_bucket(price_num), coalesce(is_available, true), -count(*)
+        FROM old_rows
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+        ON CONFLICT (category, price_bucket, is_available)
+        DO UPDATE SET product_count = f.product_count + EXCLUDED.product_count, updated_at = CURRENT_TIMESTAMP;
+    ELSE
+        INSERT INTO product_facets AS f (category, price_bucket, is_available, product_count)
+        SELECT category, price_bucket, is_available, sum(delta)
+        FROM (
+            SELECT category, product_price_bucket(price_num) AS price_bucket, coalesce(is_available, true) AS is_available, -1 AS delta
+            FROM old_rows
+            UNION ALL
+            SELECT category, product_price_bucket(price_num), coalesce(is_available, true), 1
+            FROM new_rows
+        ) changes
+        GROUP BY 1, 2, 3
+        HAVING sum(delta) <> 0
+        ORDER BY 1, 2, 3
+        ON CONFLICT (category, price_bucket, is_available)
+        DO UPDATE SET product_count = f.product_count + EXCLUDED.product_count, updated_at = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER products_facets_insert AFTER INSERT ON products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_facets_apply();
+
+CREATE TRIGGER products_facets_update AFTER UPDATE ON products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_facets_apply();
+
+CREATE TRIGGER products_facets_delete AFTER DELETE ON products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION product_facets_apply();
@@ -0,0 +1,25 @@
+-- Фоновая обработка загруженных видео: POST /videos ставит задачу и сразу отвечает,
+-- функция video-worker забирает задачи через FOR UPDATE SKIP LOCKED и публикует видео
+ALTER TABLE videos ADD COLUMN status VARCHAR(20) NOT NULL DEFAULT 'ready';
+ALTER TABLE videos ADD COLUMN duration_seconds NUMERIC(10, 3);
+ALTER TABLE videos ADD COLUMN width INTEGER;
+ALTER TABLE videos ADD COLUMN height INTEGER;
+
+-- status: pending - ждёт воркера, running - взята до locked_until, done, failed
+CREATE TABLE video_jobs (
+    id SERIAL PRIMARY KEY,
+    video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+    source_key VARCHAR(1000) NOT NULL,
+    thumbnail_key VARCHAR(1000),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    run_after TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    locked_until TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Очередь: ожидающие задачи и задачи с истёкшей арендой (воркер упал посреди обработки)
+CREATE INDEX idx_video_jobs_queue ON video_jobs(run_after, id) WHERE status IN ('pending', 'running');
+CREATE INDEX idx_video_jobs_video ON video_jobs(video_id);
@@ -0,0 +1,2 @@
+-- Адаптивное воспроизведение: master-плейлист HLS, который video-worker кладёт в videos/<id>/hls/
+ALTER TABLE videos ADD COLUMN hls_url VARCHAR(1000);
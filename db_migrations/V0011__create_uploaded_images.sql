@@ -0,0 +1,9 @@
+-- Индекс загруженных изображений по SHA-256 исходного файла: варианты лежат в products/<sha256>/,
+-- повторная загрузка того же файла возвращает сохранённый манифест без нарезки и записи в бакет
+CREATE TABLE uploaded_images (
+    sha256 CHAR(64) PRIMARY KEY,
+    url VARCHAR(1000) NOT NULL,
+    manifest JSONB NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
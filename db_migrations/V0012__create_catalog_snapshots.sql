@@ -0,0 +1,11 @@
+-- Указатели на снимки публичных списков (products, news, videos) в бакете:
+-- после каждой записи функции выкладывают catalog/<name>.<хэш>.json и манифест catalog/manifest.json,
+-- витрина читает списки с CDN без вызова функций и запросов к базе
+CREATE TABLE catalog_snapshots (
+    name VARCHAR(50) PRIMARY KEY,
+    snapshot_key VARCHAR(1000) NOT NULL,
+    previous_key VARCHAR(1000),
+    item_count INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    published_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,13 @@
+-- Дельта-синхронизация лент новостей и видео (GET ?updated_since=): изменённые записи
+-- выбираются по (updated_at, id), удалённые - из надгробий content_deletions
+CREATE INDEX idx_news_updated ON news(updated_at, id);
+CREATE INDEX idx_videos_updated ON videos(updated_at, id);
+
+CREATE TABLE content_deletions (
+    id SERIAL PRIMARY KEY,
+    content_type VARCHAR(20) NOT NULL,
+    item_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_content_deletions_type ON content_deletions(content_type, deleted_at);
@@ -0,0 +1,14 @@
+-- Снимки выкладывает video-worker, а не запрос записи: запись только ставит stale_since,
+-- воркер публикует список, когда метка старше SNAPSHOT_DEBOUNCE секунд (серия записей - одна публикация)
+ALTER TABLE catalog_snapshots ADD COLUMN stale_since TIMESTAMP;
+ALTER TABLE catalog_snapshots ALTER COLUMN snapshot_key DROP NOT NULL;
+ALTER TABLE catalog_snapshots ALTER COLUMN item_count DROP NOT NULL;
+ALTER TABLE catalog_snapshots ALTER COLUMN size_bytes DROP NOT NULL;
+ALTER TABLE catalog_snapshots ALTER COLUMN published_at DROP NOT NULL;
+ALTER TABLE catalog_snapshots ALTER COLUMN published_at DROP DEFAULT;
+
+-- Строка на каждый публичный список заведена заранее, запись её только обновляет;
+-- первый проход воркера выложит все три списка
+INSERT INTO catalog_snapshots (name, stale_since)
+VALUES ('products', CURRENT_TIMESTAMP), ('news', CURRENT_TIMESTAMP), ('videos', CURRENT_TIMESTAMP)
+ON CONFLICT (name) DO UPDATE SET stale_since = CURRENT_TIMESTAMP;
@@ -0,0 +1,4 @@
+-- Снимки выкладывает функция catalog-snapshots: объект кладётся в бакет вне транзакции,
+-- затем указатель переключается, а метка снимается, только если stale_version не изменилась
+-- с чтения списка; запись, зафиксированная позже, увеличивает stale_version и оставляет метку
+ALTER TABLE catalog_snapshots ADD COLUMN stale_version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,4 @@
+-- Отпечаток настроек нарезки (IMAGE_VARIANT_SPEC функции upload-image): повторная загрузка файла отвечает
+-- сохранённым манифестом, только если он нарезан по текущим настройкам, иначе файл нарезается заново
+-- в products/<sha256>/<отпечаток>/; записи до этой миграции нарезаются заново при первой повторной загрузке
+ALTER TABLE uploaded_images ADD COLUMN variant_spec VARCHAR(64) NOT NULL DEFAULT '';
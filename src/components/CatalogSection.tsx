@@ -8,6 +8,7 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, Di
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '@/components/ui/select';
 import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
+import { fetchSnapshot } from '@/lib/catalogSnapshot';
 
 const PRODUCTS_API = 'https://functions.poehali.dev/aefdf81d-2d51-454c-a70c-4677389f4c2c';
 const UPLOAD_IMAGE_API = 'https://functions.poehali.dev/4fe14c97-3236-4d72-ad8d-f7255b576bcb';
@@ -91,9 +92,10 @@ export default function CatalogSection() {
         }
       }
       
-      const response = await fetch(PRODUCTS_API);
-      const data = await response.json();
-      console.log('Loaded from API:', data);
+      // Витрина читает снимок с CDN; после правок админа - свежий список из API мимо HTTP-кэша браузера
+      const snapshot = forceRefresh ? null : await fetchSnapshot<Product>('products');
+      const data = snapshot ?? await (await fetch(PRODUCTS_API, forceRefresh ? { cache: 'no-store' } : undefined)).json();
+      console.log(snapshot ? 'Loaded from snapshot:' : 'Loaded from API:', data);
       setProducts(data);
       
       const cacheData: CachedData = {
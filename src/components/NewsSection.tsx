@@ -7,6 +7,7 @@ import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
+import { fetchSnapshot } from '@/lib/catalogSnapshot';
 
 const CONTENT_API = 'https://functions.poehali.dev/42c2d427-da29-47fc-9792-37f0603430e7';
 const NEWS_API = `${CONTENT_API}?type=news`;
@@ -38,10 +39,11 @@ export default function NewsSection() {
     fetchNews();
   }, []);
 
-  const fetchNews = async () => {
+  const fetchNews = async (forceRefresh = false) => {
     try {
-      const response = await fetch(NEWS_API);
-      const data = await response.json();
+      // Витрина читает снимок с CDN; после правок админа - свежий список из API мимо HTTP-кэша браузера
+      const snapshot = forceRefresh ? null : await fetchSnapshot<NewsItem>('news');
+      const data = snapshot ?? await (await fetch(NEWS_API, forceRefresh ? { cache: 'no-store' } : undefined)).json();
       setNews(Array.isArray(data) ? data : []);
     } catch (error) {
       console.error('Ошибка загрузки новостей:', error);
@@ -80,7 +82,7 @@ export default function NewsSection() {
       setFormData({ title: '', content: '', image_url: '' });
       setEditingNews(null);
       setDialogOpen(false);
-      fetchNews();
+      fetchNews(true);
     } catch (error) {
       console.error('Ошибка сохранения:', error);
       toast.error('Не удалось сохранить новость');
@@ -97,7 +99,7 @@ export default function NewsSection() {
       
       if (!response.ok) throw new Error('Ошибка удаления');
       toast.success('Новость удалена');
-      fetchNews();
+      fetchNews(true);
     } catch (error) {
       console.error('Ошибка удаления:', error);
       toast.error('Не удалось удалить новость');
@@ -7,6 +7,7 @@ import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
+import { fetchSnapshot } from '@/lib/catalogSnapshot';
 
 const CONTENT_API = 'https://functions.poehali.dev/42c2d427-da29-47fc-9792-37f0603430e7';
 const VIDEO_API = `${CONTENT_API}?type=videos`;
@@ -20,6 +21,8 @@ interface VideoItem {
   created_at: string;
   updated_at: string;
   is_published: boolean;
+  status?: 'processing' | 'ready' | 'failed';
+  hls_url?: string | null;
 }
 
 export default function VideoSection() {
@@ -40,10 +43,11 @@ export default function VideoSection() {
     fetchVideos();
   }, []);
 
-  const fetchVideos = async () => {
+  const fetchVideos = async (forceRefresh = false) => {
     try {
-      const response = await fetch(VIDEO_API);
-      const data = await response.json();
+      // Витрина читает снимок с CDN; после правок админа - свежий список из API мимо HTTP-кэша браузера
+      const snapshot = forceRefresh ? null : await fetchSnapshot<VideoItem>('videos');
+      const data = snapshot ?? await (await fetch(VIDEO_API, forceRefresh ? { cache: 'no-store' } : undefined)).json();
       setVideos(Array.isArray(data) ? data : []);
     } catch (error) {
       console.error('Ошибка загрузки видео:', error);
@@ -103,12 +107,17 @@ export default function VideoSection() {
         throw new Error(`Ошибка ${response.status}: ${errorData.error || 'Неизвестная ошибка'}`);
       }
       
-      toast.success('Видео загружено');
+      const created = await response.json().catch(() => ({}));
+      toast.success(
+        created.status === 'processing'
+          ? 'Видео загружено и обрабатывается, оно появится в галерее через пару минут'
+          : 'Видео загружено'
+      );
       setFormData({ title: '', description: '' });
       setVideoFile(null);
       setThumbnailFile(null);
       setDialogOpen(false);
-      fetchVideos();
+      fetchVideos(true);
     } catch (error) {
       console.error('Ошибка загрузки:', error);
       const errorMessage = error instanceof Error ? error.message : 'Не удалось загрузить видео';
@@ -128,7 +137,7 @@ export default function VideoSection() {
       
       if (!response.ok) throw new Error('Ошибка удаления');
       toast.success('Видео удалено');
-      fetchVideos();
+      fetchVideos(true);
     } catch (error) {
       console.error('Ошибка удаления:', error);
       toast.error('Не удалось удалить видео');
@@ -245,11 +254,13 @@ export default function VideoSection() {
             <Card key={item.id} className="overflow-hidden hover:shadow-lg transition-shadow">
               <div className="aspect-video bg-black">
                 <video
-                  src={item.video_url}
                   poster={item.thumbnail_url}
                   controls
+                  preload="metadata"
                   className="w-full h-full"
                 >
+                  {item.hls_url && <source src={item.hls_url} type="application/vnd.apple.mpegurl" />}
+                  <source src={item.video_url} type="video/mp4" />
                   Ваш браузер не поддерживает видео.
                 </video>
               </div>
@@ -39,9 +39,10 @@ export default function VideosSection() {
     fetchVideos();
   }, []);
 
-  const fetchVideos = async () => {
+  const fetchVideos = async (forceRefresh = false) => {
     try {
-      const response = await fetch(VIDEOS_API);
+      // После правок админа - мимо HTTP-кэша браузера
+      const response = await fetch(VIDEOS_API, forceRefresh ? { cache: 'no-store' } : undefined);
       const data = await response.json();
       setVideos(data);
     } catch (error) {
@@ -81,7 +82,7 @@ export default function VideosSection() {
       setFormData({ title: '', description: '', video_url: '', thumbnail_url: '' });
       setEditingVideo(null);
       setDialogOpen(false);
-      fetchVideos();
+      fetchVideos(true);
     } catch (error) {
       console.error('Ошибка сохранения:', error);
       toast.error('Не удалось сохранить видео');
@@ -98,7 +99,7 @@ export default function VideosSection() {
       
       if (!response.ok) throw new Error('Ошибка удаления');
       toast.success('Видео удалено');
-      fetchVideos();
+      fetchVideos(true);
     } catch (error) {
       console.error('Ошибка удаления:', error);
       toast.error('Не удалось удалить видео');
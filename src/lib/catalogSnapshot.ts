@@ -0,0 +1,40 @@
+// Манифест снимков публичных списков на CDN (catalog/manifest.json в бакете).
+// Без VITE_CATALOG_MANIFEST_URL витрина читает списки напрямую из функций.
+const CATALOG_MANIFEST_URL: string | undefined = import.meta.env.VITE_CATALOG_MANIFEST_URL;
+
+export type SnapshotName = 'products' | 'news' | 'videos';
+
+interface SnapshotEntry {
+  url: string;
+  count: number;
+  published_at: string;
+}
+
+type SnapshotManifest = Partial<Record<SnapshotName, SnapshotEntry>>;
+
+// Список из последнего снимка или null, если снимков нет или CDN недоступен
+export async function fetchSnapshot<T>(name: SnapshotName): Promise<T[] | null> {
+  if (!CATALOG_MANIFEST_URL) {
+    return null;
+  }
+  try {
+    const manifestResponse = await fetch(CATALOG_MANIFEST_URL);
+    if (!manifestResponse.ok) {
+      return null;
+    }
+    const manifest: SnapshotManifest = await manifestResponse.json();
+    const entry = manifest[name];
+    if (!entry) {
+      return null;
+    }
+    const response = await fetch(entry.url);
+    if (!response.ok) {
+      return null;
+    }
+    const data = await response.json();
+    return Array.isArray(data) ? data : null;
+  } catch (error) {
+    console.warn(`Снимок ${name} недоступен, читаем из API:`, error);
+    return null;
+  }
+}